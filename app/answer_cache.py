@@ -0,0 +1,152 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.config import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_CHATS, ANSWER_CACHE_MAX_ENTRIES
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_PUNCTUATION = re.compile(r"[^\w\s.]|\.(?!\d)")
+
+
+def normalize_question(question):
+    return " ".join(_PUNCTUATION.sub(" ", question.lower()).split())
+
+
+class _ChatAnswers:
+    def __init__(self, version, dim):
+        self.version = version
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.entries = []
+        self.by_question = {}
+
+
+class SemanticAnswerCache:
+    """Answers already given in a chat, found again by question embedding.
+
+    Each chat keeps up to max_entries question vectors (normalized, so a dot
+    product is the cosine) and scans them on lookup; at this size a flat
+    scan is faster than any ANN structure. A stored answer is reused when
+    the new question's cosine reaches threshold, the numbers in both
+    questions are the same ("in 50 words" vs "in 100 words"), it came from
+    the same LLM backend and the chat's index is still the version the
+    answer was produced from. Chats are evicted least recently used first.
+    """
+
+    def __init__(self, threshold, max_chats, max_entries):
+        self.threshold = threshold
+        self.max_chats = max_chats
+        self.max_entries = max_entries
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, user_id, chat_id, version, question, vector, backend=None):
+        key = (str(user_id), str(chat_id))
+        text = normalize_question(question)
+        numbers = _NUMBER.findall(text)
+
+        with self._lock:
+            chat = self._chats.get(key)
+            if chat is not None and chat.version != version:
+                # the chat got new PDFs since these answers were made
+                del self._chats[key]
+                self.invalidations += 1
+                chat = None
+            if chat is None:
+                self.misses += 1
+                return None
+            self._chats.move_to_end(key)
+
+            pos = chat.by_question.get((backend, text))
+            if pos is not None:
+                self.exact_hits += 1
+                return self._use(chat.entries[pos])
+
+            if len(chat.entries):
+                scores = chat.vectors @ np.asarray(vector, dtype=np.float32)
+                for pos in np.argsort(-scores):
+                    if scores[pos] < self.threshold:
+                        break
+                    entry = chat.entries[pos]
+                    if entry["numbers"] == numbers and entry["backend"] == backend:
+                        self.semantic_hits += 1
+                        print(f"♻️ Reusing answer to '{entry['question'][:60]}' (cosine {scores[pos]:.3f})")
+                        return self._use(entry)
+
+            self.misses += 1
+            return None
+
+    def store(self, user_id, chat_id, version, question, vector, answer, filtered_docs, best_docs, backend=None):
+        key = (str(user_id), str(chat_id))
+        text = normalize_question(question)
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        entry = {
+            "question": text,
+            "numbers": _NUMBER.findall(text),
+            "backend": backend,
+            "answer": answer,
+            "filtered_docs": filtered_docs,
+            "best_docs": best_docs,
+            "last_used": time.monotonic()
+        }
+
+        with self._lock:
+            chat = self._chats.get(key)
+            if chat is None or chat.version != version:
+                chat = self._chats[key] = _ChatAnswers(version, vector.shape[1])
+            self._chats.move_to_end(key)
+
+            pos = chat.by_question.get((backend, text))
+            if pos is None and len(chat.entries) >= self.max_entries:
+                pos = min(range(len(chat.entries)), key=lambda i: chat.entries[i]["last_used"])
+                evicted = chat.entries[pos]
+                del chat.by_question[(evicted["backend"], evicted["question"])]
+
+            if pos is None:
+                chat.entries.append(entry)
+                chat.vectors = np.vstack([chat.vectors, vector])
+                pos = len(chat.entries) - 1
+            else:
+                chat.entries[pos] = entry
+                chat.vectors[pos] = vector[0]
+            chat.by_question[(backend, text)] = pos
+
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+
+    def drop(self, user_id, chat_id=None):
+        with self._lock:
+            if chat_id is not None:
+                self._chats.pop((str(user_id), str(chat_id)), None)
+                return
+            for key in [k for k in self._chats if k[0] == str(user_id)]:
+                del self._chats[key]
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "chats": len(self._chats),
+                "entries": sum(len(c.entries) for c in self._chats.values()),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "threshold": self.threshold
+            }
+
+    @staticmethod
+    def _use(entry):
+        entry["last_used"] = time.monotonic()
+        return entry
+
+
+answer_cache = SemanticAnswerCache(ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_CHATS, ANSWER_CACHE_MAX_ENTRIES)
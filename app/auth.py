@@ -1,10 +1,35 @@
+import hmac
+
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.database import supabase_anon
+from app.config import SUPABASE_JWT_SECRET, SUPABASE_JWKS_URL, JWKS_TTL_SECONDS, AUTH_CACHE_SIZE, METRICS_TOKEN
+from app.jwt_verifier import TokenVerifier, TokenRejected, JWKSCache
 from supabase_auth.errors import AuthApiError
 
 bearer_scheme = HTTPBearer(auto_error=False)
 
+def verify_with_supabase(token):
+    """Network check with Supabase Auth, for tokens we have no local key for"""
+    try:
+        res = supabase_anon.auth.get_user(token)
+    except AuthApiError as e:
+        # only a definite "no" from Auth is remembered, not e.g. a rate limit
+        definite = getattr(e, "status", None) in (401, 403)
+        raise TokenRejected(str(e), expired=True, cacheable=definite)
+
+    if not res or res.user is None:
+        raise TokenRejected("Invalid token")
+
+    return {"id": res.user.id, "email": res.user.email}
+
+token_verifier = TokenVerifier(
+    secret=SUPABASE_JWT_SECRET,
+    jwks=JWKSCache(SUPABASE_JWKS_URL, JWKS_TTL_SECONDS, min_refresh_seconds=30) if SUPABASE_JWKS_URL else None,
+    remote_verify=verify_with_supabase,
+    cache_size=AUTH_CACHE_SIZE
+)
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)
 ):
@@ -15,18 +40,27 @@ def get_current_user(
     token = credentials.credentials
 
     try:
-        res = supabase_anon.auth.get_user(token)
-    except AuthApiError:
-        raise HTTPException(
-            status_code=401,
-            detail="Session expired. Please login again."
-        )
-
-    if not res or res.user is None:
+        claims = token_verifier.verify(token)
+    except TokenRejected as e:
+        if e.expired:
+            raise HTTPException(
+                status_code=401,
+                detail="Session expired. Please login again."
+            )
         raise HTTPException(status_code=401, detail="Invalid token")
 
     return {
-        "id": res.user.id,
-        "email": res.user.email,
+        "id": claims["sub"],
+        "email": claims.get("email"),
         "access_token": token
-    }
\ No newline at end of file
+    }
+
+def require_metrics_token(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)
+):
+    """Operator access to /metrics with METRICS_TOKEN; user sessions don't count"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    if credentials is None or not hmac.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
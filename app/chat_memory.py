@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict, deque
+
+from app.config import CHAT_MEMORY_MAX_CHATS, CHAT_MEMORY_MESSAGES
+
+
+class ChatMemoryStore:
+    """The last few messages of recently active chats, kept in process.
+
+    A chat is loaded once (the newest max_messages rows) and then updated as
+    messages are written, so building the conversation memory for a question
+    costs the same on the 5th and the 500th message. Chats are evicted least
+    recently used first.
+
+    It also remembers which chats a user's own (RLS-scoped) select has
+    shown they can read, so journaled messages are only written to and
+    read back from chats the user owns without a lookup per question.
+    """
+
+    def __init__(self, max_chats, max_messages):
+        self.max_chats = max_chats
+        self.max_messages = max_messages
+        self._chats = OrderedDict()
+        self._readable = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id, chat_id):
+        key = (str(user_id), str(chat_id))
+        with self._lock:
+            messages = self._chats.get(key)
+            if messages is None:
+                self.misses += 1
+                return None
+            self._chats.move_to_end(key)
+            self.hits += 1
+            return list(messages)
+
+    def load(self, user_id, chat_id, messages):
+        key = (str(user_id), str(chat_id))
+        with self._lock:
+            self._chats[key] = deque(
+                ({"role": m.get("role"), "content": m.get("content", ""), "created_at": m.get("created_at")}
+                 for m in messages),
+                maxlen=self.max_messages
+            )
+            self._chats.move_to_end(key)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+                self.evictions += 1
+
+    def append(self, user_id, chat_id, message):
+        """Record a new message; chats that aren't loaded pick it up on their next load"""
+        key = (str(user_id), str(chat_id))
+        with self._lock:
+            messages = self._chats.get(key)
+            if messages is not None:
+                messages.append({
+                    "role": message.get("role"),
+                    "content": message.get("content", ""),
+                    "created_at": message.get("created_at")
+                })
+
+    def mark_readable(self, user_id, chat_id):
+        key = (str(user_id), str(chat_id))
+        with self._lock:
+            self._readable[key] = True
+            self._readable.move_to_end(key)
+            while len(self._readable) > self.max_chats:
+                self._readable.popitem(last=False)
+
+    def is_readable(self, user_id, chat_id):
+        with self._lock:
+            return (str(user_id), str(chat_id)) in self._readable
+
+    def drop(self, user_id, chat_id=None):
+        with self._lock:
+            if chat_id is not None:
+                self._chats.pop((str(user_id), str(chat_id)), None)
+                self._readable.pop((str(user_id), str(chat_id)), None)
+                return
+            for key in [k for k in self._chats if k[0] == str(user_id)]:
+                del self._chats[key]
+            for key in [k for k in self._readable if k[0] == str(user_id)]:
+                del self._readable[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "chats": len(self._chats),
+                "max_chats": self.max_chats,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+
+chat_memory = ChatMemoryStore(CHAT_MEMORY_MAX_CHATS, CHAT_MEMORY_MESSAGES)
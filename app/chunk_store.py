@@ -0,0 +1,175 @@
+import os
+import json
+from collections.abc import MutableMapping
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+# A chat snapshot keeps its chunks in these files instead of index.pkl:
+#   chunks.bin            UTF-8 texts back to back
+#   chunks.offsets.npy    int64 start of every text in chunks.bin (n + 1 entries)
+#   chunks.json           row count and the metadata column layout
+#   chunks.col<i>.npy     one array per metadata key, row = FAISS position
+# Everything is memory-mapped, so opening a snapshot reads two small files
+# and a search only touches the pages of the chunks it returns.
+CHUNKS_FILE = "chunks.json"
+TEXT_FILE = "chunks.bin"
+OFFSETS_FILE = "chunks.offsets.npy"
+FORMAT_VERSION = 1
+
+
+def iter_documents(vectorstore):
+    """Documents of a FAISS vectorstore in FAISS position order, whatever its docstore"""
+    ids = vectorstore.index_to_docstore_id
+    for position in range(len(ids)):
+        doc = vectorstore.docstore.search(ids[position])
+        if isinstance(doc, Document):
+            yield doc
+
+
+def _column_file(i):
+    return f"chunks.col{i}.npy"
+
+
+class ChunkIds(MutableMapping):
+    """index_to_docstore_id for a ChunkStore: stored rows are their own position,
+    chunks added after loading keep the ids FAISS gave them."""
+
+    def __init__(self, base_count):
+        self.base_count = base_count
+        self._added = {}
+
+    def __getitem__(self, position):
+        position = int(position)
+        if 0 <= position < self.base_count:
+            return str(position)
+        return self._added[position]
+
+    def __setitem__(self, position, doc_id):
+        position = int(position)
+        if position < self.base_count:
+            raise KeyError(f"Position {position} is a stored chunk")
+        self._added[position] = doc_id
+
+    def __delitem__(self, position):
+        del self._added[int(position)]
+
+    def __iter__(self):
+        yield from range(self.base_count)
+        yield from self._added
+
+    def __len__(self):
+        return self.base_count + len(self._added)
+
+
+class ChunkStore(Docstore, AddableMixin):
+    """Read-only, memory-mapped chunk texts and metadata of a saved snapshot.
+
+    Chunks added after opening (by add_embeddings) are held in memory until
+    the next save writes a new snapshot.
+    """
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, CHUNKS_FILE), encoding="utf-8") as f:
+            layout = json.load(f)
+        if layout.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported chunk store version {layout.get('version')}")
+
+        self.folder = folder
+        self.count = layout["count"]
+        self._offsets = np.load(os.path.join(folder, OFFSETS_FILE), mmap_mode="r")
+        text_path = os.path.join(folder, TEXT_FILE)
+        # np.memmap can't map an empty file
+        self._text = np.memmap(text_path, dtype=np.uint8, mode="r") if os.path.getsize(text_path) else b""
+        self._columns = [
+            (column["key"], column["type"], column.get("values"), np.load(os.path.join(folder, _column_file(i)), mmap_mode="r"))
+            for i, column in enumerate(layout["columns"])
+        ]
+        self._added = {}
+        self.ids = ChunkIds(self.count)
+
+    def get(self, position):
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        text = bytes(self._text[start:end]).decode("utf-8")
+
+        metadata = {}
+        for key, kind, values, data in self._columns:
+            value = int(data[position])
+            if kind == "int":
+                metadata[key] = value
+            elif value >= 0:
+                metadata[key] = values[value]
+        return Document(id=str(position), page_content=text, metadata=metadata)
+
+    def search(self, search):
+        doc = self._added.get(search)
+        if doc is not None:
+            return doc
+        try:
+            position = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= position < self.count:
+            return f"ID {search} not found."
+        return self.get(position)
+
+    def add(self, texts):
+        overlapping = set(texts).intersection(self._added)
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids):
+        for _id in ids:
+            if _id not in self._added:
+                raise ValueError(f"Stored chunk {_id} can't be deleted, only chunks added since loading")
+            del self._added[_id]
+
+    def added_documents(self):
+        return self._added.values()
+
+    @staticmethod
+    def write(folder, documents):
+        """Write documents (in FAISS position order) as a chunk store into folder"""
+        os.makedirs(folder, exist_ok=True)
+        offsets = [0]
+        rows = []
+        with open(os.path.join(folder, TEXT_FILE), "wb") as f:
+            for doc in documents:
+                data = doc.page_content.encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+                rows.append(doc.metadata or {})
+
+        np.save(os.path.join(folder, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+
+        keys = []
+        for row in rows:
+            for key in row:
+                if key not in keys:
+                    keys.append(key)
+
+        columns = []
+        for i, key in enumerate(keys):
+            values = [row.get(key) for row in rows]
+            if all(type(v) is int and -2**63 <= v < 2**63 for v in values):
+                columns.append({"key": key, "type": "int"})
+                data = np.asarray(values, dtype=np.int64)
+                if len(data) == 0 or (data.min() >= -2**31 and data.max() < 2**31):
+                    data = data.astype(np.int32)
+            else:
+                # strings (like the source file name) and anything else, dictionary-encoded;
+                # -1 means the row doesn't have the key
+                distinct = {}
+                codes = np.full(len(values), -1, dtype=np.int32)
+                for row_no, (row, value) in enumerate(zip(rows, values)):
+                    if key in row:
+                        marker = json.dumps(value, sort_keys=True, default=str)
+                        codes[row_no] = distinct.setdefault(marker, (len(distinct), value))[0]
+                columns.append({"key": key, "type": "category", "values": [v for _, v in distinct.values()]})
+                data = codes
+            np.save(os.path.join(folder, _column_file(i)), data)
+
+        with open(os.path.join(folder, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "count": len(rows), "columns": columns}, f, default=str)
@@ -4,9 +4,50 @@ from dotenv import load_dotenv
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "openai/gpt-oss-120b")
+# LLM gateway: concurrent upstream calls, retries (429/5xx/network, jittered
+# exponential backoff) and how long a request may wait for Groq rate limits
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+LLM_MAX_RATE_LIMIT_WAIT = float(os.getenv("LLM_MAX_RATE_LIMIT_WAIT", "30"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# which backend answers by default: "groq", "local" (an OpenAI-compatible server
+# on this host, e.g. llama.cpp's llama-server) or "llamacpp" (a GGUF model loaded
+# in process); a request may pick another configured one with "backend"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")
+# local backends run small models on CPU: a smaller window, shorter answers,
+# and few parallel generations
+LOCAL_LLM_BASE_URL = os.getenv("LOCAL_LLM_BASE_URL", "")
+LOCAL_LLM_API_KEY = os.getenv("LOCAL_LLM_API_KEY", "")
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "local")
+LOCAL_LLM_CONTEXT_WINDOW = int(os.getenv("LOCAL_LLM_CONTEXT_WINDOW", "8192"))
+LOCAL_LLM_MAX_TOKENS = int(os.getenv("LOCAL_LLM_MAX_TOKENS", "1024"))
+LOCAL_LLM_MAX_CONCURRENCY = int(os.getenv("LOCAL_LLM_MAX_CONCURRENCY", "2"))
+# in-process llama.cpp (pip install llama-cpp-python); 0 threads = all cores.
+# The KV state of the system prompt is kept in a RAM cache of this size
+LLAMA_CPP_MODEL_PATH = os.getenv("LLAMA_CPP_MODEL_PATH", "")
+LLAMA_CPP_THREADS = int(os.getenv("LLAMA_CPP_THREADS", "0"))
+LLAMA_CPP_PREFIX_CACHE_MB = int(os.getenv("LLAMA_CPP_PREFIX_CACHE_MB", "512"))
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY=os.getenv("SUPABASE_ANON_KEY")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+# /metrics shows counters across all users; it needs this bearer token and
+# is disabled when it isn't set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# shared async HTTP pool used for PostgREST calls from request handlers
+SUPABASE_HTTP_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "20"))
+SUPABASE_HTTP_TIMEOUT = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "10"))
+# local access-token verification: HS256 projects need the JWT secret,
+# projects with asymmetric signing keys are verified from JWKS
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
+    f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+JWKS_TTL_SECONDS = int(os.getenv("JWKS_TTL_SECONDS", "600"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -23,10 +64,110 @@ TEMPERATURE = 0
 SIMILARITY_THRESHOLD = 0.7
 TOP_K = 5
 MAX_TOKENS = 3000
-MAX_CONTEXT_CHARS = 20000
 MAX_PAGES = 500
 MAX_FILE_SIZE_MB = 50
 MIN_PAGES = 1
+# 0 = one extraction process per CPU core
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+FAISS_CACHE_MAX_MB = int(os.getenv("FAISS_CACHE_MAX_MB", "512"))
+FAISS_CACHE_IDLE_SECONDS = int(os.getenv("FAISS_CACHE_IDLE_SECONDS", "1800"))
+# chats with at least this many vectors are rebuilt in the background from
+# a flat (exact) index into "hnsw" or "ivf"; see benchmarks/bench_faiss_index.py.
+# At 20k vectors IVF with nprobe 16 searches in ~0.2 ms (recall@15 ~0.96-0.98)
+# and builds in ~5 s; HNSW needs ef 256 for that recall at ~1.5-1.8 ms and
+# takes ~20 s to build (~60 s at 50k)
+FAISS_PROMOTE_MIN_VECTORS = int(os.getenv("FAISS_PROMOTE_MIN_VECTORS", "20000"))
+FAISS_PROMOTED_INDEX = os.getenv("FAISS_PROMOTED_INDEX", "ivf")
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "256"))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+# how vectors of a chat are kept: "float32" (exact), "sq8" or "pq" (compressed
+# in RAM; with FAISS_EXACT_RERANK the exact vectors stay memory-mapped from
+# disk for re-ranking, so they take more disk than float32, not less; "pq"
+# needs PQ_MIN_VECTORS). New chats
+# use the default; change a chat with PUT /chats/{chat_id}/index-storage or
+# python -m app.migrate_index_storage
+FAISS_DEFAULT_STORAGE = os.getenv("FAISS_DEFAULT_STORAGE", "float32")
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "96"))
+# sq8/pq chats keep float32 vectors on disk to re-rank candidates exactly;
+# "0" drops them (a chat can also be switched with PUT index-storage), so
+# the snapshot is only the codes and results are ranked by compressed distance
+FAISS_EXACT_RERANK = os.getenv("FAISS_EXACT_RERANK", "1") != "0"
+# candidates re-ranked exactly per result; PQ codes are coarser than SQ8 so they need more
+FAISS_RERANK_FACTOR = int(os.getenv("FAISS_RERANK_FACTOR", "4"))
+FAISS_PQ_RERANK_FACTOR = int(os.getenv("FAISS_PQ_RERANK_FACTOR", "10"))
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_CACHE_PATH = os.path.join(BASE_DIR, "data", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024"))
+# question text -> query vector, in memory
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "5000"))
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_QUEUE_SIZE = int(os.getenv("EMBEDDING_QUEUE_SIZE", "32"))
+# one model call already uses several cores through torch's intra-op threads,
+# so a couple of workers is enough: one embeds while the other tokenizes.
+# 0 torch threads = the cores split evenly between the workers
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
+EMBEDDING_TORCH_THREADS = int(os.getenv("EMBEDDING_TORCH_THREADS", "0"))
+
+# PDFs parsed and indexed at the same time; extraction and embedding have their own pools
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+
+# chat messages are acknowledged from this local journal and written to
+# Supabase in batches by a background flusher
+MESSAGE_JOURNAL_PATH = os.path.join(BASE_DIR, "data", "message_journal.sqlite3")
+MESSAGE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_FLUSH_INTERVAL", "0.5"))
+MESSAGE_FLUSH_BATCH = int(os.getenv("MESSAGE_FLUSH_BATCH", "100"))
+MESSAGE_FLUSH_MAX_ATTEMPTS = int(os.getenv("MESSAGE_FLUSH_MAX_ATTEMPTS", "10"))
+
+# recent messages per chat kept in process for the conversation memory;
+# build_memory() keeps 20 exchanges, i.e. 40 messages
+CHAT_MEMORY_MAX_CHATS = int(os.getenv("CHAT_MEMORY_MAX_CHATS", "1000"))
+CHAT_MEMORY_MESSAGES = int(os.getenv("CHAT_MEMORY_MESSAGES", "40"))
+
+# answers reused for paraphrased questions in the same chat (cosine of the
+# question embeddings), until the chat's index changes
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_CHATS = int(os.getenv("ANSWER_CACHE_MAX_CHATS", "500"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "64"))
+
+# optional cross-encoder pass over the retrieved chunks, e.g.
+# cross-encoder/ms-marco-MiniLM-L-6-v2; empty = off. The best RERANK_TOP_N
+# chunks go to the LLM; see benchmarks/eval_retrieval.py
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "4"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_TIME_BUDGET_MS = int(os.getenv("RERANK_TIME_BUDGET_MS", "300"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+
+# retrieved chunks whose embeddings are closer than this (cosine) count as
+# one. Only near-copies (the same text chunked twice, repeated boilerplate)
+# should go: related chunks on one topic sit lower and are left to MMR.
+# Check a lower value with benchmarks/eval_retrieval.py --dedup-thresholds first.
+# The chunks sent to the LLM are picked by MMR (1 = rank only, 0 = diversity only)
+RETRIEVAL_DUPLICATE_THRESHOLD = float(os.getenv("RETRIEVAL_DUPLICATE_THRESHOLD", "0.98"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+# the PDF context is packed from whole chunks within a token budget: at most
+# CONTEXT_MAX_TOKENS, and never more than the model's window leaves after the
+# prompt, history, question and MAX_TOKENS for the answer. Chunk token counts
+# are stored with the chunks at ingestion. They come from the served model's
+# tokenizer.json when TOKENIZER_PATH is set (exact), otherwise from the
+# tiktoken encoding below (o200k_base is the gpt-oss BPE without its chat
+# special tokens). Its BPE file is only read from TIKTOKEN_CACHE_DIR, never
+# downloaded at runtime: fill the directory once with python -m app.context_packer
+# and ship it with air-gapped installs
+TOKENIZER_PATH = os.getenv("TOKENIZER_PATH", "")
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+TIKTOKEN_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR", os.path.join(BASE_DIR, "data", "tiktoken"))
+LLM_CONTEXT_WINDOW = int(os.getenv("LLM_CONTEXT_WINDOW", "131072"))
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+# below this many context tokens more chunks are added (about 500 characters)
+CONTEXT_MIN_TOKENS = int(os.getenv("CONTEXT_MIN_TOKENS", "125"))
 
 def get_chunk_settings(page_count):
 
@@ -0,0 +1,165 @@
+import os
+import math
+import threading
+
+from app.config import (
+    TOKENIZER_PATH,
+    TOKENIZER_ENCODING,
+    TIKTOKEN_CACHE_DIR,
+    LLM_CONTEXT_WINDOW,
+    CONTEXT_MAX_TOKENS,
+    MAX_TOKENS
+)
+from app.prompt import prompt_template
+
+# tokens the "\n\n" between two chunks and the repr of one history message cost
+SEPARATOR_TOKENS = 1
+MESSAGE_OVERHEAD_TOKENS = 8
+# chunks this short are page furniture (headers, page numbers), not context
+MIN_CHUNK_CHARS = 40
+
+
+class TokenCounter:
+    """Counts prompt tokens from local tokenizer files (loaded on first use).
+
+    With tokenizer_path (a Hugging Face tokenizer.json) the counts are the
+    served model's own. Otherwise the tiktoken encoding is read from
+    cache_dir; nothing is downloaded here (see download_encoding()). If
+    neither can be loaded it falls back to one token per 4 bytes of UTF-8,
+    which is close for English prose and errs high for short words, and
+    says so loudly at startup.
+    """
+
+    def __init__(self, encoding_name, tokenizer_path="", cache_dir=None):
+        self.encoding_name = encoding_name
+        self.tokenizer_path = tokenizer_path
+        self.cache_dir = cache_dir
+        self.source = None
+        self._count = None
+        self._count_many = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    @property
+    def exact(self):
+        self._load()
+        return self._count is not None
+
+    def _load(self):
+        if self._count is None and not self._failed:
+            with self._lock:
+                if self._count is None and not self._failed:
+                    try:
+                        self._load_tokenizer()
+                    except Exception as e:
+                        self._failed = True
+                        self.source = "estimate (4 bytes per token)"
+                        print("=" * 50)
+                        print(f"⚠️ NO LOCAL TOKENIZER: {e}")
+                        print("⚠️ Context budgets are estimated at 4 bytes per token and may not match the model.")
+                        print("⚠️ Set TOKENIZER_PATH to the model's tokenizer.json, or fill TIKTOKEN_CACHE_DIR "
+                              "with python -m app.context_packer and ship it.")
+                        print("=" * 50)
+
+    def _load_tokenizer(self):
+        if self.tokenizer_path:
+            from tokenizers import Tokenizer
+            tokenizer = Tokenizer.from_file(self.tokenizer_path)
+            self._count_many = lambda texts: [
+                len(e.ids) for e in tokenizer.encode_batch(list(texts), add_special_tokens=False)
+            ]
+            self._count = lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+            self.source = self.tokenizer_path
+            return
+
+        if not self.cache_dir or not os.path.isdir(self.cache_dir) or not os.listdir(self.cache_dir):
+            raise FileNotFoundError(f"no {self.encoding_name} BPE file in {self.cache_dir}")
+        # tiktoken reads its files from here; with the file present it makes no request
+        os.environ["TIKTOKEN_CACHE_DIR"] = self.cache_dir
+        import tiktoken
+        encoding = tiktoken.get_encoding(self.encoding_name)
+        self._count_many = lambda texts: [
+            len(tokens) for tokens in encoding.encode_batch(list(texts), disallowed_special=())
+        ]
+        self._count = lambda text: len(encoding.encode(text, disallowed_special=()))
+        self.source = f"tiktoken {self.encoding_name}"
+
+    def count(self, text):
+        self._load()
+        if self._count is None:
+            return math.ceil(len(text.encode("utf-8")) / 4)
+        return self._count(text)
+
+    def count_many(self, texts):
+        self._load()
+        if self._count_many is None:
+            return [self.count(text) for text in texts]
+        return self._count_many(texts)
+
+    def stats(self):
+        return {"source": self.source, "exact": self._count is not None}
+
+
+def download_encoding(encoding_name, cache_dir):
+    """Fetch the tiktoken BPE file into cache_dir (needs network once, e.g. at image build)"""
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ["TIKTOKEN_CACHE_DIR"] = cache_dir
+    import tiktoken
+    tiktoken.get_encoding(encoding_name)
+    print(f"✅ {encoding_name} saved in {cache_dir}")
+
+
+token_counter = TokenCounter(TOKENIZER_ENCODING, TOKENIZER_PATH, TIKTOKEN_CACHE_DIR)
+
+
+def prompt_text(text):
+    """A chunk as it goes into the prompt: whitespace collapsed, bullets as dashes"""
+    return " ".join(text.split()).replace("●", "-")
+
+
+def chunk_token_counts(texts):
+    """Prompt tokens of each chunk text, stored in the chunk metadata at ingestion"""
+    return token_counter.count_many(prompt_text(text) for text in texts)
+
+
+_template_tokens = None
+
+
+def context_token_budget(question, history, window=LLM_CONTEXT_WINDOW, answer_tokens=MAX_TOKENS):
+    """Tokens left for the PDF context once the prompt template, the
+    conversation history, the question and the answer (answer_tokens) are
+    accounted for in the backend's window; at most CONTEXT_MAX_TOKENS."""
+    global _template_tokens
+    if _template_tokens is None:
+        _template_tokens = token_counter.count(prompt_template.format(chat_history="", context="", question="")) + 2 * MESSAGE_OVERHEAD_TOKENS
+    history_tokens = sum(token_counter.count(message.content) + MESSAGE_OVERHEAD_TOKENS for message in history)
+    left = window - answer_tokens - _template_tokens - history_tokens - token_counter.count(question)
+    return max(0, min(CONTEXT_MAX_TOKENS, left))
+
+
+def pack_context(docs, budget):
+    """Whole chunks in docs' order (best first) that fit in budget tokens.
+
+    A chunk too big for what is left is skipped, and smaller ones after it
+    still get their chance. Returns (packed docs, context text, tokens used).
+    """
+    packed, parts = [], []
+    used = 0
+    for doc in docs:
+        text = prompt_text(doc.page_content)
+        if len(text) <= MIN_CHUNK_CHARS or text in parts:
+            continue
+        tokens = doc.metadata.get("tokens")
+        if not isinstance(tokens, int):
+            tokens = token_counter.count(text)
+        cost = tokens + (SEPARATOR_TOKENS if parts else 0)
+        if used + cost > budget:
+            continue
+        packed.append(doc)
+        parts.append(text)
+        used += cost
+    return packed, "\n\n".join(parts), used
+
+
+if __name__ == "__main__":
+    download_encoding(TOKENIZER_ENCODING, TIKTOKEN_CACHE_DIR)
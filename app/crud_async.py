@@ -0,0 +1,68 @@
+# Async versions of the crud.py calls on the /ask path. They take an
+# AsyncUserClient (app.database.get_async_user_client) instead of a
+# supabase client and return rows instead of the API response.
+# Messages go through the write-behind journal: insert_message returns once
+# the message is in the local journal, get_chat_messages adds what the
+# journal hasn't flushed yet. The journal may send with the service key,
+# which skips RLS, so both first check with the user's own select that the
+# chat is theirs.
+
+from app.database import message_journal
+from app.chat_memory import chat_memory
+
+
+async def set_chat_title(db, chat_id, title):
+    return await db.update("chats", {"title": title}, {"id": f"eq.{chat_id}"})
+
+async def can_read_chat(db, user_id, chat_id):
+    """True if the user's RLS-scoped select returns the chat; remembered until the chat is dropped"""
+    if chat_memory.is_readable(user_id, chat_id):
+        return True
+    rows = await db.select("chats", "id", {"id": f"eq.{chat_id}", "user_id": f"eq.{user_id}"}, limit=1)
+    if not rows:
+        return False
+    chat_memory.mark_readable(user_id, chat_id)
+    return True
+
+async def insert_message(db, user_id, chat_id, role, content):
+    if not await can_read_chat(db, user_id, chat_id):
+        raise PermissionError(f"Chat {chat_id} not found")
+    row = message_journal.append(user_id, chat_id, role, content, db.access_token)
+    chat_memory.append(user_id, chat_id, row)
+    return [row]
+
+async def get_user_chats(db):
+    return await db.select("chats", "id, title, created_at", order="created_at.desc")
+
+async def get_chat_messages(db, user_id, chat_id):
+    rows = await db.select("messages", "*", {"chat_id": f"eq.{chat_id}"}, order="created_at")
+    if not await can_read_chat(db, user_id, chat_id):
+        return rows
+    return message_journal.merge_pending(user_id, chat_id, rows)
+
+async def get_recent_messages(db, user_id, chat_id):
+    """The chat's last CHAT_MEMORY_MESSAGES messages, oldest first"""
+    messages = chat_memory.get(user_id, chat_id)
+    if messages is not None:
+        return messages
+
+    rows = await db.select(
+        "messages",
+        "role, content, created_at",
+        {"chat_id": f"eq.{chat_id}"},
+        order="created_at.desc",
+        limit=chat_memory.max_messages
+    )
+    if not await can_read_chat(db, user_id, chat_id):
+        return rows[::-1]
+    rows = message_journal.merge_pending(user_id, chat_id, rows[::-1])
+    rows.sort(key=lambda m: m.get("created_at") or "")
+    rows = rows[-chat_memory.max_messages:]
+    chat_memory.load(user_id, chat_id, rows)
+    return rows
+
+async def get_chat_pdfs(db, user_id, chat_id, columns="filename"):
+    return await db.select("pdfs", columns, {
+        "user_id": f"eq.{user_id}",
+        "chat_id": f"eq.{chat_id}"
+    })
@@ -1,9 +1,17 @@
+import httpx
 from supabase import create_client
 from app.config import (
     SUPABASE_URL,
     SUPABASE_ANON_KEY,
-    SUPABASE_SERVICE_KEY
+    SUPABASE_SERVICE_KEY,
+    SUPABASE_HTTP_MAX_CONNECTIONS,
+    SUPABASE_HTTP_TIMEOUT,
+    MESSAGE_JOURNAL_PATH,
+    MESSAGE_FLUSH_INTERVAL,
+    MESSAGE_FLUSH_BATCH,
+    MESSAGE_FLUSH_MAX_ATTEMPTS
 )
+from app.message_journal import MessageJournal
 
 def get_supabase_user_client(access_token: str):
     client = create_client(
@@ -22,3 +30,84 @@ supabase_admin = create_client(
     SUPABASE_URL,
     SUPABASE_SERVICE_KEY
 )
+
+
+_async_http = None
+
+def get_async_http():
+    """Process-wide pooled client for PostgREST; created on first use inside the event loop"""
+    global _async_http
+    if _async_http is None or _async_http.is_closed:
+        _async_http = httpx.AsyncClient(
+            base_url=f"{SUPABASE_URL}/rest/v1",
+            timeout=SUPABASE_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_HTTP_MAX_CONNECTIONS
+            )
+        )
+    return _async_http
+
+async def close_async_http():
+    global _async_http
+    if _async_http is not None:
+        await _async_http.aclose()
+        _async_http = None
+
+
+message_journal = MessageJournal(
+    MESSAGE_JOURNAL_PATH,
+    rest_url=f"{SUPABASE_URL}/rest/v1",
+    anon_key=SUPABASE_ANON_KEY,
+    service_key=SUPABASE_SERVICE_KEY,
+    batch_size=MESSAGE_FLUSH_BATCH,
+    flush_interval=MESSAGE_FLUSH_INTERVAL,
+    max_attempts=MESSAGE_FLUSH_MAX_ATTEMPTS
+)
+
+
+class AsyncUserClient:
+    """PostgREST calls on behalf of one user, over the shared connection pool.
+
+    Only the auth headers are per request, so creating one is free. Filters
+    use PostgREST syntax, e.g. {"chat_id": f"eq.{chat_id}"}.
+    """
+
+    def __init__(self, access_token: str):
+        self.access_token = access_token
+        self.headers = {
+            "apikey": SUPABASE_ANON_KEY,
+            "Authorization": f"Bearer {access_token}"
+        }
+
+    async def select(self, table, columns="*", filters=None, order=None, limit=None):
+        params = {"select": columns, **(filters or {})}
+        if order:
+            params["order"] = order
+        if limit:
+            params["limit"] = limit
+        res = await get_async_http().get(f"/{table}", params=params, headers=self.headers)
+        res.raise_for_status()
+        return res.json()
+
+    async def insert(self, table, row):
+        res = await get_async_http().post(
+            f"/{table}",
+            json=row,
+            headers={**self.headers, "Prefer": "return=representation"}
+        )
+        res.raise_for_status()
+        return res.json()
+
+    async def update(self, table, values, filters):
+        res = await get_async_http().patch(
+            f"/{table}",
+            params=filters,
+            json=values,
+            headers={**self.headers, "Prefer": "return=representation"}
+        )
+        res.raise_for_status()
+        return res.json()
+
+def get_async_user_client(access_token: str):
+    return AsyncUserClient(access_token)
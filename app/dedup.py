@@ -0,0 +1,238 @@
+import os
+import zlib
+import numpy as np
+from difflib import SequenceMatcher
+
+# MinHash signatures of a snapshot's chunks, so the next upload doesn't hash them again
+DEDUP_FILE = "dedup.npz"
+
+
+def is_duplicate(text1, text2, threshold=0.6):
+    """Check if two texts are too similar"""
+    if len(text1) < 50 or len(text2) < 50:
+        return text1.strip() == text2.strip()
+
+    t1 = text1[:200].strip()
+    t2 = text2[:200].strip()
+
+    similarity = SequenceMatcher(None, t1, t2).ratio()
+    return similarity > threshold
+
+
+def _is_duplicate_fast(text1, text2, threshold):
+    """Same answer as is_duplicate(), using SequenceMatcher's cheap upper bounds first"""
+    if len(text1) < 50 or len(text2) < 50:
+        return text1.strip() == text2.strip()
+
+    matcher = SequenceMatcher(None, text1[:200].strip(), text2[:200].strip())
+    if matcher.real_quick_ratio() <= threshold or matcher.quick_ratio() <= threshold:
+        return False
+    return matcher.ratio() > threshold
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index for near-duplicate chunk detection.
+
+    Each chunk prefix is shingled into character n-grams and reduced to a
+    MinHash signature. The signature is split into LSH bands, and only chunks
+    that share a band bucket are compared with is_duplicate(). The cost per
+    chunk stays flat instead of growing with the number of chunks kept.
+
+    is_duplicate()'s 0.6 SequenceMatcher ratio allows prefixes that share
+    only ~25% of their 5-gram shingles (40% of the words replaced), so the
+    bands are 2 rows wide: a pair at Jaccard 0.2 shares a band with
+    probability 1 - (1 - 0.2^2)^64 = 0.93, at 0.25 0.98. Such wide bands also
+    match unrelated chunks of the same document now and then; candidates
+    whose signatures agree on fewer than min_jaccard of their hashes are
+    dropped before the SequenceMatcher check.
+    See benchmarks/bench_dedup.py for recall against is_duplicate().
+
+    The chunks already in a chat are loaded with seed(), from signatures
+    saved with the chat's snapshot (save()); their buckets are sorted
+    arrays built in one pass instead of one dict insert per band.
+    """
+
+    def __init__(self, threshold=0.6, num_perm=128, bands=64, shingle_size=5, min_jaccard=0.1, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.min_jaccard = min_jaccard
+        self.seed_value = seed
+
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing: ((a * x + b) mod 2^64) >> 32 with odd a
+        self._a = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+        self._texts = []
+        self._exact = set()
+        # band key -> doc_ids for chunks added one by one
+        self._buckets = [dict() for _ in range(bands)]
+        # seeded chunks: per band, sorted band keys and their doc_ids
+        self._seeded_keys = np.empty((bands, 0), dtype=np.uint64)
+        self._seeded_ids = np.empty((bands, 0), dtype=np.int64)
+        # signatures by doc_id (zeros for chunks too short to have one); hash values are < 2^32
+        self._signatures = np.zeros((1024, num_perm), dtype=np.uint32)
+        self.comparisons = 0
+
+    def __len__(self):
+        return len(self._texts)
+
+    def is_duplicate(self, text):
+        stripped = text.strip()
+        if stripped in self._exact:
+            return True
+        if len(text) < 50:
+            return False
+
+        signature = self._signature(text)
+        return self._find_match(text, signature, self._band_keys(signature))
+
+    def add(self, text):
+        """Index a chunk without checking it (e.g. chunks already in the index)"""
+        self._insert(text, self._signature(text) if len(text) >= 50 else None)
+
+    def seed(self, texts, signatures=None):
+        """Index the chunks already in a chat, in position order, without checking them.
+
+        signatures are rows from load_signatures() for the first chunks;
+        only the chunks after them are hashed.
+        """
+        if self._texts:
+            raise ValueError("seed() only works on an empty index")
+
+        self._texts = list(texts)
+        self._exact = {text.strip() for text in self._texts}
+        count = len(self._texts)
+        self._signatures = np.zeros((max(1024, count), self.num_perm), dtype=np.uint32)
+        known = 0
+        if signatures is not None and len(signatures) <= count:
+            known = len(signatures)
+            self._signatures[:known] = signatures
+        for doc_id in range(known, count):
+            if len(self._texts[doc_id]) >= 50:
+                self._signatures[doc_id] = self._signature(self._texts[doc_id])
+
+        ids = np.flatnonzero(np.fromiter((len(text) >= 50 for text in self._texts), dtype=bool, count=count))
+        keys = self._band_key_matrix(self._signatures[ids])
+        order = np.argsort(keys, axis=0, kind="stable")
+        self._seeded_keys = np.ascontiguousarray(np.take_along_axis(keys, order, axis=0).T)
+        self._seeded_ids = np.ascontiguousarray(ids[order].T)
+
+    def signatures(self):
+        """Signatures of the indexed chunks in the order they were added (zeros for short chunks)"""
+        return self._signatures[:len(self._texts)]
+
+    def save(self, folder):
+        np.savez(os.path.join(folder, DEDUP_FILE), signatures=self.signatures(), params=self._params())
+
+    def load_signatures(self, folder):
+        """Signatures save() wrote into folder, or None if there are none or they used other settings"""
+        try:
+            with np.load(os.path.join(folder, DEDUP_FILE)) as saved:
+                if not np.array_equal(saved["params"], self._params()):
+                    return None
+                return saved["signatures"]
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+    def _params(self):
+        return np.array([self.num_perm, self.bands, self.shingle_size, self.seed_value], dtype=np.int64)
+
+    def add_if_new(self, text):
+        """Index the chunk and return True, or return False if it is a near-duplicate"""
+        stripped = text.strip()
+        if stripped in self._exact:
+            return False
+
+        if len(text) < 50:
+            self._insert(text, None)
+            return True
+
+        signature = self._signature(text)
+        keys = self._band_keys(signature)
+        if self._find_match(text, signature, keys):
+            return False
+
+        self._insert(text, signature, keys)
+        return True
+
+    def _insert(self, text, signature, keys=None):
+        doc_id = len(self._texts)
+        self._texts.append(text)
+        self._exact.add(text.strip())
+
+        if signature is None:
+            return
+
+        if doc_id >= len(self._signatures):
+            grown = np.zeros((len(self._signatures) * 2, self.num_perm), dtype=np.uint32)
+            grown[:len(self._signatures)] = self._signatures
+            self._signatures = grown
+        self._signatures[doc_id] = signature
+
+        for band, key in enumerate(self._band_keys(signature) if keys is None else keys):
+            self._buckets[band].setdefault(key, []).append(doc_id)
+
+    def _find_match(self, text, signature, keys):
+        candidates = set()
+        seeded = self._seeded_keys.shape[1]
+        for band, key in enumerate(keys):
+            candidates.update(self._buckets[band].get(key, ()))
+            if seeded:
+                column = self._seeded_keys[band]
+                wanted = np.uint64(key)
+                start = np.searchsorted(column, wanted)
+                if start < seeded and column[start] == wanted:
+                    end = np.searchsorted(column, wanted, side="right")
+                    candidates.update(self._seeded_ids[band, start:end].tolist())
+        if not candidates:
+            return False
+
+        candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        # share of equal MinHash values estimates the shingle Jaccard similarity
+        similarity = (self._signatures[candidates] == signature).mean(axis=1)
+        order = np.argsort(-similarity)
+        for i in order:
+            if similarity[i] < self.min_jaccard:
+                break
+            self.comparisons += 1
+            if _is_duplicate_fast(text, self._texts[candidates[i]], self.threshold):
+                return True
+        return False
+
+    def _signature(self, text):
+        prefix = text[:200].strip()
+        n = self.shingle_size
+        if len(prefix) <= n:
+            shingles = {prefix}
+        else:
+            shingles = {prefix[i:i + n] for i in range(len(prefix) - n + 1)}
+
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_key_matrix(self, signatures):
+        """(n, bands) uint64 key per band of each signature row"""
+        rows = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        if self.rows <= 2:
+            keys = rows[:, :, 0] << np.uint64(32)
+            return keys | rows[:, :, 1] if self.rows == 2 else keys
+        # wider bands are folded into 64 bits; a collision only adds a candidate
+        keys = np.zeros(rows.shape[:2], dtype=np.uint64)
+        for row in range(self.rows):
+            keys = keys * np.uint64(0x100000001B3) + rows[:, :, row]
+        return keys
+
+    def _band_keys(self, signature):
+        return self._band_key_matrix(signature.reshape(1, -1))[0].tolist()
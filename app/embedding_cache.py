@@ -0,0 +1,193 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_chunk_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """Content-addressed store of chunk embeddings on local disk (SQLite).
+
+    Keys are sha256(model name + normalized chunk text), values are float32
+    vectors. When the stored vectors go above max_bytes, the least recently
+    used ones are deleted.
+    """
+
+    def __init__(self, path, model_name, max_bytes):
+        self.path = path
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        self._total_bytes = row[0]
+
+    def key(self, text):
+        payload = f"{self.model_name}\n{normalize_chunk_text(text)}".encode("utf-8")
+        return hashlib.sha256(payload).digest()
+
+    def get_many(self, texts):
+        """Return a list with the cached vector (or None) for every text"""
+        keys = [self.key(t) for t in texts]
+        found = {}
+
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                part = list(set(keys[start:start + 500]))
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, k) for k in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(k) for k in keys]
+            hits = sum(1 for r in results if r is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return results
+
+    def put_many(self, texts, vectors):
+        now = time.time()
+        rows = [
+            (self.key(t), np.asarray(v, dtype=np.float32).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                rows
+            )
+            if self._conn.total_changes > before:
+                # every vector has the same dimension, so the size of one row is enough
+                self._total_bytes += (self._conn.total_changes - before) * len(rows[0][1])
+            self._conn.commit()
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+    def _evict(self):
+        # drop down to 90% so we don't evict on every insert
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+
+            freed = 0
+            keys = []
+            for key, size in rows:
+                keys.append((key,))
+                freed += size
+                if self._total_bytes - freed <= target:
+                    break
+
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", keys)
+            self._total_bytes -= freed
+            self.evictions += len(keys)
+
+        self._conn.commit()
+        print(f"🧹 Embedding cache evicted down to {self._total_bytes} bytes")
+
+
+class QueryVectorCache:
+    """In-memory LRU of question text -> query embedding.
+
+    Questions are embedded with the model's embed_query (which may differ
+    from embed_documents), so they don't share EmbeddingCache. Vectors are
+    returned as read-only float32 arrays.
+    """
+
+    def __init__(self, model, max_entries):
+        self.model = model
+        self.max_entries = max_entries
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def embed(self, text):
+        key = normalize_chunk_text(text)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+                self.hits += 1
+                return vector
+            self.misses += 1
+
+        vector = np.asarray(self.model.embed_query(key), dtype=np.float32)
+        vector.flags.writeable = False
+
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+                self.evictions += 1
+        return vector
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._vectors),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,170 @@
+import os
+import queue
+import threading
+
+from app.embeddings import embeddings_model, embedding_cache
+from app.config import EMBEDDING_BATCH_SIZE, EMBEDDING_QUEUE_SIZE, EMBEDDING_WORKERS, EMBEDDING_TORCH_THREADS
+
+
+class EmbeddingJob:
+    """One ingestion job's share of the embedding queue.
+
+    Texts already in the embedding cache are filled in straight away; the rest
+    are cut into batches as they are added. result() waits for every batch and
+    returns the vectors in the order the texts were added. Batches of a job
+    that was cancelled (check_cancelled raises) or has failed are dropped by
+    the workers instead of being embedded.
+    """
+
+    def __init__(self, engine, progress_callback=None, check_cancelled=None):
+        self.engine = engine
+        self.progress_callback = progress_callback
+        self.check_cancelled = check_cancelled
+        self._vectors = []
+        self._submitted = 0
+        self._done = 0
+        self._error = None
+        self._cond = threading.Condition()
+
+    def add(self, texts):
+        texts = list(texts)
+        if not texts:
+            return
+
+        with self._cond:
+            base = len(self._vectors)
+            self._vectors.extend([None] * len(texts))
+            self._submitted += len(texts)
+
+        missing = list(range(len(texts)))
+        cache = self.engine.cache
+        if cache is not None:
+            cached = cache.get_many(texts)
+            missing = [i for i, v in enumerate(cached) if v is None]
+            hits = [(base + i, v) for i, v in enumerate(cached) if v is not None]
+            if hits:
+                print(f"♻️ {len(hits)}/{len(texts)} chunk embeddings served from cache")
+                self._complete([p for p, _ in hits], [v for _, v in hits])
+
+        batch_size = self.engine.batch_size
+        for start in range(0, len(missing), batch_size):
+            positions = [base + i for i in missing[start:start + batch_size]]
+            batch = [texts[i] for i in missing[start:start + batch_size]]
+            # blocks when the shared queue is full, so one big PDF cannot
+            # flood the workers ahead of everybody else
+            self.engine._queue.put((self, positions, batch))
+
+    def result(self):
+        with self._cond:
+            while self._done < self._submitted and self._error is None:
+                self._cond.wait()
+
+            if self._error is not None:
+                raise self._error
+            return list(self._vectors)
+
+    def cancel(self, error):
+        """Stop the job: its queued batches are skipped and result() raises error"""
+        self._fail(error)
+
+    def _complete(self, positions, vectors):
+        with self._cond:
+            for position, vector in zip(positions, vectors):
+                self._vectors[position] = vector
+            self._done += len(vectors)
+            done, submitted = self._done, self._submitted
+            self._cond.notify_all()
+
+        if self.progress_callback:
+            try:
+                self.progress_callback(done, submitted)
+            except Exception as e:
+                print(f"⚠️ Embedding progress callback failed: {e}")
+
+    def _fail(self, error):
+        with self._cond:
+            if self._error is None:
+                self._error = error
+            self._cond.notify_all()
+
+
+class EmbeddingEngine:
+    """Worker pool that embeds batches from a bounded queue shared by all jobs"""
+
+    def __init__(self, model, batch_size, queue_size, workers, cache=None, torch_threads=0):
+        self.model = model
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        # torch runs every batch on its own intra-op threads; the workers share the cores
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def start_job(self, progress_callback=None, check_cancelled=None):
+        self._ensure_started()
+        return EmbeddingJob(self, progress_callback, check_cancelled)
+
+    def embed_documents(self, texts, progress_callback=None):
+        job = self.start_job(progress_callback)
+        job.add(texts)
+        return job.result()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "torch_threads": self.torch_threads,
+            "batch_size": self.batch_size,
+            "queued_batches": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize
+        }
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+
+        with self._start_lock:
+            if self._threads:
+                return
+            try:
+                import torch
+                torch.set_num_threads(self.torch_threads)
+            except ImportError:
+                pass
+            for i in range(self.workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    name=f"embedding-worker-{i}",
+                    daemon=True
+                )
+                t.start()
+                self._threads.append(t)
+            print(f"🧠 Embedding engine started with {self.workers} workers x {self.torch_threads} torch threads, batch size {self.batch_size}")
+
+    def _worker(self):
+        while True:
+            job, positions, batch = self._queue.get()
+            try:
+                if job._error is None:
+                    if job.check_cancelled:
+                        job.check_cancelled()
+                    vectors = self.model.embed_documents(batch)
+                    if self.cache is not None:
+                        self.cache.put_many(batch, vectors)
+                    job._complete(positions, vectors)
+            except Exception as e:
+                print(f"❌ Embedding batch failed: {e}")
+                job._fail(e)
+            finally:
+                self._queue.task_done()
+
+
+embedding_engine = EmbeddingEngine(
+    model=embeddings_model,
+    batch_size=EMBEDDING_BATCH_SIZE,
+    queue_size=EMBEDDING_QUEUE_SIZE,
+    workers=EMBEDDING_WORKERS,
+    cache=embedding_cache,
+    torch_threads=EMBEDDING_TORCH_THREADS
+)
@@ -1,7 +1,17 @@
 from langchain_huggingface import HuggingFaceEmbeddings
+from app.config import EMBEDDING_MODEL_NAME, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB, QUERY_CACHE_SIZE
+from app.embedding_cache import EmbeddingCache, QueryVectorCache
 
 embeddings_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2",
+    model_name=EMBEDDING_MODEL_NAME,
     model_kwargs={"device": "cpu"},
     encode_kwargs={"normalize_embeddings": True}
-)
\ No newline at end of file
+)
+
+embedding_cache = EmbeddingCache(
+    path=EMBEDDING_CACHE_PATH,
+    model_name=EMBEDDING_MODEL_NAME,
+    max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+)
+
+query_vectors = QueryVectorCache(embeddings_model, QUERY_CACHE_SIZE)
@@ -2,10 +2,59 @@
 
 
 import os
+import math
+import time
+import uuid
+import shutil
+import threading
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
 from app.embeddings import embeddings_model
-from app.config import FAISS_PATH
-from difflib import SequenceMatcher
+from app.embedding_engine import embedding_engine
+from app.config import (
+    FAISS_PATH,
+    FAISS_CACHE_MAX_MB,
+    FAISS_CACHE_IDLE_SECONDS,
+    EMBEDDING_MODEL_NAME,
+    FAISS_PROMOTE_MIN_VECTORS,
+    FAISS_PROMOTED_INDEX,
+    FAISS_HNSW_M,
+    FAISS_HNSW_EF_CONSTRUCTION,
+    FAISS_HNSW_EF_SEARCH,
+    FAISS_IVF_NPROBE,
+    FAISS_DEFAULT_STORAGE,
+    FAISS_PQ_M,
+    FAISS_EXACT_RERANK,
+    FAISS_RERANK_FACTOR,
+    FAISS_PQ_RERANK_FACTOR
+)
+from app.index_cache import FaissIndexCache
+from app.index_rebuilder import IndexRebuilder
+from app.quantized_store import (
+    QuantizedFAISS,
+    EXACT_VECTORS_FILE,
+    STORAGE_MODES,
+    PQ_MIN_VECTORS,
+    all_vectors
+)
+from app.chunk_store import ChunkStore, CHUNKS_FILE, iter_documents
+from app.sparse_index import SparseIndex
+from app.context_packer import chunk_token_counts
+from app.dedup import NearDuplicateIndex, DEDUP_FILE
+from app.index_manifest import (
+    new_manifest,
+    add_chunks,
+    register_sources,
+    manifest_from_docstore,
+    read_manifest,
+    write_manifest
+)
+
+faiss_cache = FaissIndexCache(
+    max_bytes=FAISS_CACHE_MAX_MB * 1024 * 1024,
+    idle_seconds=FAISS_CACHE_IDLE_SECONDS
+)
 
 def get_user_faiss_path(user_id: str, chat_id: str):
     return os.path.join(
@@ -14,7 +63,240 @@ def get_user_faiss_path(user_id: str, chat_id: str):
         f"chat_{chat_id}"
     )
 
-def load_faiss_index(user_id: str, chat_id: str):
+def get_user_faiss_root(user_id: str):
+    return os.path.join(FAISS_PATH, f"user_{user_id}")
+
+# Each save goes to a fresh chat_<id>/v<n>/ folder and the CURRENT file is
+# then swapped to point at it with os.replace(). Readers follow CURRENT and
+# take no lock, so they see either the old snapshot or the new one, never a
+# half-written index. Folders from before this layout (index.faiss directly
+# in chat_<id>/) are still read until the next save replaces them.
+CURRENT_FILE = "CURRENT"
+
+_chat_locks = {}
+_chat_locks_guard = threading.Lock()
+
+def chat_write_lock(user_id: str, chat_id: str):
+    """Lock that serializes every write to one chat's index"""
+    key = (str(user_id), str(chat_id))
+    with _chat_locks_guard:
+        lock = _chat_locks.get(key)
+        if lock is None:
+            lock = _chat_locks[key] = threading.Lock()
+        return lock
+
+def _read_current_version(path: str):
+    try:
+        with open(os.path.join(path, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def get_current_index_path(user_id: str, chat_id: str):
+    """Folder of the chat's live index snapshot, or None if it has none"""
+    path = get_user_faiss_path(user_id, chat_id)
+    version = _read_current_version(path)
+    if version:
+        return os.path.join(path, version)
+    if os.path.exists(os.path.join(path, "index.faiss")):
+        return path
+    return None
+
+def get_index_version(user_id: str, chat_id: str):
+    """Changes whenever the chat's index is rewritten; None if it has no index"""
+    path = get_user_faiss_path(user_id, chat_id)
+    version = _read_current_version(path)
+    if version:
+        return version
+    try:
+        return f"legacy-{os.stat(os.path.join(path, 'index.faiss')).st_mtime_ns}"
+    except FileNotFoundError:
+        return None
+
+def index_type(index):
+    """"flat", "hnsw", "ivf", "sq8" or "pq" for the FAISS index inside a vectorstore"""
+    if isinstance(index, QuantizedFAISS):
+        return index.storage_mode
+    if hasattr(index.index, "hnsw"):
+        return "hnsw"
+    if hasattr(index.index, "nprobe"):
+        return "ivf"
+    return "flat"
+
+def tune_search(index):
+    """Apply the configured search parameters to a loaded or rebuilt index"""
+    kind = index_type(index)
+    if kind == "hnsw":
+        index.index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+    elif kind == "ivf":
+        index.index.nprobe = min(FAISS_IVF_NPROBE, index.index.nlist)
+        # retrieval reads candidate vectors back by position (app.retrieval)
+        index.index.make_direct_map()
+    return index
+
+def _ivf_nlist(ntotal):
+    return max(1, int(4 * math.sqrt(ntotal)))
+
+def apply_index_policy(index, manifest=None):
+    """Apply the chat's storage setting before it is saved; returns the (maybe new) vectorstore.
+
+    The manifest's "storage" setting (FAISS_DEFAULT_STORAGE if unset) decides:
+    "sq8"/"pq" chats get a QuantizedFAISS, with exact re-ranking unless the
+    manifest's "exact_rerank" (FAISS_EXACT_RERANK if unset) is off; float32
+    chats a plain FAISS index. "pq" chats stay sq8 until they have
+    PQ_MIN_VECTORS vectors; the manifest's "effective_storage" says which.
+    Turning a flat index into HNSW or IVF is not done here but by
+    index_rebuilder in the background (see rebuild_target).
+    """
+    storage = FAISS_DEFAULT_STORAGE
+    exact = FAISS_EXACT_RERANK
+    if manifest is not None:
+        storage = manifest.setdefault("storage", FAISS_DEFAULT_STORAGE)
+        exact = manifest.setdefault("exact_rerank", FAISS_EXACT_RERANK)
+
+    if storage in ("sq8", "pq"):
+        quantized = isinstance(index, QuantizedFAISS)
+        if not quantized or (exact and not index.exact_rerank) or (
+            index.storage_mode != storage and (storage == "sq8" or index.index.ntotal >= PQ_MIN_VECTORS)
+        ):
+            start = time.time()
+            if not quantized:
+                source = index
+            elif exact and not index.exact_rerank:
+                source = float_vectorstore(index)
+            else:
+                # changing the codec of a chat without exact vectors re-encodes the decoded ones
+                source = index.to_flat()
+            index = QuantizedFAISS.from_vectorstore(
+                source, storage, FAISS_PQ_M, FAISS_RERANK_FACTOR, FAISS_PQ_RERANK_FACTOR, exact_rerank=exact
+            )
+            print(f"🗜️ Stored {index.index.ntotal} vectors as {index.storage_mode} in {time.time() - start:.1f}s")
+        elif index.exact_rerank and not exact:
+            index.drop_exact_vectors()
+    elif isinstance(index, QuantizedFAISS):
+        index = float_vectorstore(index)
+
+    if manifest is not None:
+        manifest["index_type"] = index_type(index)
+        # "storage" is the chat's setting; a "pq" chat too small for PQ is kept as sq8
+        manifest["effective_storage"] = effective_storage(index)
+    return index
+
+def float_vectorstore(index):
+    """Flat float32 copy of a QuantizedFAISS.
+
+    A chat saved without exact vectors has only lossy codes, so its chunks
+    are embedded again (mostly from the embedding cache).
+    """
+    if index.exact_rerank:
+        return index.to_flat()
+    start = time.time()
+    texts = [doc.page_content for doc in iter_documents(index)]
+    vectors = np.asarray(embedding_engine.embed_documents(texts), dtype=np.float32)
+    flat = faiss.IndexFlatL2(index.index.d)
+    flat.add(vectors)
+    print(f"🧠 Embedded {len(texts)} chunks again for their exact vectors in {time.time() - start:.1f}s")
+    return FAISS(index.embedding_function, flat, index.docstore, index.index_to_docstore_id,
+                 normalize_L2=index._normalize_L2)
+
+def effective_storage(index):
+    """"float32", "sq8" or "pq": how the vectors of a loaded index are actually kept"""
+    return index.storage_mode if isinstance(index, QuantizedFAISS) else "float32"
+
+def rebuild_target(index):
+    """"hnsw" or "ivf" if a float32 chat's index is due for a rebuild, else None.
+
+    Flat indexes are promoted to FAISS_PROMOTED_INDEX once they have
+    FAISS_PROMOTE_MIN_VECTORS vectors; small chats stay exact. An IVF index
+    is retrained once the chat has grown so much that its clusters are four
+    times their trained size. Until then new chunks are added to the
+    existing index.
+    """
+    if isinstance(index, QuantizedFAISS) or index.index.metric_type != faiss.METRIC_L2:
+        return None
+    current = index.index
+    kind = index_type(index)
+    if kind == "flat" and current.ntotal >= FAISS_PROMOTE_MIN_VECTORS and FAISS_PROMOTED_INDEX in ("hnsw", "ivf"):
+        return FAISS_PROMOTED_INDEX
+    if kind == "ivf" and _ivf_nlist(current.ntotal) >= 2 * current.nlist:
+        return "ivf"
+    return None
+
+def build_index(vectors, target):
+    """An HNSW or IVF index (L2) filled with vectors, in the same positions"""
+    d = vectors.shape[1]
+    if target == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(d), d, _ivf_nlist(len(vectors)))
+        index.train(vectors)
+    else:
+        index = faiss.IndexHNSWFlat(d, FAISS_HNSW_M)
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    index.add(vectors)
+    return index
+
+def rebuild_chat_index(user_id: str, chat_id: str):
+    """Rebuild a chat's index as rebuild_target says and publish it as a new snapshot.
+
+    The slow part (reading the vectors, training and filling the new index)
+    runs without chat_write_lock, so uploads to the chat aren't held up.
+    Writes only ever append vectors, so chunks saved in the meantime are
+    added to the new index under the lock before it is saved. Returns True
+    if a snapshot was published.
+    """
+    index = load_faiss_index(user_id, chat_id, use_cache=False)
+    target = rebuild_target(index) if index is not None else None
+    if target is None:
+        return False
+
+    start = time.time()
+    kind = index_type(index)
+    vectors = all_vectors(index.index)
+    rebuilt = build_index(vectors, target)
+    del index
+
+    with chat_write_lock(user_id, chat_id):
+        latest = load_faiss_index(user_id, chat_id, use_cache=False)
+        count = len(vectors)
+        if (latest is None or index_type(latest) != kind or latest.index.ntotal < count
+                or not (latest.index.reconstruct(0) == vectors[0]).all()
+                or not (latest.index.reconstruct(count - 1) == vectors[-1]).all()):
+            print(f"⚠️ Index of chat {chat_id} was replaced during its rebuild, not publishing it")
+            return False
+
+        if latest.index.ntotal > count:
+            if kind == "ivf":
+                latest.index.make_direct_map()
+            rebuilt.add(latest.index.reconstruct_n(count, latest.index.ntotal - count))
+        latest.index = rebuilt
+        tune_search(latest)
+
+        manifest = load_index_manifest(user_id, chat_id) or manifest_from_docstore(latest, EMBEDDING_MODEL_NAME)
+        manifest["index_type"] = index_type(latest)
+        save_faiss_index(latest, user_id, chat_id, manifest)
+
+    print(f"🚀 Rebuilt index of chat {chat_id} with {rebuilt.ntotal} vectors as {target} in {time.time() - start:.1f}s")
+    return True
+
+index_rebuilder = IndexRebuilder(rebuild_chat_index)
+
+def schedule_rebuild(index, user_id: str, chat_id: str):
+    """Queue a background rebuild if the index just saved is due for one"""
+    if rebuild_target(index) is not None:
+        index_rebuilder.schedule(user_id, chat_id)
+
+def load_index_manifest(user_id: str, chat_id: str):
+    """Sources, chunk counts and page ranges of the chat's index, without loading vectors"""
+    return read_manifest(get_current_index_path(user_id, chat_id))
+
+def is_chat_indexed(user_id: str, chat_id: str):
+    return get_current_index_path(user_id, chat_id) is not None
+
+def load_faiss_index(user_id: str, chat_id: str, use_cache: bool = True):
+    if use_cache:
+        cached = faiss_cache.get(user_id, chat_id)
+        if cached is not None:
+            return cached
+
     path = get_user_faiss_path(user_id, chat_id)
     
     print("---- DEBUG LOAD ----")
@@ -26,9 +308,13 @@ def load_faiss_index(user_id: str, chat_id: str):
     if not os.path.exists(path):
         print("❌ FAISS folder does not exist")
         return None
+
+    version = _read_current_version(path)
+    index_path = os.path.join(path, version) if version else path
+    print("Version:", version or "legacy")
     
-    index_file = os.path.join(path, "index.faiss")
-    pkl_file = os.path.join(path, "index.pkl")
+    index_file = os.path.join(index_path, "index.faiss")
+    pkl_file = os.path.join(index_path, "index.pkl")
     
     print("Index file exists:", os.path.exists(index_file))
     print("PKL file exists:", os.path.exists(pkl_file))
@@ -38,94 +324,316 @@ def load_faiss_index(user_id: str, chat_id: str):
         return None
     
     try:
-        index = FAISS.load_local(
-            path, 
-            embeddings_model, 
-            allow_dangerous_deserialization=True 
-        )
-        print("✅ FAISS index loaded successfully")
+        if os.path.exists(os.path.join(index_path, CHUNKS_FILE)):
+            index = _open_snapshot(index_path)
+        elif os.path.exists(os.path.join(index_path, EXACT_VECTORS_FILE)):
+            # snapshots written before the chunk store keep the docstore in
+            # index.pkl; the next save rewrites them as a chunk store
+            index = QuantizedFAISS.load_local(
+                index_path,
+                embeddings_model,
+                allow_dangerous_deserialization=True,
+                rerank_factor=FAISS_RERANK_FACTOR,
+                pq_rerank_factor=FAISS_PQ_RERANK_FACTOR
+            )
+        else:
+            index = FAISS.load_local(
+                index_path, 
+                embeddings_model, 
+                allow_dangerous_deserialization=True 
+            )
+        tune_search(index)
+        print(f"✅ FAISS index loaded successfully ({index_type(index)}, {index.index.ntotal} vectors)")
+        # don't cache a snapshot that a writer replaced while we were loading it
+        if use_cache and _read_current_version(path) == version:
+            faiss_cache.put(user_id, chat_id, index)
         return index
     except Exception as e:
         print(f"❌ Error loading FAISS: {str(e)}")
         return None
 
-def save_faiss_index(index, user_id: str, chat_id: str):
+def _open_snapshot(index_path):
+    """Open a snapshot saved with _write_snapshot: the FAISS index plus a memory-mapped chunk store"""
+    store = ChunkStore(index_path)
+    index = faiss.read_index(os.path.join(index_path, "index.faiss"))
+    # compressed snapshots saved without exact re-ranking have no vectors.npy
+    if os.path.exists(os.path.join(index_path, EXACT_VECTORS_FILE)) or isinstance(
+            index, (faiss.IndexScalarQuantizer, faiss.IndexPQ)):
+        vectorstore = QuantizedFAISS(
+            embeddings_model,
+            index,
+            store,
+            store.ids,
+            rerank_factor=FAISS_RERANK_FACTOR,
+            pq_rerank_factor=FAISS_PQ_RERANK_FACTOR
+        ).attach_vectors(index_path)
+    else:
+        vectorstore = FAISS(embeddings_model, index, store, store.ids)
+    vectorstore.sparse_index = SparseIndex(index_path) if SparseIndex.exists(index_path) else None
+    return vectorstore
+
+def _write_snapshot(index, version_path):
+    """Write the FAISS index, its chunks (instead of pickling the docstore) and their keyword index into version_path"""
+    os.makedirs(version_path, exist_ok=True)
+    if isinstance(index, QuantizedFAISS):
+        index.write_vectors(version_path)
+    else:
+        faiss.write_index(index.index, os.path.join(version_path, "index.faiss"))
+    ChunkStore.write(version_path, iter_documents(index))
+
+    # the keyword index of the snapshot we loaded from covers its stored
+    # chunks, so only the ones added since are tokenized
+    store = index.docstore
+    if isinstance(store, ChunkStore) and SparseIndex.exists(store.folder):
+        added = (store.search(index.index_to_docstore_id[i]) for i in range(store.count, len(index.index_to_docstore_id)))
+        SparseIndex.write(version_path, (doc.page_content for doc in added), base=SparseIndex(store.folder))
+    else:
+        SparseIndex.write(version_path, (doc.page_content for doc in iter_documents(index)))
+
+    # an upload leaves its dedup index on the vectorstore; other writes
+    # (storage changes, rebuilds) keep the positions, so the saved
+    # signatures of the snapshot we loaded from still hold
+    dedup_index = getattr(index, "dedup_index", None)
+    if dedup_index is not None:
+        dedup_index.save(version_path)
+    elif isinstance(store, ChunkStore) and os.path.exists(os.path.join(store.folder, DEDUP_FILE)):
+        shutil.copyfile(os.path.join(store.folder, DEDUP_FILE), os.path.join(version_path, DEDUP_FILE))
+
+def save_faiss_index(index, user_id: str, chat_id: str, manifest=None):
+    """Write a new snapshot (and its manifest) and atomically make it the current one.
+
+    Callers must hold chat_write_lock(user_id, chat_id).
+    """
     path = get_user_faiss_path(user_id, chat_id)
     os.makedirs(path, exist_ok=True)
-    index.save_local(path)
-    print(f"✅ FAISS index saved to {path}")
 
-def is_duplicate(text1, text2, threshold=0.6):
-    """Check if two texts are too similar"""
-    if len(text1) < 50 or len(text2) < 50:
-        return text1.strip() == text2.strip()
-    
-    t1 = text1[:200].strip()
-    t2 = text2[:200].strip()
-    
-    similarity = SequenceMatcher(None, t1, t2).ratio()
-    return similarity > threshold
+    previous = _read_current_version(path)
+    version = f"v{time.time_ns()}"
+    version_path = os.path.join(path, version)
 
-def create_or_update_faiss(chunks_with_meta, user_id: str, chat_id: str):
     try:
-        print(f"📊 Creating FAISS with {len(chunks_with_meta)} chunks")
-        
+        _write_snapshot(index, version_path)
+        if manifest is not None:
+            write_manifest(version_path, manifest)
+
+        tmp_file = os.path.join(path, f"{CURRENT_FILE}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, os.path.join(path, CURRENT_FILE))
+    except Exception:
+        shutil.rmtree(version_path, ignore_errors=True)
+        raise
+
+    # serve the chunks from the files we just wrote instead of keeping the
+    # in-memory docstore, and cache it so the next reader doesn't load it again
+    store = ChunkStore(version_path)
+    index.docstore = store
+    index.index_to_docstore_id = store.ids
+    index.sparse_index = SparseIndex(version_path)
+    index.dedup_index = None
+    faiss_cache.put(user_id, chat_id, index)
+    _prune_versions(path, keep={version, previous})
+    print(f"✅ FAISS index saved to {version_path}")
+
+def _prune_versions(path: str, keep):
+    """Remove old snapshots, keeping the previous one for readers still loading it"""
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if name.startswith("v") and os.path.isdir(full) and name not in keep:
+            shutil.rmtree(full, ignore_errors=True)
+
+    if None not in keep:
+        # legacy files are only removed once they are two snapshots old
+        for name in ("index.faiss", "index.pkl"):
+            legacy = os.path.join(path, name)
+            if os.path.exists(legacy):
+                os.remove(legacy)
+
+def delete_faiss_index(user_id: str, chat_id: str = None):
+    """Remove a chat's index folder (or all of the user's when chat_id is None)"""
+    if chat_id is not None:
+        with chat_write_lock(user_id, chat_id):
+            return _remove_index_folder(get_user_faiss_path(user_id, chat_id), user_id, chat_id)
+
+    # every chat on disk plus any chat a writer holds a lock for, so a save or
+    # rebuild running now can't recreate a snapshot behind the delete
+    root = get_user_faiss_root(user_id)
+    chat_ids = {name[len("chat_"):] for name in (os.listdir(root) if os.path.isdir(root) else [])
+                if name.startswith("chat_")}
+    with _chat_locks_guard:
+        chat_ids.update(key[1] for key in _chat_locks if key[0] == str(user_id))
+
+    removed = False
+    for cid in sorted(chat_ids):
+        with chat_write_lock(user_id, cid):
+            removed = _remove_index_folder(get_user_faiss_path(user_id, cid), user_id, cid) or removed
+
+    faiss_cache.invalidate(user_id, None)
+    try:
+        # left in place if a new chat was saved meanwhile
+        os.rmdir(root)
+    except OSError:
+        pass
+    return removed
+
+def _remove_index_folder(path: str, user_id: str, chat_id: str):
+    faiss_cache.invalidate(user_id, chat_id)
 
+    if os.path.exists(path):
+        shutil.rmtree(path)
+        return True
+    return False
+
+def set_index_storage(user_id: str, chat_id: str, mode: str, exact_rerank=None):
+    """Switch a chat between float32 and compressed (sq8/pq) storage.
+
+    exact_rerank turns keeping the float32 vectors of a compressed chat on
+    or off (None keeps the chat's setting). Returns the chat's manifest
+    ("storage" is the requested mode, "effective_storage" the one in use),
+    or None if the chat has no index. Snapshots saved without their
+    compressed codes are rewritten with them.
+    """
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode {mode}, expected one of {', '.join(STORAGE_MODES)}")
+
+    with chat_write_lock(user_id, chat_id):
+        index = load_faiss_index(user_id, chat_id, use_cache=False)
+        if index is None:
+            return None
+
+        manifest = load_index_manifest(user_id, chat_id) or manifest_from_docstore(index, EMBEDDING_MODEL_NAME)
+        unchanged_setting = manifest.get("storage", FAISS_DEFAULT_STORAGE) == mode
+        kind = index_type(index)
+        was_exact = getattr(index, "exact_rerank", None)
+
+        manifest["storage"] = mode
+        if exact_rerank is not None:
+            manifest["exact_rerank"] = exact_rerank
+        index = apply_index_policy(index, manifest)
+        if (unchanged_setting and index_type(index) == kind and getattr(index, "exact_rerank", None) == was_exact
+                and isinstance(index.docstore, ChunkStore)
+                and getattr(index, "sparse_index", None) is not None
+                and not getattr(index, "encoded_on_load", 0)):
+            schedule_rebuild(index, user_id, chat_id)
+            return manifest
+
+        save_faiss_index(index, user_id, chat_id, manifest)
+        schedule_rebuild(index, user_id, chat_id)
+        return manifest
+
+def create_or_update_faiss(chunks_with_meta, user_id: str, chat_id: str, progress_callback=None,
+                           check_cancelled=None):
+    """Dedup, embed and index chunks; returns how many chunks were received.
+
+    chunks_with_meta can be a generator: unique chunks are handed to the
+    embedding engine batch by batch while the caller is still producing them.
+    check_cancelled is called once the embeddings are done, before anything
+    is saved, and raises to abandon the upload. Failures are raised, not
+    swallowed. Writes to the same chat are serialized, so concurrent uploads
+    don't overwrite each other's chunks.
+    """
+    with chat_write_lock(user_id, chat_id):
+        return _create_or_update_faiss(chunks_with_meta, user_id, chat_id, progress_callback, check_cancelled)
+
+def _create_or_update_faiss(chunks_with_meta, user_id: str, chat_id: str, progress_callback=None,
+                            check_cancelled=None):
+    job = None
+    try:
+        existing_index = load_faiss_index(user_id, chat_id, use_cache=False)
+
+        dedup_index = NearDuplicateIndex()
+        manifest = new_manifest(EMBEDDING_MODEL_NAME)
+        if existing_index:
+            # signatures saved with the snapshot; only chunks without one are hashed
+            store = existing_index.docstore
+            saved = dedup_index.load_signatures(store.folder) if isinstance(store, ChunkStore) else None
+            dedup_index.seed((doc.page_content for doc in iter_documents(existing_index)), saved)
+            print(f"📊 Deduplicating against {len(dedup_index)} chunks already in the index "
+                  f"({0 if saved is None else len(saved)} with saved signatures)")
+
+            manifest = load_index_manifest(user_id, chat_id) or manifest_from_docstore(existing_index, EMBEDDING_MODEL_NAME)
+            if manifest.get("embedding_model") != EMBEDDING_MODEL_NAME:
+                print(f"⚠️ Index was built with {manifest.get('embedding_model')}, adding {EMBEDDING_MODEL_NAME} vectors")
+
+        job = embedding_engine.start_job(progress_callback, check_cancelled)
         unique_chunks = []
-        seen_texts = []
+        pending_texts = []
+        total_chunks = 0
+        sources = set()
         
         for chunk in chunks_with_meta:
-            text = chunk["text"]
-            is_dup = False
-            
-            for seen in seen_texts:
-                if is_duplicate(text, seen):
-                    is_dup = True
-                    break
-            
-            if not is_dup:
+            total_chunks += 1
+            sources.add(chunk["metadata"].get("source") or "Unknown")
+            if dedup_index.add_if_new(chunk["text"]):
                 unique_chunks.append(chunk)
-                seen_texts.append(text)
+                pending_texts.append(chunk["text"])
+
+            if len(pending_texts) >= embedding_engine.batch_size:
+                job.add(pending_texts)
+                pending_texts = []
+
+        job.add(pending_texts)
         
-        print(f"📊 After deduplication: {len(unique_chunks)} unique chunks")
+        print(f"📊 {total_chunks} chunks, after deduplication: {len(unique_chunks)} unique chunks ({dedup_index.comparisons} comparisons)")
+
+        if not unique_chunks:
+            print("⚠️ No new chunks to add")
+            if existing_index and register_sources(manifest, sources):
+                # the PDF is only duplicates, but it should still be listed for the chat
+                existing_index.dedup_index = dedup_index
+                save_faiss_index(existing_index, user_id, chat_id, manifest)
+            return total_chunks
         
-        if unique_chunks and len(unique_chunks) > 0:
-            print(f"Sample chunk: {unique_chunks[0]['text'][:100]}...")
-            print(f"Metadata: {unique_chunks[0]['metadata']}")
+        print(f"Sample chunk: {unique_chunks[0]['text'][:100]}...")
+        print(f"Metadata: {unique_chunks[0]['metadata']}")
         
         texts = [c["text"] for c in unique_chunks]
+        # prompt tokens of every chunk, so the context packer doesn't tokenize at query time
+        for chunk, tokens in zip(unique_chunks, chunk_token_counts(texts)):
+            chunk["metadata"]["tokens"] = tokens
         metas = [c["metadata"] for c in unique_chunks]
         
-        existing_index = load_faiss_index(user_id, chat_id)
+        print(f"🧠 Waiting for {len(texts)} chunk embeddings...")
+        vectors = job.result()
+        # a cancel that came in while the chunks were being embedded
+        if check_cancelled:
+            check_cancelled()
+        text_embeddings = list(zip(texts, vectors))
+        
+        add_chunks(manifest, unique_chunks)
         
         if existing_index:
             print("📝 Updating existing FAISS index with new chunks...")
-            existing_index.add_texts(texts, metadatas=metas)
-            save_faiss_index(existing_index, user_id, chat_id)
+            existing_index.add_embeddings(text_embeddings, metadatas=metas)
+            existing_index = apply_index_policy(existing_index, manifest)
+            existing_index.dedup_index = dedup_index
+            save_faiss_index(existing_index, user_id, chat_id, manifest)
+            schedule_rebuild(existing_index, user_id, chat_id)
             print("✅ FAISS index updated with new PDF")
         else:
             print("📝 Creating new FAISS index...")
-            index = FAISS.from_texts(
-                texts=texts, 
+            index = FAISS.from_embeddings(
+                text_embeddings=text_embeddings, 
                 embedding=embeddings_model, 
                 metadatas=metas 
             )
-            save_faiss_index(index, user_id, chat_id)
+            index = apply_index_policy(index, manifest)
+            index.dedup_index = dedup_index
+            save_faiss_index(index, user_id, chat_id, manifest)
+            schedule_rebuild(index, user_id, chat_id)
             print("✅ New FAISS index created")
 
-        saved_index = load_faiss_index(user_id, chat_id)
-        if saved_index:
-            print(f"✅ Verification: FAISS index loaded successfully")
+        print(f"📚 Total PDFs in index: {len(manifest['sources'])} ({manifest['total_chunks']} chunks)")
+        print(f"📄 PDFs: {', '.join(manifest['sources'])}")
 
-            all_docs = saved_index.similarity_search("", k=1000)
-            sources = set([doc.metadata.get("source") for doc in all_docs if doc.metadata])
-            print(f"📚 Total PDFs in index: {len(sources)}")
-            print(f"📄 PDFs: {', '.join(sources)}")
-        else:
-            print(f"❌ Verification: FAISS index could not be loaded!")
+        return total_chunks
             
     except Exception as e:
         print(f"❌ FAISS creation failed: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        if job is not None:
+            # batches of this upload still in the shared queue aren't embedded
+            job.cancel(e)
+        raise
 
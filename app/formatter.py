@@ -2,6 +2,43 @@
 
 import re
 
+_BR_RUN = re.compile(r'(<br>\s*){3,}')
+_BULLET_SPACE = re.compile(r'•\s+')
+_TAG = re.compile(r"\[.*?\]")
+# output that may still change once the next line arrives
+_UNSETTLED_TAIL = re.compile(r'(?:<br>|•|\s)*$')
+
+
+def format_line(line: str) -> str:
+    """HTML for one non-empty, stripped answer line"""
+    numbered_match = re.match(r'^(\d+\.)\s*(.*)', line)
+    if numbered_match:
+        num, content = numbered_match.groups()
+
+        return f"<br>• {content}"
+
+
+    if line.startswith('- ') or line.startswith('• ') or line.startswith('* '):
+        content = re.sub(r'^[-•*]\s*', '', line)
+        return f"• {content}"
+
+
+    if line.endswith(':') and len(line.split()) <= 5:
+        clean = line.replace(":", "")
+        return f"<br><b><u>{clean}</u></b>"
+    elif line.isupper() or (line[0].isupper() and len(line.split()) <= 3) or line.istitle():
+        if line.startswith('**') and line.endswith('**'):
+            return f"<br><b><u>{line[2:-2]}</u></b>"
+        else:
+            return f"<br><b><u>{line}</u></b>"
+    else:
+
+        if '**' in line:
+            line = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', line)
+        line = re.sub(r'<u>(.*?)</u>', r'\1', line)
+        return line
+
+
 def format_text(text: str) -> str:
     if not text or not text.strip():
         return "No answer generated."
@@ -30,44 +67,75 @@ def format_text(text: str) -> str:
             line = line.strip()
             if not line:
                 continue
-            
-
-            numbered_match = re.match(r'^(\d+\.)\s*(.*)', line)
-            if numbered_match:
-                num, content = numbered_match.groups()
-
-                section_formatted.append(f"<br>• {content}")
-                continue
-            
-
-            if line.startswith('- ') or line.startswith('• ') or line.startswith('* '):
-                content = re.sub(r'^[-•*]\s*', '', line)
-                section_formatted.append(f"• {content}")
-                continue
-            
-
-            if line.endswith(':') and len(line.split()) <= 5:
-                clean = line.replace(":", "")
-                section_formatted.append(f"<br><b><u>{clean}</u></b>")
-            elif line.isupper() or (line[0].isupper() and len(line.split()) <= 3) or line.istitle():
-                if line.startswith('**') and line.endswith('**'):
-                    section_formatted.append(f"<br><b><u>{line[2:-2]}</u></b>")
-                else:
-                    section_formatted.append(f"<br><b><u>{line}</u></b>")
-            else:
-                
-                if '**' in line:
-                    line = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', line)
-                line = re.sub(r'<u>(.*?)</u>', r'\1', line)
-                section_formatted.append(line)
+            section_formatted.append(format_line(line))
         
         formatted_sections.append("<br>".join(section_formatted))
     
     result = "<br><br>".join(formatted_sections)
     
   
-    result = re.sub(r'(<br>\s*){3,}', '<br><br>', result)
-    result = re.sub(r'•\s+', '• ', result)
+    result = _BR_RUN.sub('<br><br>', result)
+    result = _BULLET_SPACE.sub('• ', result)
     
     return result.strip()
 
+
+class StreamingFormatter:
+    """format_text() for an answer that arrives a few tokens at a time.
+
+    Lines are formatted as soon as they are finished, with the same rules as
+    format_text(). Repeated lines are dropped (like clean_answer()) and
+    [TAG] markers are removed. feed() and finish() return the HTML that is
+    safe to send; `html` holds everything sent so far.
+    """
+
+    def __init__(self):
+        self.html = ""
+        self.saw_history = False
+        self._buffer = ""
+        self._pending = ""
+        self._seen = set()
+
+    def feed(self, text: str) -> str:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            self._add_line(line)
+        return self._flush(final=False)
+
+    def finish(self) -> str:
+        if self._buffer:
+            self._add_line(self._buffer)
+            self._buffer = ""
+
+        out = self._flush(final=True)
+        if not self.html:
+            self.html = out = "No answer generated."
+        return out
+
+    def _add_line(self, line):
+        if "[HISTORY_ANSWER]" in line:
+            self.saw_history = True
+        line = _TAG.sub("", line).strip()
+        if not line or line in self._seen:
+            return
+
+        self._seen.add(line)
+        separator = "<br>" if self.html or self._pending else ""
+        self._pending += separator + format_line(line)
+
+    def _flush(self, final):
+        text = self._pending
+        if final:
+            tail = ""
+            text = text.rstrip()
+        else:
+            # trailing <br>s and bullets can still be merged with what comes next
+            cut = _UNSETTLED_TAIL.search(text).start()
+            text, tail = text[:cut], text[cut:]
+
+        text = _BULLET_SPACE.sub('• ', _BR_RUN.sub('<br><br>', text))
+        self._pending = tail
+        self.html += text
+        return text
+
@@ -0,0 +1,142 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+def estimate_index_bytes(vectorstore):
+    """Rough in-memory size of a loaded FAISS vectorstore (vectors + docstore texts)"""
+    total = 0
+
+    index = getattr(vectorstore, "index", None)
+    if index is not None:
+        try:
+            # bytes per stored vector: 4*d for float32, d for SQ8, m for PQ
+            total += int(index.ntotal) * int(index.sa_code_size())
+        except RuntimeError:
+            total += int(index.ntotal) * int(index.d) * 4
+        hnsw = getattr(index, "hnsw", None)
+        if hnsw is not None:
+            # neighbour lists: about 2*M ids per vector on the bottom layer, plus upper layers
+            total += int(index.ntotal) * int(hnsw.nb_neighbors(0) + hnsw.nb_neighbors(1)) * 4
+        elif hasattr(index, "nlist"):
+            total += int(index.ntotal) * 8
+
+    docstore = getattr(vectorstore, "docstore", None)
+    if hasattr(docstore, "added_documents"):
+        # a chunk store is memory-mapped: only its offsets and the chunks
+        # added since loading live on the heap
+        total += (docstore.count + 1) * 8
+        docs = docstore.added_documents()
+    else:
+        docs = (getattr(docstore, "_dict", None) or {}).values()
+    for doc in docs:
+        total += len(getattr(doc, "page_content", "") or "")
+        total += 100
+
+    return total
+
+
+class FaissIndexCache:
+    """LRU of loaded FAISS vectorstores keyed by (user_id, chat_id).
+
+    Entries are evicted when the total estimated size goes above max_bytes
+    or when they have not been used for idle_seconds.
+    """
+
+    def __init__(self, max_bytes, idle_seconds):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id, chat_id):
+        key = (str(user_id), str(chat_id))
+        with self._lock:
+            self._evict_idle()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            entry["last_used"] = time.monotonic()
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["index"]
+
+    def put(self, user_id, chat_id, index):
+        key = (str(user_id), str(chat_id))
+        size = estimate_index_bytes(index)
+
+        with self._lock:
+            self._pop(key)
+
+            if size > self.max_bytes:
+                print(f"⚠️ FAISS index for {key} ({size} bytes) is larger than the cache, not caching")
+                return
+
+            self._entries[key] = {
+                "index": index,
+                "bytes": size,
+                "last_used": time.monotonic()
+            }
+            self._total_bytes += size
+
+            while self._total_bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._pop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, user_id, chat_id=None):
+        """Drop one chat's index, or every index of the user when chat_id is None"""
+        user_id = str(user_id)
+        with self._lock:
+            if chat_id is not None:
+                keys = [(user_id, str(chat_id))]
+            else:
+                keys = [k for k in self._entries if k[0] == user_id]
+
+            for key in keys:
+                if self._pop(key):
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "idle_seconds": self.idle_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._total_bytes -= entry["bytes"]
+        return True
+
+    def _evict_idle(self):
+        if not self.idle_seconds:
+            return
+
+        cutoff = time.monotonic() - self.idle_seconds
+        expired = [k for k, e in self._entries.items() if e["last_used"] < cutoff]
+        for key in expired:
+            self._pop(key)
+            self.evictions += 1
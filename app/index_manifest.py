@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from app.chunk_store import iter_documents
+
+MANIFEST_FILE = "manifest.json"
+
+
+def new_manifest(embedding_model):
+    return {
+        "embedding_model": embedding_model,
+        "updated_at": None,
+        "total_chunks": 0,
+        "sources": {}
+    }
+
+
+def _source_entry(manifest, source, now):
+    entry = manifest["sources"].get(source)
+    if entry is None:
+        entry = manifest["sources"][source] = {
+            "chunks": 0,
+            "first_page": None,
+            "last_page": None,
+            "content_hash": hashlib.sha256().hexdigest(),
+            "indexed_at": now,
+            "updated_at": now
+        }
+    return entry
+
+
+def register_sources(manifest, sources):
+    """Add sources whose chunks were all duplicates; returns True if any were new"""
+    now = datetime.now().isoformat()
+    new = [s for s in sources if s not in manifest["sources"]]
+    for source in new:
+        _source_entry(manifest, source, now)
+    if new:
+        manifest["updated_at"] = now
+    return bool(new)
+
+
+def add_chunks(manifest, chunks):
+    """Record indexed chunks ({"text", "metadata"}) under their source PDF"""
+    now = datetime.now().isoformat()
+
+    for chunk in chunks:
+        metadata = chunk.get("metadata") or {}
+        source = metadata.get("source") or "Unknown"
+        page = metadata.get("page")
+
+        entry = _source_entry(manifest, source, now)
+
+        entry["chunks"] += 1
+        if isinstance(page, int):
+            if entry["first_page"] is None or page < entry["first_page"]:
+                entry["first_page"] = page
+            if entry["last_page"] is None or page > entry["last_page"]:
+                entry["last_page"] = page
+
+        # running hash of the source's chunk texts in indexing order
+        entry["content_hash"] = hashlib.sha256(
+            (entry["content_hash"] + chunk["text"]).encode("utf-8")
+        ).hexdigest()
+        entry["updated_at"] = now
+        manifest["total_chunks"] += 1
+
+    manifest["updated_at"] = now
+    return manifest
+
+
+def manifest_from_docstore(vectorstore, embedding_model):
+    """Rebuild a manifest for an index saved before manifests existed"""
+    manifest = new_manifest(embedding_model)
+    return add_chunks(manifest, (
+        {"text": doc.page_content, "metadata": doc.metadata}
+        for doc in iter_documents(vectorstore)
+    ))
+
+
+def read_manifest(index_path):
+    if not index_path:
+        return None
+    try:
+        with open(os.path.join(index_path, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not read index manifest in {index_path}: {e}")
+        return None
+
+
+def write_manifest(index_path, manifest):
+    with open(os.path.join(index_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
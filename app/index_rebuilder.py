@@ -0,0 +1,69 @@
+import queue
+import threading
+import time
+
+
+class IndexRebuilder:
+    """Rebuilds chat indexes on one background thread, off the upload path.
+
+    rebuild(user_id, chat_id) does the work and returns True if it published
+    a new snapshot. A chat that is already queued or being rebuilt isn't
+    queued again: the rebuild picks up chunks saved while it was running.
+    """
+
+    def __init__(self, rebuild):
+        self.rebuild = rebuild
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._guard = threading.Lock()
+        self._thread = None
+        self.rebuilt = 0
+        self.skipped = 0
+        self.failed = 0
+        self.last_seconds = None
+
+    def schedule(self, user_id: str, chat_id: str):
+        """Queue a rebuild of the chat; returns False if one is already pending"""
+        key = (str(user_id), str(chat_id))
+        with self._guard:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="index-rebuilder", daemon=True)
+                self._thread.start()
+        self._queue.put(key)
+        return True
+
+    def join(self):
+        """Wait until every queued rebuild has finished"""
+        self._queue.join()
+
+    def stats(self):
+        with self._guard:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "rebuilt": self.rebuilt,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "last_seconds": self.last_seconds
+        }
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            start = time.time()
+            try:
+                if self.rebuild(*key):
+                    self.rebuilt += 1
+                    self.last_seconds = round(time.time() - start, 2)
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                print(f"❌ Index rebuild of chat {key[1]} failed: {e}")
+                self.failed += 1
+            finally:
+                with self._guard:
+                    self._pending.discard(key)
+                self._queue.task_done()
@@ -0,0 +1,211 @@
+import os
+import time
+import uuid
+import heapq
+import itertools
+import threading
+from collections import OrderedDict
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+class IngestJob:
+    def __init__(self, user_id, chat_id, file_path, filename, access_token):
+        self.id = uuid.uuid4().hex
+        self.user_id = str(user_id)
+        self.chat_id = str(chat_id)
+        self.file_path = file_path
+        self.filename = filename
+        self.access_token = access_token
+        self.size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        self.submitted_at = time.time()
+        self.status = "queued"
+        self._cancel_event = threading.Event()
+
+    @property
+    def chat_key(self):
+        return (self.user_id, self.chat_id)
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._cancel_event.is_set():
+            raise IngestCancelled(f"Processing of {self.filename} was cancelled")
+
+
+class IngestScheduler:
+    """Bounded worker pool for PDF ingestion.
+
+    - at most `workers` batches run at once, so uploads cannot starve /ask
+    - users are served round-robin, and each user's smallest PDF goes first
+    - every queued PDF for the same chat is handed to the handler as one
+      batch, so a chat gets one FAISS write instead of several racing ones
+    - a chat is never processed by two workers at the same time
+    """
+
+    def __init__(self, workers, handler):
+        self.workers = max(1, workers)
+        self.handler = handler
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()   # user_id -> heap of (size, seq, job)
+        self._running_chats = set()
+        self._running_jobs = {}
+        self._seq = itertools.count()
+        self._threads = []
+        self.completed = 0
+        self.cancelled = 0
+
+    def submit(self, user_id, chat_id, file_path, filename, access_token):
+        job = IngestJob(user_id, chat_id, file_path, filename, access_token)
+        self._ensure_started()
+
+        with self._cond:
+            heap = self._pending.setdefault(job.user_id, [])
+            heapq.heappush(heap, (job.size, next(self._seq), job))
+            self._cond.notify()
+
+        print(f"📥 Queued {filename} ({job.size} bytes) for chat {chat_id}, queue depth {self.queue_depth()}")
+        return job
+
+    def cancel(self, user_id, chat_id=None):
+        """Cancel queued and running jobs of a user, or of one of their chats.
+
+        A running batch stops at its next page and writes nothing.
+        """
+        user_id = str(user_id)
+
+        def matches(job):
+            if job.user_id != user_id:
+                return False
+            return chat_id is None or job.chat_id == str(chat_id)
+
+        cancelled = []
+        with self._cond:
+            heap = self._pending.get(user_id, [])
+            keep = []
+            for item in heap:
+                if matches(item[2]):
+                    cancelled.append(item[2])
+                else:
+                    keep.append(item)
+            heapq.heapify(keep)
+            if keep:
+                self._pending[user_id] = keep
+            else:
+                self._pending.pop(user_id, None)
+
+            for job in self._running_jobs.values():
+                if matches(job):
+                    cancelled.append(job)
+
+            for job in cancelled:
+                job._cancel_event.set()
+                if job.status == "queued":
+                    job.status = "cancelled"
+                    self.cancelled += 1
+                    self._cleanup(job)
+
+        return cancelled
+
+    def queue_depth(self, user_id=None, chat_id=None):
+        with self._cond:
+            return sum(
+                1
+                for uid, heap in self._pending.items()
+                if user_id is None or uid == str(user_id)
+                for _, _, job in heap
+                if chat_id is None or job.chat_id == str(chat_id)
+            )
+
+    def queued_files(self, user_id, chat_id):
+        with self._cond:
+            heap = self._pending.get(str(user_id), [])
+            return [job.filename for _, _, job in sorted(heap) if job.chat_id == str(chat_id)]
+
+    def is_running(self, user_id, chat_id):
+        with self._cond:
+            return (str(user_id), str(chat_id)) in self._running_chats
+
+    def stats(self):
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "queued": sum(len(h) for h in self._pending.values()),
+                "running_chats": len(self._running_chats),
+                "users_waiting": len(self._pending),
+                "completed": self.completed,
+                "cancelled": self.cancelled
+            }
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"ingest-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _take_batch(self):
+        """Pick the next user round-robin, their smallest runnable job, and the
+        rest of that chat's queued jobs. Caller holds the lock."""
+        for user_id in list(self._pending):
+            heap = self._pending[user_id]
+            runnable = [item for item in heap if item[2].chat_key not in self._running_chats]
+            if not runnable:
+                continue
+
+            first = min(runnable)[2]
+            batch = [item[2] for item in sorted(heap) if item[2].chat_key == first.chat_key]
+            keep = [item for item in heap if item[2].chat_key != first.chat_key]
+            heapq.heapify(keep)
+
+            # move this user to the back of the round-robin order
+            del self._pending[user_id]
+            if keep:
+                self._pending[user_id] = keep
+            return batch
+
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+                while batch is None:
+                    self._cond.wait()
+                    batch = self._take_batch()
+
+                self._running_chats.add(batch[0].chat_key)
+                for job in batch:
+                    job.status = "running"
+                    self._running_jobs[job.id] = job
+
+            try:
+                self.handler(batch)
+            except Exception as e:
+                print(f"❌ Ingestion batch failed: {e}")
+            finally:
+                with self._cond:
+                    self._running_chats.discard(batch[0].chat_key)
+                    for job in batch:
+                        self._running_jobs.pop(job.id, None)
+                        if job.cancelled:
+                            job.status = "cancelled"
+                            self.cancelled += 1
+                        else:
+                            job.status = "done"
+                            self.completed += 1
+                    # a chat that was skipped while this batch ran may be runnable now
+                    self._cond.notify_all()
+
+    def _cleanup(self, job):
+        try:
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+        except OSError:
+            pass
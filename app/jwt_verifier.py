@@ -0,0 +1,187 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import httpx
+import jwt
+
+
+class TokenRejected(Exception):
+    def __init__(self, message, expired=False, cacheable=True):
+        super().__init__(message)
+        self.expired = expired
+        self.cacheable = cacheable
+
+
+class JWKSCache:
+    """Signing keys from the project's JWKS endpoint, refreshed when they get
+    old or when a token names a key id we haven't seen (key rotation)."""
+
+    def __init__(self, url, ttl_seconds, min_refresh_seconds):
+        self.url = url
+        self.ttl_seconds = ttl_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def get(self, kid):
+        now = time.monotonic()
+        key = self._keys.get(kid)
+        if key is not None and now - self._fetched_at < self.ttl_seconds:
+            return key
+
+        with self._lock:
+            key = self._keys.get(kid)
+            fresh = time.monotonic() - self._fetched_at < self.ttl_seconds
+            if key is not None and fresh:
+                return key
+            # an unknown kid shouldn't let every bad token trigger a fetch
+            if time.monotonic() - self._fetched_at >= self.min_refresh_seconds:
+                self._refresh()
+            return self._keys.get(kid)
+
+    def _refresh(self):
+        try:
+            res = httpx.get(self.url, timeout=5)
+            res.raise_for_status()
+            keys = {}
+            for jwk in res.json().get("keys", []):
+                try:
+                    keys[jwk.get("kid")] = jwt.PyJWK(jwk)
+                except jwt.PyJWKError as e:
+                    print(f"⚠️ Skipping unusable JWKS key {jwk.get('kid')}: {e}")
+            self._keys = keys
+            self.refreshes += 1
+            print(f"🔑 Loaded {len(keys)} signing keys from JWKS")
+        except Exception as e:
+            print(f"⚠️ Could not fetch JWKS from {self.url}: {e}")
+        finally:
+            self._fetched_at = time.monotonic()
+
+
+class TokenVerifier:
+    """Verifies Supabase access tokens locally and caches the outcome.
+
+    HS256 tokens are checked with the project's JWT secret, asymmetric ones
+    (RS256/ES256) with the key from JWKS that matches their kid. Tokens we
+    have no key for go to remote_verify (a call to Supabase Auth). Valid
+    tokens stay cached until their exp claim; rejected ones are cached too,
+    so a client polling with a dead token costs nothing after the first try.
+    """
+
+    def __init__(self, secret=None, jwks=None, remote_verify=None, audience="authenticated",
+                 leeway_seconds=30, cache_size=10000, negative_ttl_seconds=60):
+        self.secret = secret
+        self.jwks = jwks
+        self.remote_verify = remote_verify
+        self.audience = audience
+        self.leeway_seconds = leeway_seconds
+        self.cache_size = cache_size
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.remote_calls = 0
+
+    def verify(self, token):
+        """Return the token's claims or raise TokenRejected"""
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > now:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                if isinstance(entry[1], TokenRejected):
+                    raise entry[1]
+                return entry[1]
+            self.misses += 1
+
+        try:
+            claims = self._decode(token)
+            # leeway lets a token through a little after exp; stop caching it there too
+            result, valid_until = claims, claims["exp"] + self.leeway_seconds
+        except TokenRejected as e:
+            # an expired token never becomes valid again; anything else
+            # (e.g. a key we haven't fetched yet) is retried after a while
+            result = e
+            valid_until = float("inf") if e.expired else now + self.negative_ttl_seconds
+
+        if not isinstance(result, TokenRejected) or result.cacheable:
+            self._remember(key, result, valid_until)
+
+        if isinstance(result, TokenRejected):
+            raise result
+        return result
+
+    def _remember(self, key, result, valid_until):
+        with self._lock:
+            self._cache[key] = (valid_until, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "remote_calls": self.remote_calls,
+                "jwks_refreshes": self.jwks.refreshes if self.jwks else 0
+            }
+
+    def _decode(self, token):
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise TokenRejected(f"Malformed token: {e}")
+
+        alg = header.get("alg")
+        if alg == "HS256" and self.secret:
+            signing_key = self.secret
+        elif alg in ("RS256", "ES256", "EdDSA") and self.jwks is not None:
+            jwk = self.jwks.get(header.get("kid"))
+            if jwk is None:
+                if self.remote_verify is not None:
+                    # JWKS unreachable or not rotated in yet
+                    return self._verify_remote(token)
+                raise TokenRejected("Unknown signing key")
+            signing_key = jwk.key
+        elif self.remote_verify is not None:
+            return self._verify_remote(token)
+        else:
+            raise TokenRejected(f"Unsupported token algorithm {alg}")
+
+        try:
+            return jwt.decode(
+                token,
+                signing_key,
+                algorithms=[alg],
+                audience=self.audience,
+                leeway=self.leeway_seconds,
+                options={"require": ["exp", "sub"]}
+            )
+        except jwt.ExpiredSignatureError:
+            raise TokenRejected("Token expired", expired=True)
+        except jwt.PyJWTError as e:
+            raise TokenRejected(f"Invalid token: {e}")
+
+    def _verify_remote(self, token):
+        try:
+            claims = jwt.decode(token, options={"verify_signature": False})
+        except jwt.PyJWTError as e:
+            raise TokenRejected(f"Malformed token: {e}")
+        if "exp" not in claims:
+            raise TokenRejected("Token has no exp claim")
+
+        self.remote_calls += 1
+        user = self.remote_verify(token)
+        return {**claims, "sub": user["id"], "email": user.get("email")}
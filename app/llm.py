@@ -1,9 +1,7 @@
-from langchain_groq import ChatGroq
-from langchain_classic.chains import LLMChain
 from langchain_classic.memory import ConversationBufferWindowMemory
-from app.prompt import prompt_template
+from app.prompt import SYSTEM_PROMPT, question_template
 from app.formatter import format_text
-from app.config import TEMPERATURE, GROQ_API_KEY, MAX_TOKENS
+from app.llm_backends import get_backend
 import re
 
 def build_memory():
@@ -14,33 +12,6 @@ def build_memory():
         return_messages=True
     )
 
-llm = ChatGroq(
-    groq_api_key=GROQ_API_KEY,
-    model_name="openai/gpt-oss-120b",
-    temperature=TEMPERATURE,
-    max_tokens=MAX_TOKENS
-)
-
-llm_chain = LLMChain(
-    llm=llm,
-    prompt=prompt_template
-)
-
-def clean_context(context: str) -> str:
-    """Clean and deduplicate context"""
-    context = re.sub(r'\n{3,}', '\n\n', context)
-    sentences = context.split('. ')
-    unique_sentences = []
-    seen = set()
-    
-    for sent in sentences:
-        sent_clean = sent.strip()
-        if sent_clean and sent_clean not in seen:
-            seen.add(sent_clean)
-            unique_sentences.append(sent_clean)
-    
-    return '. '.join(unique_sentences)
-
 def clean_answer(answer: str) -> str:
     """Remove duplicate lines from answer"""
     lines = answer.split('\n')
@@ -58,21 +29,29 @@ def clean_answer(answer: str) -> str:
     
     return '\n'.join(clean_lines)
 
-def get_llm_response(question: str, context: str, memory) -> str:
-    context = clean_context(context)
-    context = re.sub(r'(\w)\n(\w)', r'\1 \2', context)
-    context = re.sub(r'\n+', '\n', context)
-    context = context.replace("●", "-")
+def _prepare_llm_inputs(question: str, context: str, memory):
+    # context comes packed from app.context_packer: whole, whitespace-normalized chunks
     question_text = question.lower()
     match = re.search(r"in\s+(\d+)\s+words?", question_text)
     word_limit = int(match.group(1)) if match else None
-    
-    result = llm_chain.invoke({
+
+    inputs = {
         "chat_history": memory.load_memory_variables({})["chat_history"],
         "context": context,
         "question": question
-    })
-    answer = result["text"].strip()
+    }
+    # the system prompt first and byte-identical on every call, so the
+    # backend can reuse its KV cache and only process what follows
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": question_template.format(**inputs)}
+    ]
+    return messages, word_limit
+
+async def get_llm_response(question: str, context: str, memory, backend=None) -> str:
+    messages, word_limit = _prepare_llm_inputs(question, context, memory)
+
+    answer = (await get_backend(backend).complete(messages)).strip()
     print("="*50)
     print("RAW LLM OUTPUT:")
     print(answer)
@@ -88,4 +67,37 @@ def get_llm_response(question: str, context: str, memory) -> str:
         {"question": question},
         {"output": answer}
     )
-    return format_text(answer)
\ No newline at end of file
+    return format_text(answer)
+
+async def stream_llm_response(question: str, context: str, memory, backend=None):
+    """Yield the raw answer text as the backend generates it.
+
+    Stops at the word limit if the question asks for one ("in 50 words").
+    Formatting is left to the caller (see StreamingFormatter).
+    """
+    messages, word_limit = _prepare_llm_inputs(question, context, memory)
+
+    answer = ""
+    async for token in get_backend(backend).stream(messages):
+        if word_limit:
+            words = list(re.finditer(r"\S+", answer + token))
+            if len(words) > word_limit:
+                end = words[word_limit - 1].end()
+                token = (answer + token)[len(answer):end]
+                answer += token
+                if token:
+                    yield token
+                break
+
+        answer += token
+        yield token
+
+    print("="*50)
+    print("RAW LLM OUTPUT (streamed):")
+    print(answer)
+    print("="*50)
+
+    memory.save_context(
+        {"question": question},
+        {"output": clean_answer(answer.strip())}
+    )
@@ -0,0 +1,213 @@
+import os
+import asyncio
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+from app.llm_gateway import LLMGateway
+from app.prompt import SYSTEM_PROMPT
+from app.config import (
+    TEMPERATURE,
+    MAX_TOKENS,
+    GROQ_API_KEY,
+    GROQ_BASE_URL,
+    LLM_MODEL,
+    LLM_BACKEND,
+    LLM_CONTEXT_WINDOW,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+    LLM_MAX_RATE_LIMIT_WAIT,
+    LLM_TIMEOUT,
+    LOCAL_LLM_BASE_URL,
+    LOCAL_LLM_API_KEY,
+    LOCAL_LLM_MODEL,
+    LOCAL_LLM_CONTEXT_WINDOW,
+    LOCAL_LLM_MAX_TOKENS,
+    LOCAL_LLM_MAX_CONCURRENCY,
+    LLAMA_CPP_MODEL_PATH,
+    LLAMA_CPP_THREADS,
+    LLAMA_CPP_PREFIX_CACHE_MB
+)
+
+
+class LlamaCppBackend:
+    """A GGUF model run in process on CPU with llama-cpp-python (optional dependency).
+
+    Generation happens on one worker thread (a Llama object isn't thread
+    safe), so requests queue up. The KV state of evaluated prompts is kept
+    in a LlamaRAMCache and looked up by longest token prefix, and the
+    system prompt is evaluated once at load, so each question only pays
+    for the tokens after SYSTEM_PROMPT.
+    """
+
+    def __init__(self, model_path, context_window=8192, max_tokens=1024, temperature=0,
+                 threads=0, prefix_cache_mb=512):
+        self.model_path = model_path
+        self.context_window = context_window
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.threads = threads or os.cpu_count() or 1
+        self.prefix_cache_mb = prefix_cache_mb
+        self._llama = None
+        self._load_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llama-cpp")
+        self.requests = 0
+        self.errors = 0
+
+    def _get_llama(self):
+        if self._llama is None:
+            with self._load_lock:
+                if self._llama is None:
+                    from llama_cpp import Llama, LlamaRAMCache
+
+                    llama = Llama(
+                        model_path=self.model_path,
+                        n_ctx=self.context_window,
+                        n_threads=self.threads,
+                        verbose=False
+                    )
+                    llama.set_cache(LlamaRAMCache(capacity_bytes=self.prefix_cache_mb * 1024 * 1024))
+                    # evaluate the static system prompt now so the first question reuses it
+                    llama.create_chat_completion(
+                        messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": "Hi"}],
+                        max_tokens=1
+                    )
+                    print(f"✅ Loaded {self.model_path} for local generation")
+                    self._llama = llama
+        return self._llama
+
+    def _generate(self, messages, stream):
+        return self._get_llama().create_chat_completion(
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=stream
+        )
+
+    async def complete(self, messages):
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._executor, self._generate, messages, False)
+        except Exception:
+            self.errors += 1
+            raise
+        return result["choices"][0]["message"]["content"] or ""
+
+    async def stream(self, messages):
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        stop = threading.Event()
+
+        def produce():
+            chunks = None
+            try:
+                chunks = self._generate(messages, True)
+                for chunk in chunks:
+                    # the client went away: stop generating instead of finishing the answer
+                    if stop.is_set():
+                        break
+                    text = chunk["choices"][0]["delta"].get("content")
+                    if text:
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                if chunks is not None:
+                    chunks.close()
+
+        loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    self.errors += 1
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    async def aclose(self):
+        pass
+
+    def stats(self):
+        return {
+            "model_path": self.model_path,
+            "loaded": self._llama is not None,
+            "requests": self.requests,
+            "errors": self.errors
+        }
+
+
+def _build_backends():
+    backends = {
+        "groq": LLMGateway(
+            base_url=GROQ_BASE_URL,
+            api_key=GROQ_API_KEY,
+            model=LLM_MODEL,
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            max_concurrency=LLM_MAX_CONCURRENCY,
+            max_retries=LLM_MAX_RETRIES,
+            retry_base_delay=LLM_RETRY_BASE_DELAY,
+            retry_max_delay=LLM_RETRY_MAX_DELAY,
+            max_wait=LLM_MAX_RATE_LIMIT_WAIT,
+            timeout=LLM_TIMEOUT,
+            context_window=LLM_CONTEXT_WINDOW
+        )
+    }
+    if LOCAL_LLM_BASE_URL:
+        # llama.cpp's server keeps the KV cache of the common prompt prefix with cache_prompt;
+        # vLLM (--enable-prefix-caching) and Ollama ignore the field
+        backends["local"] = LLMGateway(
+            base_url=LOCAL_LLM_BASE_URL,
+            api_key=LOCAL_LLM_API_KEY,
+            model=LOCAL_LLM_MODEL,
+            temperature=TEMPERATURE,
+            max_tokens=LOCAL_LLM_MAX_TOKENS,
+            max_concurrency=LOCAL_LLM_MAX_CONCURRENCY,
+            max_retries=LLM_MAX_RETRIES,
+            retry_base_delay=LLM_RETRY_BASE_DELAY,
+            retry_max_delay=LLM_RETRY_MAX_DELAY,
+            max_wait=LLM_MAX_RATE_LIMIT_WAIT,
+            timeout=LLM_TIMEOUT * 5,
+            extra_body={"cache_prompt": True},
+            context_window=LOCAL_LLM_CONTEXT_WINDOW
+        )
+    if LLAMA_CPP_MODEL_PATH and importlib.util.find_spec("llama_cpp") is None:
+        print("⚠️ LLAMA_CPP_MODEL_PATH is set but llama-cpp-python isn't installed, llamacpp backend disabled")
+    elif LLAMA_CPP_MODEL_PATH:
+        backends["llamacpp"] = LlamaCppBackend(
+            LLAMA_CPP_MODEL_PATH,
+            context_window=LOCAL_LLM_CONTEXT_WINDOW,
+            max_tokens=LOCAL_LLM_MAX_TOKENS,
+            temperature=TEMPERATURE,
+            threads=LLAMA_CPP_THREADS,
+            prefix_cache_mb=LLAMA_CPP_PREFIX_CACHE_MB
+        )
+    if LLM_BACKEND not in backends:
+        raise RuntimeError(f"LLM_BACKEND={LLM_BACKEND} is not configured (available: {', '.join(backends)})")
+    return backends
+
+
+llm_backends = _build_backends()
+
+
+def get_backend(name=None):
+    """The backend called name, or the deployment's LLM_BACKEND; ValueError if it isn't configured"""
+    backend = llm_backends.get(name or LLM_BACKEND)
+    if backend is None:
+        raise ValueError(f"Unknown LLM backend {name!r}, available: {', '.join(llm_backends)}")
+    return backend
+
+
+async def close_backends():
+    for backend in llm_backends.values():
+        await backend.aclose()
@@ -0,0 +1,448 @@
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+
+import httpx
+
+from app.context_packer import token_counter
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value):
+    """Seconds in a Groq reset header ("7.66s", "2m59.56s", "120ms"); None if missing"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _UNITS[unit] for amount, unit in parts)
+
+
+def format_wait(seconds):
+    minutes, seconds = divmod(max(seconds, 0), 60)
+    return f"{int(minutes)}m{seconds:.2f}s"
+
+
+class LLMGatewayError(Exception):
+    """An upstream error after retries; the message keeps the status code and Groq's text"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class RateLimitBucket:
+    """One Groq limit (requests or tokens per window) as a token bucket.
+
+    Groq reports the limit, what is left and when it is full again in the
+    x-ratelimit-* headers of every response; the bucket takes those as the
+    truth and refills linearly in between. Until the first response it
+    doesn't limit anything.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.limit = None
+        self.remaining = None
+        self.rate = 0.0
+        self.updated = 0.0
+
+    def update(self, limit, remaining, reset_seconds, now):
+        if limit is None or remaining is None:
+            return
+        self.limit = limit
+        self.remaining = min(remaining, limit)
+        self.updated = now
+        if reset_seconds:
+            self.rate = (limit - self.remaining) / reset_seconds
+        elif self.remaining >= limit:
+            self.rate = 0.0
+
+    def available(self, now):
+        if self.limit is None:
+            return float("inf")
+        return min(self.limit, self.remaining + self.rate * (now - self.updated))
+
+    def wait_for(self, amount, now):
+        """Seconds until amount is available (inf if it never refills)"""
+        if self.limit is None:
+            return 0.0
+        missing = min(amount, self.limit) - self.available(now)
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, amount, now):
+        if self.limit is None:
+            return
+        self.remaining = self.available(now) - min(amount, self.limit)
+        self.updated = now
+
+    def stats(self, now):
+        if self.limit is None:
+            return None
+        return {"limit": self.limit, "available": round(self.available(now), 1)}
+
+
+class _SharedStream:
+    """Text parts of one upstream stream, replayed to every caller that asked for the same prompt"""
+
+    def __init__(self):
+        self.parts = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def push(self, part):
+        self.parts.append(part)
+        self._wake()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        i = 0
+        while True:
+            while i < len(self.parts):
+                yield self.parts[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class LLMGateway:
+    """Async client for an OpenAI-compatible chat completions API (Groq).
+
+    - at most max_concurrency upstream requests at a time;
+    - request and token buckets fed by Groq's x-ratelimit-* headers, so a
+      request waits for capacity instead of being sent into a 429 (up to
+      max_wait seconds, then it fails with the wait in the message);
+    - 429/5xx/connection errors are retried with full-jitter exponential
+      backoff, honouring retry-after;
+    - identical prompts in flight at the same time share one upstream call
+      (single-flight), for both complete() and stream(); a shared stream is
+      cancelled once every caller following it has gone away.
+    Any OpenAI-compatible server works (see app.llm_backends); extra_body
+    is merged into every request, e.g. {"cache_prompt": True} for llama.cpp.
+    Prompt and cached prompt tokens from the responses' usage are counted,
+    which shows how much of the static system prompt the provider reused.
+    The HTTP client and asyncio primitives are created in the running loop
+    on first use; close it with aclose() on shutdown.
+    """
+
+    def __init__(self, base_url, api_key, model, temperature=0, max_tokens=1024, max_concurrency=8,
+                 max_retries=4, retry_base_delay=0.5, retry_max_delay=20, max_wait=30, timeout=60,
+                 extra_body=None, context_window=131072):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.extra_body = extra_body or {}
+        self.context_window = context_window
+
+        self.requests_bucket = RateLimitBucket("requests")
+        self.tokens_bucket = RateLimitBucket("tokens")
+        self._blocked_until = 0.0
+        self._http = None
+        self._semaphore = None
+        self._limiter_lock = None
+        self._inflight = {}
+        self._streams = {}
+
+        self.requests = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.throttled = 0
+        self.cancelled_streams = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+
+    def _client(self):
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else {},
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._limiter_lock = asyncio.Lock()
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def _payload(self, messages, stream):
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": stream,
+            **self.extra_body
+        }
+        if stream:
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    def _record_usage(self, usage):
+        if not usage:
+            return
+        self.prompt_tokens += usage.get("prompt_tokens") or 0
+        self.cached_prompt_tokens += (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+    @staticmethod
+    def _key(payload):
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _record_limits(self, headers):
+        now = time.monotonic()
+
+        def number(name):
+            try:
+                return float(headers[name])
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        self.requests_bucket.update(
+            number("x-ratelimit-limit-requests"),
+            number("x-ratelimit-remaining-requests"),
+            parse_duration(headers.get("x-ratelimit-reset-requests")),
+            now
+        )
+        self.tokens_bucket.update(
+            number("x-ratelimit-limit-tokens"),
+            number("x-ratelimit-remaining-tokens"),
+            parse_duration(headers.get("x-ratelimit-reset-tokens")),
+            now
+        )
+
+    async def _acquire(self, cost):
+        """Wait until both buckets (and any retry-after) allow a request of cost tokens.
+
+        The wait is worked out under the lock but slept outside it, so a
+        large request waiting for the token bucket doesn't hold up small
+        ones; after the sleep the buckets are checked again.
+        """
+        started = time.monotonic()
+        throttled = False
+        while True:
+            async with self._limiter_lock:
+                now = time.monotonic()
+                wait = max(
+                    self._blocked_until - now,
+                    self.requests_bucket.wait_for(1, now),
+                    self.tokens_bucket.wait_for(cost, now)
+                )
+                if wait <= 0:
+                    self.requests_bucket.take(1, now)
+                    self.tokens_bucket.take(cost, now)
+                    return
+                if now - started + wait > self.max_wait:
+                    raise LLMGatewayError(
+                        f"Error code: 429 - rate limit reached, please try again in {format_wait(wait)}", status=429
+                    )
+            if not throttled:
+                self.throttled += 1
+                throttled = True
+            await asyncio.sleep(wait)
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.retry_base_delay)
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    async def _retry_or_raise(self, attempt, status, message, headers=None):
+        """Sleep before the next attempt, or raise if this error is final"""
+        retryable = status is None or status == 429 or status >= 500
+        if status == 429:
+            self.rate_limited += 1
+        if not retryable or attempt >= self.max_retries:
+            self.errors += 1
+            prefix = f"Error code: {status} - " if status else ""
+            raise LLMGatewayError(f"{prefix}{message}", status=status)
+
+        retry_after = parse_duration((headers or {}).get("retry-after"))
+        delay = self._backoff(attempt, retry_after)
+        self.retries += 1
+        print(f"⚠️ LLM request failed ({status or message}), retry {attempt + 1} in {delay:.1f}s")
+        if status == 429:
+            # every request waits in _acquire, not just this one
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        else:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _error_text(body):
+        try:
+            return json.loads(body)["error"]["message"]
+        except (ValueError, KeyError, TypeError):
+            return body.decode("utf-8", "replace")[:500] if isinstance(body, bytes) else str(body)[:500]
+
+    def _cost(self, messages):
+        """Tokens a request may use against the tokens-per-minute limit: the prompt plus the longest answer"""
+        return sum(token_counter.count(m["content"]) for m in messages) + self.max_tokens
+
+    async def complete(self, messages):
+        """The assistant's answer text for messages"""
+        self.requests += 1
+        payload = self._payload(messages, stream=False)
+        key = self._key(payload)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._complete(payload, self._cost(messages)))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.pop(key, None) if self._inflight.get(key) is done else None)
+        else:
+            self.coalesced += 1
+        # a caller going away must not cancel the call the others are waiting for
+        return await asyncio.shield(task)
+
+    async def _complete(self, payload, cost):
+        client = self._client()
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                await self._acquire(cost)
+                self.upstream_calls += 1
+                try:
+                    response = await client.post("/chat/completions", json=payload)
+                except httpx.HTTPError as e:
+                    status, message, headers = None, str(e) or type(e).__name__, None
+                else:
+                    self._record_limits(response.headers)
+                    if response.status_code == 200:
+                        body = response.json()
+                        self._record_usage(body.get("usage"))
+                        return body["choices"][0]["message"]["content"] or ""
+                    status, message, headers = response.status_code, self._error_text(response.content), response.headers
+            await self._retry_or_raise(attempt, status, message, headers)
+            attempt += 1
+
+    async def stream(self, messages):
+        """Yield the answer text as it is generated"""
+        self.requests += 1
+        payload = self._payload(messages, stream=True)
+        key = self._key(payload)
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _SharedStream()
+            self._streams[key] = shared
+            shared.task = asyncio.ensure_future(self._run_stream(key, shared, payload, self._cost(messages)))
+        else:
+            self.coalesced += 1
+        shared.followers += 1
+        try:
+            async for part in shared.follow():
+                yield part
+        finally:
+            shared.followers -= 1
+            if shared.followers == 0 and not shared.done:
+                # every client disconnected: stop generating (and paying for) the answer
+                self.cancelled_streams += 1
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+                shared.task.cancel()
+
+    async def _run_stream(self, key, shared, payload, cost):
+        try:
+            async for part in self._stream_upstream(payload, cost):
+                shared.push(part)
+            shared.finish()
+        except asyncio.CancelledError:
+            shared.finish(LLMGatewayError("Stream cancelled"))
+            raise
+        except Exception as e:
+            shared.finish(e)
+        finally:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    async def _stream_upstream(self, payload, cost):
+        client = self._client()
+        attempt = 0
+        while True:
+            started = False
+            async with self._semaphore:
+                await self._acquire(cost)
+                self.upstream_calls += 1
+                try:
+                    async with client.stream("POST", "/chat/completions", json=payload) as response:
+                        self._record_limits(response.headers)
+                        if response.status_code == 200:
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    break
+                                event = json.loads(data)
+                                # the last event carries usage (Groq: under x_groq)
+                                self._record_usage(event.get("usage") or (event.get("x_groq") or {}).get("usage"))
+                                choices = event.get("choices") or [{}]
+                                text = (choices[0].get("delta") or {}).get("content")
+                                if text:
+                                    started = True
+                                    yield text
+                            return
+                        status, message, headers = (
+                            response.status_code, self._error_text(await response.aread()), response.headers
+                        )
+                except httpx.HTTPError as e:
+                    if started:
+                        # part of the answer is already out; a retry would repeat it
+                        self.errors += 1
+                        raise LLMGatewayError(f"Stream interrupted: {e}")
+                    status, message, headers = None, str(e) or type(e).__name__, None
+            await self._retry_or_raise(attempt, status, message, headers)
+            attempt += 1
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "requests": self.requests,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight) + len(self._streams),
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "throttled": self.throttled,
+            "cancelled_streams": self.cancelled_streams,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "requests_bucket": self.requests_bucket.stats(now),
+            "tokens_bucket": self.tokens_bucket.stats(now)
+        }
@@ -0,0 +1,405 @@
+import os
+import time
+import uuid
+import random
+import socket
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+import httpx
+
+
+class MessageJournal:
+    """Write-behind log for chat messages.
+
+    append() stores the message in a local SQLite WAL file and returns at
+    once; a background thread inserts pending messages into the messages
+    table in batches. created_at is set when the message is appended, so
+    the order in Supabase is the order of the conversation even when a
+    flush is retried.
+
+    A chat whose oldest pending message keeps failing holds back its newer
+    messages (per-chat ordering) without blocking other chats. After
+    max_attempts the message is kept in the file as dead and logged.
+
+    Messages are sent with the service key, which skips RLS, so append()
+    must only be called for chats the user was shown to own (see
+    app.crud_async.insert_message). Without a key they go out with
+    the user's access token, which is only kept in memory (never in the
+    file). After a restart, or once the token has expired (401), a user's
+    messages wait until that user makes another request.
+
+    Before a batch is sent its rows are claimed for lease_seconds, so
+    several workers sharing the file never send the same rows. discard()
+    deletes unclaimed rows, and waits for claimed ones to be sent or
+    released, so nothing is re-inserted after a chat is deleted.
+    """
+
+    def __init__(self, path, rest_url, anon_key, service_key=None,
+                 batch_size=100, flush_interval=0.5, max_attempts=10, lease_seconds=60):
+        self.rest_url = rest_url
+        self.anon_key = anon_key
+        self.service_key = service_key
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.flushed = 0
+        self.failures = 0
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._http = None
+        # user_id -> latest access token, for flushing without a service key
+        self._tokens = {}
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_messages ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id TEXT NOT NULL,"
+            " chat_id TEXT NOT NULL,"
+            " role TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " created_at TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt REAL NOT NULL DEFAULT 0,"
+            " dead INTEGER NOT NULL DEFAULT 0,"
+            " claimed_by TEXT,"
+            " claimed_until REAL NOT NULL DEFAULT 0,"
+            " discarded INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pending_messages_chat ON pending_messages(chat_id, seq)")
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(pending_messages)")}
+        for name, ddl in (
+            ("claimed_by", "claimed_by TEXT"),
+            ("claimed_until", "claimed_until REAL NOT NULL DEFAULT 0"),
+            ("discarded", "discarded INTEGER NOT NULL DEFAULT 0")
+        ):
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE pending_messages ADD COLUMN {ddl}")
+
+        if "access_token" in columns:
+            # journals written by older versions stored access tokens; scrub them from the file
+            self._conn.execute("PRAGMA secure_delete=ON")
+            try:
+                self._conn.execute("ALTER TABLE pending_messages DROP COLUMN access_token")
+            except sqlite3.OperationalError:
+                self._conn.execute("UPDATE pending_messages SET access_token = NULL")
+            self._conn.commit()
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def append(self, user_id, chat_id, role, content, access_token=None):
+        if role not in ("user", "assistant"):
+            raise ValueError("Invalid role. Must be 'user' or 'assistant'.")
+
+        row = {
+            "user_id": str(user_id),
+            "chat_id": str(chat_id),
+            "role": role,
+            "content": content,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO pending_messages (user_id, chat_id, role, content, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (row["user_id"], row["chat_id"], role, content, row["created_at"])
+            )
+            self._conn.commit()
+            if access_token:
+                self._tokens[row["user_id"]] = access_token
+
+        self.start()
+        return row
+
+    def pending_for_chat(self, user_id, chat_id):
+        """The user's unsent messages in the chat; callers check the chat is theirs"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, chat_id, role, content, created_at FROM pending_messages"
+                " WHERE user_id = ? AND chat_id = ? AND dead = 0 AND discarded = 0 ORDER BY seq",
+                (str(user_id), str(chat_id))
+            ).fetchall()
+        return [
+            {"user_id": r[0], "chat_id": r[1], "role": r[2], "content": r[3], "created_at": r[4], "pending": True}
+            for r in rows
+        ]
+
+    def merge_pending(self, user_id, chat_id, rows):
+        """Add the user's messages that are not in the messages table yet to rows read from it"""
+        pending = self.pending_for_chat(user_id, chat_id)
+        if not pending:
+            return rows
+
+        # a batch can be inserted but not yet removed from the journal
+        stored = {(r.get("role"), r.get("content"), _parse_time(r.get("created_at"))) for r in rows}
+        merged = list(rows) + [
+            p for p in pending
+            if (p["role"], p["content"], _parse_time(p["created_at"])) not in stored
+        ]
+        return merged
+
+    def discard(self, user_id, chat_id=None, timeout=None):
+        """Drop pending messages of a deleted chat (or of all the user's chats).
+
+        Rows a flusher is sending right now are marked so they are never
+        retried; this waits (up to the lease) until they are sent or
+        released, so the caller can then delete the chat's stored messages.
+        """
+        where = "user_id = ?" if chat_id is None else "user_id = ? AND chat_id = ?"
+        params = (str(user_id),) if chat_id is None else (str(user_id), str(chat_id))
+        deadline = time.monotonic() + (self.lease_seconds if timeout is None else timeout)
+        while True:
+            now = time.time()
+            with self._lock:
+                self._conn.execute(f"DELETE FROM pending_messages WHERE {where} AND claimed_until < ?", params + (now,))
+                self._conn.execute(f"UPDATE pending_messages SET discarded = 1 WHERE {where}", params)
+                in_flight = self._conn.execute(
+                    f"SELECT COUNT(*) FROM pending_messages WHERE {where}", params
+                ).fetchone()[0]
+                self._conn.commit()
+            if not in_flight or time.monotonic() >= deadline:
+                return in_flight
+            time.sleep(0.05)
+
+    def stats(self):
+        with self._lock:
+            pending, dead, in_flight = self._conn.execute(
+                "SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0),"
+                " COALESCE(SUM(claimed_until >= ?), 0) FROM pending_messages",
+                (time.time(),)
+            ).fetchone()
+        return {
+            "pending": pending,
+            "dead": dead,
+            "in_flight": in_flight,
+            "users_with_token": len(self._tokens),
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "last_error": self.last_error
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="message-journal", daemon=True)
+            self._thread.start()
+        if not self.service_key:
+            pending = self.stats()["pending"]
+            if pending and not self._tokens:
+                print(f"⚠️ {pending} journaled messages wait for their users' next request "
+                      "(set SUPABASE_SERVICE_KEY to send them on start)")
+
+    def close(self, timeout=10.0):
+        """Stop the flusher after trying to flush everything that is pending"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.flush(ignore_backoff=True):
+            pass
+
+        left = self.stats()["pending"]
+        if left:
+            print(f"⚠️ {left} messages still pending in the journal, they will be sent on next start")
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+    def flush(self, ignore_backoff=False):
+        """Send one batch; returns how many messages were stored"""
+        with self._flush_lock:
+            batch = self._next_batch(ignore_backoff)
+            if not batch:
+                return 0
+
+            if self.service_key:
+                try:
+                    self._post(batch, self.service_key)
+                    self._done(batch)
+                    return len(batch)
+                except Exception as e:
+                    self._note_error(e)
+
+            # one chat at a time, so a bad chat only delays itself
+            stored = 0
+            by_chat = {}
+            for row in batch:
+                by_chat.setdefault(row["chat_id"], []).append(row)
+            for rows in by_chat.values():
+                user_id = rows[0]["user_id"]
+                token = self.service_key or self._tokens.get(user_id)
+                if not self._renew(rows):
+                    continue
+                try:
+                    self._post(rows, token)
+                    self._done(rows)
+                    stored += len(rows)
+                except httpx.HTTPStatusError as e:
+                    self._note_error(e)
+                    if e.response.status_code == 401 and not self.service_key:
+                        # expired session: wait for the user's next token instead of burning attempts
+                        if self._tokens.get(user_id) == token:
+                            self._tokens.pop(user_id, None)
+                        self._release(rows)
+                    else:
+                        self._retry_later(rows)
+                except Exception as e:
+                    self._note_error(e)
+                    self._retry_later(rows)
+            return stored
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                while not self._stop.is_set() and self.flush() >= self.batch_size:
+                    pass
+            except Exception as e:
+                self._note_error(e)
+
+    def _next_batch(self, ignore_backoff):
+        """Claim up to batch_size sendable rows, oldest first and in order within each chat"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT seq, user_id, chat_id, role, content, created_at, attempts, next_attempt,"
+                    " claimed_by, claimed_until, discarded"
+                    " FROM pending_messages WHERE dead = 0 ORDER BY seq LIMIT ?",
+                    (self.batch_size * 5,)
+                ).fetchall()
+
+                batch = []
+                blocked = set()
+                for (seq, user_id, chat_id, role, content, created_at, attempts, next_attempt,
+                     claimed_by, claimed_until, discarded) in rows:
+                    if chat_id in blocked:
+                        continue
+                    # being sent by another worker, or waiting for its user's next token
+                    in_flight = claimed_until >= now and claimed_by != self.worker_id
+                    no_token = not self.service_key and user_id not in self._tokens
+                    backing_off = next_attempt > now and not ignore_backoff
+                    if discarded or in_flight or no_token or backing_off:
+                        blocked.add(chat_id)
+                        continue
+                    batch.append({
+                        "seq": seq, "user_id": user_id, "chat_id": chat_id, "role": role,
+                        "content": content, "created_at": created_at, "attempts": attempts
+                    })
+                    if len(batch) >= self.batch_size:
+                        break
+
+                self._conn.executemany(
+                    "UPDATE pending_messages SET claimed_by = ?, claimed_until = ? WHERE seq = ?",
+                    [(self.worker_id, now + self.lease_seconds, row["seq"]) for row in batch]
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return batch
+
+    def _renew(self, rows):
+        """Extend the claim on rows before sending them; False if the chat was discarded meanwhile"""
+        with self._lock:
+            self._conn.execute("DELETE FROM pending_messages WHERE discarded = 1 AND claimed_until < ?", (time.time(),))
+            cursor = self._conn.executemany(
+                "UPDATE pending_messages SET claimed_until = ?"
+                " WHERE seq = ? AND claimed_by = ? AND discarded = 0",
+                [(time.time() + self.lease_seconds, r["seq"], self.worker_id) for r in rows]
+            )
+            renewed = cursor.rowcount
+            if renewed < len(rows):
+                self._conn.executemany(
+                    "DELETE FROM pending_messages WHERE seq = ? AND discarded = 1", [(r["seq"],) for r in rows]
+                )
+            self._conn.commit()
+        return renewed == len(rows)
+
+    def _release(self, rows):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE pending_messages SET claimed_by = NULL, claimed_until = 0 WHERE seq = ? AND claimed_by = ?",
+                [(r["seq"], self.worker_id) for r in rows]
+            )
+            self._conn.execute("DELETE FROM pending_messages WHERE discarded = 1 AND claimed_until = 0")
+            self._conn.commit()
+
+    def _post(self, rows, token):
+        if self._http is None:
+            self._http = httpx.Client(base_url=self.rest_url, timeout=10)
+        res = self._http.post(
+            "/messages",
+            json=[
+                {k: row[k] for k in ("user_id", "chat_id", "role", "content", "created_at")}
+                for row in rows
+            ],
+            headers={
+                "apikey": self.anon_key,
+                "Authorization": f"Bearer {token}",
+                "Prefer": "return=minimal"
+            }
+        )
+        res.raise_for_status()
+
+    def _done(self, rows):
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending_messages WHERE seq = ?", [(r["seq"],) for r in rows])
+            self._conn.commit()
+        self.flushed += len(rows)
+
+    def _retry_later(self, rows):
+        row = rows[0]
+        attempts = row["attempts"] + 1
+        delay = min(60.0, 2 ** attempts) * random.uniform(0.5, 1.0)
+        dead = attempts >= self.max_attempts
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pending_messages SET attempts = ?, next_attempt = ?, dead = ? WHERE seq = ?",
+                (attempts, time.time() + delay, int(dead), row["seq"])
+            )
+            self._conn.commit()
+        self._release(rows)
+        if dead:
+            print(f"❌ Giving up on message {row['seq']} for chat {row['chat_id']} after {attempts} attempts")
+
+    def _note_error(self, e):
+        self.failures += 1
+        self.last_error = str(e)[:300]
+        print(f"⚠️ Message flush failed: {e}")
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return value
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
@@ -0,0 +1,98 @@
+"""Convert existing chat indexes to another storage mode.
+
+Usage:
+    python -m app.migrate_index_storage --mode sq8 [--user USER_ID] [--chat CHAT_ID]
+                                        [--min-vectors 0] [--dry-run]
+                                        [--exact-rerank | --no-exact-rerank]
+
+Walks FAISS_PATH (user_<id>/chat_<id>/) and rewrites every matching chat
+as a new snapshot with set_index_storage, so it is safe to run while the
+server is up: readers keep using the old snapshot until CURRENT is swapped.
+--mode float32 turns compressed chats back into exact ones.
+--no-exact-rerank drops the float32 vectors of sq8/pq chats, so their
+snapshots shrink to the codes; without either flag a chat keeps its setting. Rewriting a
+chat also converts a pickled (index.pkl) snapshot to the chunk store.
+"""
+import os
+import argparse
+
+from app.config import FAISS_PATH
+from app.faiss_db import (
+    set_index_storage,
+    index_rebuilder,
+    get_current_index_path,
+    load_index_manifest
+)
+from app.quantized_store import STORAGE_MODES
+
+
+def folder_bytes(path):
+    if not path:
+        return 0
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if os.path.isfile(os.path.join(path, name))
+    )
+
+
+def iter_chats(user=None, chat=None):
+    if not os.path.isdir(FAISS_PATH):
+        return
+    for user_dir in sorted(os.listdir(FAISS_PATH)):
+        if not user_dir.startswith("user_") or (user and user_dir != f"user_{user}"):
+            continue
+        for chat_dir in sorted(os.listdir(os.path.join(FAISS_PATH, user_dir))):
+            if not chat_dir.startswith("chat_") or (chat and chat_dir != f"chat_{chat}"):
+                continue
+            yield user_dir[len("user_"):], chat_dir[len("chat_"):]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", required=True, choices=STORAGE_MODES)
+    parser.add_argument("--user")
+    parser.add_argument("--chat")
+    parser.add_argument("--min-vectors", type=int, default=0, help="only chats with at least this many chunks")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--exact-rerank", action=argparse.BooleanOptionalAction, default=None,
+                        help="keep float32 vectors of sq8/pq chats for exact re-ranking")
+    args = parser.parse_args()
+
+    migrated = skipped = failed = 0
+    before_total = after_total = 0
+    for user_id, chat_id in iter_chats(args.user, args.chat):
+        manifest = load_index_manifest(user_id, chat_id) or {}
+        if manifest.get("total_chunks", args.min_vectors) < args.min_vectors:
+            skipped += 1
+            continue
+
+        before = folder_bytes(get_current_index_path(user_id, chat_id))
+        if args.dry_run:
+            print(f"would convert {user_id}/{chat_id} ({manifest.get('storage', '?')}, {before / 1e6:.1f} MB)")
+            continue
+
+        try:
+            result = set_index_storage(user_id, chat_id, args.mode, args.exact_rerank)
+            # float32 chats big enough for HNSW/IVF are rebuilt in the background
+            index_rebuilder.join()
+        except Exception as e:
+            print(f"❌ {user_id}/{chat_id}: {e}")
+            failed += 1
+            continue
+        if result is None:
+            skipped += 1
+            continue
+
+        after = folder_bytes(get_current_index_path(user_id, chat_id))
+        before_total += before
+        after_total += after
+        migrated += 1
+        print(f"✅ {user_id}/{chat_id}: {result.get('effective_storage')} ({result.get('index_type')}), {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB on disk")
+
+    print(f"{migrated} migrated, {skipped} skipped, {failed} failed; "
+          f"{before_total / 1e6:.1f} MB -> {after_total / 1e6:.1f} MB on disk")
+
+
+if __name__ == "__main__":
+    main()
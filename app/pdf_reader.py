@@ -2,52 +2,102 @@
 
 
 
-from langchain_community.document_loaders import PyPDFLoader
 import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
 
-from app.config import MAX_PAGES, MIN_PAGES 
+from app.config import MAX_PAGES, MIN_PAGES, PDF_EXTRACT_WORKERS, PDF_PAGES_PER_TASK
+
+_executor = None
+
+# clean_pdf_text used to be eleven re.sub passes. These patterns give the same
+# output in fewer passes, and each one starts on a literal ("\n", ".", "  ") so
+# the regex engine can jump between candidates instead of testing every char.
+_LIST_NUMBER_BREAK = re.compile(r'\.(?<=\d\.)\s*\n\s*(?=[A-Za-z])')
+_LINE_JOIN = re.compile(r'\n(?:\s*(:)\s*|(?<=[A-Za-z]\n)(?=[a-z]))')
+_TITLE_LINE = re.compile(r'\n([A-Z][a-zA-Z ]+)\n')
+_LONE_NEWLINE = re.compile(r'\n(?<!\n\n)(?!\n)(?!\d+\.)')
+_LIST_ITEM = re.compile(r'\s(\d+\.\s)')
+_SPACE_RUN = re.compile(r'  +')
+_LIST_HEADING = re.compile(r'\n(\d+\.)\s*\n\s*(?=[A-Z])')
+_FIRST_LIST_HEADING = re.compile(r'(\d+\.)\s*\n\s*(?=[A-Z])')
+_NEWLINE_RUN = re.compile(r'\n+')
 
 def clean_pdf_text(text: str):
-    text = re.sub(r'(\d+)\.\s*\n\s*([A-Za-z])', r'\1. \2', text)
-    text = re.sub(r'\n\s*:\s*', ': ', text)
-    text = re.sub(r'([A-Za-z])\n([a-z])', r'\1 \2', text)
-    text = re.sub(r'\n([A-Z][a-zA-Z ]+)\n', r' \1 ', text)
-    text = re.sub(r'([a-z])\n([a-zA-Z])', r'\1 \2', text)
-    text = re.sub(r'(?<!\n)\n(?!\n)(?!\d+\.)', ' ', text)
-    text = re.sub(r'\s(\d+\.\s)', r'\n\1', text)
-    text = re.sub(r'\n+', '\n', text)
-    text = re.sub(r'[ \t]+', ' ', text)
-    text = re.sub(r'^(\d+)\.\s*\n\s*([A-Z][A-Za-z ]+)', r'\1. \2', text, flags=re.MULTILINE)
-    text = re.sub(r'(?<!\n)\n(?!\n)', ' ', text)
+    # "3.\n Title" -> "3. Title"
+    text = _LIST_NUMBER_BREAK.sub('. ', text)
+    # "\n : value" -> ": value", "word\nword" -> "word word"
+    text = _LINE_JOIN.sub(r'\1 ', text)
+    text = _TITLE_LINE.sub(r' \1 ', text)
+    text = _LONE_NEWLINE.sub(' ', text)
+    # every "N. " list item starts on its own line
+    text = _LIST_ITEM.sub(r'\n\1', text)
+    text = _SPACE_RUN.sub(' ', text.replace('\t', ' '))
+
+    match = _FIRST_LIST_HEADING.match(text)
+    if match:
+        text = match.group(1) + ' ' + text[match.end():]
+    text = _LIST_HEADING.sub(r'\n\1 ', text)
+
+    text = _NEWLINE_RUN.sub(' ', text)
     return text.strip()
 
-def load_pdf(file_path: str):
-    loader = PyPDFLoader(file_path)
-    docs = loader.load()
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn, not fork: the server process already runs torch and worker threads
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_EXTRACT_WORKERS or None,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
 
-    if not docs:
-        return None
+def get_pdf_page_count(file_path: str):
+    """Read the page count from the PDF's page tree and enforce the page limits"""
+    total_pages = len(PdfReader(file_path).pages)
 
-    
-    total_pages = len(docs)
     if total_pages > MAX_PAGES:
         raise ValueError(f"Limit Error: This PDF has {total_pages} pages, max limit is {MAX_PAGES}.")
     
     if total_pages < MIN_PAGES:
         raise ValueError(f"Error: PDF must have at least {MIN_PAGES} page.")
 
+    return total_pages
+
+def _extract_page_range(file_path: str, start: int, end: int):
+    """Runs in a worker process: extract and clean pages [start, end)"""
+    reader = PdfReader(file_path)
     pages = []
-    for doc in docs:
-        if doc.page_content:
-            clean_text = clean_pdf_text(doc.page_content)
-
-            page_num = doc.metadata.get("page")
-            if page_num is None:
-                page_num = 0
-            
-            print(f"📄 Page {page_num + 1} extracted, length: {len(clean_text)} chars")
+    for page_num in range(start, end):
+        text = reader.pages[page_num].extract_text(extraction_mode="plain").strip()
+        if text:
             pages.append({
-                "text": clean_text,
+                "text": clean_pdf_text(text),
                 "page": page_num
             })
-    return pages
\ No newline at end of file
+    return pages
+
+def iter_pdf_pages(file_path: str, total_pages: int = None):
+    """Yield cleaned pages in order while later page ranges are still being parsed"""
+    if total_pages is None:
+        total_pages = get_pdf_page_count(file_path)
+
+    executor = _get_executor()
+    futures = [
+        executor.submit(_extract_page_range, file_path, start, min(start + PDF_PAGES_PER_TASK, total_pages))
+        for start in range(0, total_pages, PDF_PAGES_PER_TASK)
+    ]
+
+    try:
+        for future in futures:
+            for page in future.result():
+                print(f"📄 Page {page['page'] + 1} extracted, length: {len(page['text'])} chars")
+                yield page
+    finally:
+        for future in futures:
+            future.cancel()
+
+def load_pdf(file_path: str):
+    pages = list(iter_pdf_pages(file_path))
+    return pages or None
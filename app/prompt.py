@@ -47,12 +47,9 @@ Your goal is to provide highly structured, professional, and accurate answers ba
 Return ONLY the final formatted HTML answer. Be concise and professional.
 """
 
-prompt_template = PromptTemplate(
-    input_variables=["chat_history", "context", "question"],
-    template="""
-{system_prompt}
-
-Conversation History:
+# everything after the system prompt; the system prompt goes first as its own
+# message and never changes, so providers can reuse its KV cache (prefix caching)
+QUESTION_TEMPLATE = """Conversation History:
 {chat_history}
 
 Context:
@@ -62,6 +59,18 @@ Question:
 {question}
 
 Answer (concise, professional, no repetition):
-""",
+"""
+
+question_template = PromptTemplate(
+    input_variables=["chat_history", "context", "question"],
+    template=QUESTION_TEMPLATE
+)
+
+prompt_template = PromptTemplate(
+    input_variables=["chat_history", "context", "question"],
+    template="""
+{system_prompt}
+
+""" + QUESTION_TEMPLATE,
     partial_variables={"system_prompt": SYSTEM_PROMPT}
 )
@@ -0,0 +1,214 @@
+import os
+import pickle
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+EXACT_VECTORS_FILE = "vectors.npy"
+STORAGE_MODES = ("float32", "sq8", "pq")
+# PQ codebooks need far more training points than SQ8 ranges; smaller chats get SQ8
+PQ_MIN_VECTORS = 10000
+
+
+def all_vectors(index):
+    """Every vector of a flat, HNSW or IVF index, in position order"""
+    if hasattr(index, "nprobe"):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def build_quantizer(vectors, mode, pq_m):
+    """An SQ8 or PQ index trained on and filled with vectors (L2)"""
+    n, d = vectors.shape
+    if mode == "pq" and (d % pq_m or n < PQ_MIN_VECTORS):
+        print(f"⚠️ PQ needs {PQ_MIN_VECTORS} vectors and d divisible by {pq_m}, using SQ8 for {n} vectors")
+        mode = "sq8"
+
+    if mode == "pq":
+        index = faiss.IndexPQ(d, pq_m, 8, faiss.METRIC_L2)
+    else:
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def rerank(exact, candidates, query, k):
+    """Exact squared-L2 order of the candidate positions; returns (positions, distances)"""
+    if len(candidates) == 0:
+        return candidates, np.empty(0, dtype=np.float32)
+    positions = np.sort(candidates)  # sorted reads are kinder to a memory-mapped file
+    rows = np.asarray(exact[positions], dtype=np.float32)
+    distances = ((rows - query) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:k]
+    return positions[order], distances[order]
+
+
+class QuantizedFAISS(FAISS):
+    """FAISS vectorstore that keeps compressed (SQ8 or PQ) codes in memory.
+
+    The index searched in RAM holds 1 byte (SQ8) or pq_m/d bytes (PQ) per
+    dimension instead of 4. The float32 vectors are saved in vectors.npy
+    and memory-mapped on load; a search takes rerank_factor * k candidates
+    from the compressed index and orders them by exact distance from those
+    rows, so scores are the same L2 distances the flat index returns. Only
+    the candidate rows are read from the file after loading.
+
+    index.faiss holds the quantizer with its codes, so loading doesn't
+    encode them again. With exact re-ranking a snapshot takes the float32
+    vectors.npy plus the codes, more disk than a float32 one. With
+    exact_rerank=False there is no vectors.npy: results are ordered by the
+    compressed distances, and disk use drops to the codes (about 1/4 of
+    float32 for SQ8, pq_m/(4*d) for PQ).
+    """
+
+    def __init__(self, *args, rerank_factor=4, pq_rerank_factor=10, exact_rerank=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sq8_rerank_factor = rerank_factor
+        self.pq_rerank_factor = pq_rerank_factor
+        self.exact_rerank = exact_rerank
+        self._exact = np.empty((0, self.index.d), dtype=np.float32) if exact_rerank else None
+        self._added = []
+        self.encoded_on_load = 0
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, mode, pq_m, rerank_factor=4, pq_rerank_factor=10, exact_rerank=True):
+        if vectorstore.distance_strategy != DistanceStrategy.EUCLIDEAN_DISTANCE:
+            raise ValueError("Compressed storage only supports Euclidean distance")
+        vectors = all_vectors(vectorstore.index)
+        store = cls(
+            vectorstore.embedding_function,
+            build_quantizer(vectors, mode, pq_m),
+            vectorstore.docstore,
+            vectorstore.index_to_docstore_id,
+            normalize_L2=vectorstore._normalize_L2,
+            rerank_factor=rerank_factor,
+            pq_rerank_factor=pq_rerank_factor,
+            exact_rerank=exact_rerank
+        )
+        if exact_rerank:
+            store._exact = vectors
+        return store
+
+    @property
+    def storage_mode(self):
+        return "pq" if hasattr(self.index, "pq") else "sq8"
+
+    @property
+    def rerank_factor(self):
+        return self.pq_rerank_factor if self.storage_mode == "pq" else self.sq8_rerank_factor
+
+    def exact_vectors(self):
+        """All float32 vectors; memory-mapped rows plus vectors added since loading.
+
+        Without exact re-ranking these are decoded from the codes, so only
+        approximately the embeddings.
+        """
+        if not self.exact_rerank:
+            return self.index.reconstruct_n(0, self.index.ntotal)
+        if not self._added:
+            return self._exact
+        return np.concatenate([np.asarray(self._exact), *self._added])
+
+    def vectors_at(self, positions):
+        """float32 vectors at positions (decoded from the codes without exact re-ranking)"""
+        if not self.exact_rerank:
+            return np.vstack([self.index.reconstruct(int(p)) for p in positions])
+        exact = self._exact
+        if self._added and len(positions) and max(positions) >= len(exact):
+            exact = self.exact_vectors()
+        return np.asarray(exact[np.asarray(positions, dtype=np.int64)], dtype=np.float32)
+
+    def drop_exact_vectors(self):
+        """Stop re-ranking exactly; the next save writes no vectors.npy"""
+        self.exact_rerank = False
+        self._exact = None
+        self._added = []
+
+    def to_flat(self):
+        flat = faiss.IndexFlatL2(self.index.d)
+        flat.add(np.ascontiguousarray(self.exact_vectors(), dtype=np.float32))
+        return FAISS(
+            self.embedding_function,
+            flat,
+            self.docstore,
+            self.index_to_docstore_id,
+            normalize_L2=self._normalize_L2
+        )
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        text_embeddings = list(text_embeddings)
+        vectors = np.array([vector for _, vector in text_embeddings], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        result = super().add_embeddings(text_embeddings, metadatas=metadatas, ids=ids, **kwargs)
+        if self.exact_rerank:
+            self._added.append(vectors)
+        return result
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        return self.add_embeddings(zip(texts, self._embed_documents(texts)), metadatas=metadatas, ids=ids)
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, fetch_k=20, **kwargs):
+        if filter is not None or not self.exact_rerank:
+            return super().similarity_search_with_score_by_vector(embedding, k, filter, fetch_k, **kwargs)
+
+        query = np.array([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(query)
+        _, found = self.index.search(query, max(k, k * self.rerank_factor))
+        candidates = found[0][found[0] >= 0]
+
+        exact = self._exact
+        if self._added and len(candidates) and candidates.max() >= len(exact):
+            exact = self.exact_vectors()
+        positions, distances = rerank(exact, candidates, query[0], k)
+
+        docs = [
+            (self.docstore.search(self.index_to_docstore_id[int(i)]), score)
+            for i, score in zip(positions, distances)
+        ]
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            docs = [(doc, score) for doc, score in docs if score <= score_threshold]
+        return docs
+
+    def write_vectors(self, folder_path, index_name="index"):
+        """Write the compressed index (quantizer and codes) and, with exact re-ranking, vectors.npy"""
+        os.makedirs(folder_path, exist_ok=True)
+        faiss.write_index(self.index, os.path.join(folder_path, f"{index_name}.faiss"))
+        if not self.exact_rerank:
+            return
+
+        path = os.path.join(folder_path, EXACT_VECTORS_FILE)
+        np.save(path, np.asarray(self.exact_vectors(), dtype=np.float32))
+        # from now on read the saved file instead of keeping the rows in RAM
+        self._exact = np.load(path, mmap_mode="r")
+        self._added = []
+
+    def attach_vectors(self, folder_path):
+        """Memory-map vectors.npy; encodes codes only for snapshots saved without them.
+
+        A snapshot without vectors.npy was saved without exact re-ranking.
+        """
+        path = os.path.join(folder_path, EXACT_VECTORS_FILE)
+        if not os.path.exists(path):
+            self.drop_exact_vectors()
+            return self
+        self._exact = np.load(path, mmap_mode="r")
+        self.encoded_on_load = len(self._exact) - self.index.ntotal
+        for start in range(self.index.ntotal, len(self._exact), 65536):
+            self.index.add(np.ascontiguousarray(self._exact[start:start + 65536]))
+        return self
+
+    def save_local(self, folder_path, index_name="index"):
+        self.write_vectors(folder_path, index_name)
+        with open(os.path.join(folder_path, f"{index_name}.pkl"), "wb") as f:
+            pickle.dump((self.docstore, self.index_to_docstore_id), f)
+
+    @classmethod
+    def load_local(cls, folder_path, embeddings, index_name="index", **kwargs):
+        return super().load_local(folder_path, embeddings, index_name, **kwargs).attach_vectors(folder_path)
@@ -0,0 +1,133 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from app.config import RERANKER_MODEL, RERANK_BATCH_SIZE, RERANK_TIME_BUDGET_MS, RERANK_CACHE_SIZE
+from app.embedding_cache import normalize_chunk_text
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class CrossEncoderReranker:
+    """Re-orders retrieved chunks with a local cross-encoder on CPU.
+
+    (question, chunk) pairs are scored in batches of batch_size; once
+    time_budget_ms is used up the remaining chunks keep their retrieval
+    order after the scored ones, so a slow model can't hold up /ask.
+    Scores are cached by (question hash, chunk text hash), which covers
+    repeated and regenerated questions without re-running the model.
+    The model is loaded on first use; with no model_name the stage is off.
+    """
+
+    def __init__(self, model_name, batch_size=16, time_budget_ms=300, max_entries=20000):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.time_budget_ms = time_budget_ms
+        self.max_entries = max_entries
+        self._model = None
+        self._load_failed = False
+        self._load_lock = threading.Lock()
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.calls = 0
+        self.over_budget = 0
+        self.total_ms = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.model_name) and not self._load_failed
+
+    def _get_model(self):
+        if self._model is None and not self._load_failed:
+            with self._load_lock:
+                if self._model is None and not self._load_failed:
+                    try:
+                        from sentence_transformers import CrossEncoder
+                        self._model = CrossEncoder(self.model_name, device="cpu")
+                        print(f"✅ Reranker {self.model_name} loaded")
+                    except Exception as e:
+                        print(f"⚠️ Reranker {self.model_name} could not be loaded, reranking is off: {e}")
+                        self._load_failed = True
+        return self._model
+
+    def rerank(self, question, docs, top_n=None):
+        """docs best first by cross-encoder score (first top_n); unchanged if the stage is off"""
+        if not self.enabled or not docs:
+            return docs[:top_n] if top_n else docs
+        model = self._get_model()
+        if model is None:
+            return docs[:top_n] if top_n else docs
+
+        start = time.perf_counter()
+        question_key = _hash(normalize_chunk_text(question))
+        keys = [(question_key, _hash(doc.page_content)) for doc in docs]
+
+        scores = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                    scores[i] = score
+            self.hits += len(scores)
+            self.misses += len(docs) - len(scores)
+
+        missing = [i for i in range(len(docs)) if i not in scores]
+        over_budget = False
+        for batch_start in range(0, len(missing), self.batch_size):
+            if (time.perf_counter() - start) * 1000 > self.time_budget_ms:
+                over_budget = True
+                break
+            batch = missing[batch_start:batch_start + self.batch_size]
+            predicted = model.predict(
+                [(question, docs[i].page_content) for i in batch],
+                batch_size=self.batch_size,
+                show_progress_bar=False
+            )
+            with self._lock:
+                for i, score in zip(batch, predicted):
+                    scores[i] = float(score)
+                    self._scores[keys[i]] = float(score)
+                while len(self._scores) > self.max_entries:
+                    self._scores.popitem(last=False)
+                    self.evictions += 1
+
+        # scored chunks by score, the rest (budget ran out) in retrieval order after them
+        order = sorted(scores, key=scores.get, reverse=True)
+        order += [i for i in range(len(docs)) if i not in scores]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            if over_budget:
+                self.over_budget += 1
+        print(f"🎯 Reranked {len(scores)}/{len(docs)} chunks in {elapsed_ms:.0f}ms")
+
+        reranked = [docs[i] for i in order]
+        return reranked[:top_n] if top_n else reranked
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name or None,
+                "enabled": self.enabled,
+                "loaded": self._model is not None,
+                "calls": self.calls,
+                "avg_ms": round(self.total_ms / self.calls, 1) if self.calls else 0.0,
+                "over_budget": self.over_budget,
+                "entries": len(self._scores),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+
+reranker = CrossEncoderReranker(RERANKER_MODEL, RERANK_BATCH_SIZE, RERANK_TIME_BUDGET_MS, RERANK_CACHE_SIZE)
@@ -0,0 +1,90 @@
+import numpy as np
+
+from app.chunk_store import ChunkStore
+from app.quantized_store import QuantizedFAISS
+
+
+def _positions(vectorstore, docs):
+    """FAISS position of every doc (None if it can't be found)"""
+    store = vectorstore.docstore
+    positions = []
+    reverse = None
+    for doc in docs:
+        doc_id = doc.id
+        if isinstance(store, ChunkStore) and doc_id and doc_id.isdigit() and int(doc_id) < store.count:
+            positions.append(int(doc_id))
+            continue
+        if reverse is None:
+            # chunks added since loading or a pickled docstore: look the id up
+            reverse = {v: k for k, v in vectorstore.index_to_docstore_id.items()}
+        positions.append(reverse.get(doc_id))
+    return positions
+
+
+def candidate_vectors(vectorstore, docs):
+    """Normalized float32 vectors of retrieved docs, read back from the index instead of re-embedding"""
+    positions = _positions(vectorstore, docs)
+    index = vectorstore.index
+    vectors = np.zeros((len(docs), index.d), dtype=np.float32)
+
+    found = [i for i, p in enumerate(positions) if p is not None]
+    if found:
+        ids = np.asarray([positions[i] for i in found], dtype=np.int64)
+        if isinstance(vectorstore, QuantizedFAISS):
+            vectors[found] = vectorstore.vectors_at(ids)
+        else:
+            if hasattr(index, "nprobe") and not index.direct_map.type:
+                index.make_direct_map()
+            vectors[found] = np.vstack([index.reconstruct(int(p)) for p in ids])
+
+    missing = [i for i, p in enumerate(positions) if p is None]
+    if missing:
+        vectors[missing] = np.asarray(
+            vectorstore.embedding_function.embed_documents([docs[i].page_content for i in missing]),
+            dtype=np.float32
+        )
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def drop_near_duplicates(docs, vectors, threshold):
+    """Keep docs in order, skipping any whose cosine similarity to a kept one is above threshold.
+
+    Returns (docs, vectors) of the kept ones.
+    """
+    if len(docs) < 2:
+        return list(docs), vectors
+    similar = (vectors @ vectors.T) > threshold
+    kept = np.zeros(len(docs), dtype=bool)
+    for i in range(len(docs)):
+        kept[i] = not similar[i, kept].any()
+    return [doc for doc, keep in zip(docs, kept) if keep], vectors[kept]
+
+
+def mmr_select(docs, vectors, k, lambda_mult=0.7):
+    """Maximal marginal relevance: k docs balancing their rank in docs against
+    similarity to the ones already picked.
+
+    docs come best first (dense, fused or reranked order), so relevance is
+    taken from the rank, not from a fresh query similarity that would undo
+    keyword matches and reranking.
+    """
+    n = len(docs)
+    if n <= 1 or k <= 0:
+        return list(docs[:k])
+    relevance = 1.0 - np.arange(n) / n
+    similarity = vectors @ vectors.T
+
+    selected = [0]
+    redundancy = similarity[0].copy()
+    available = np.ones(n, dtype=bool)
+    available[0] = False
+    while len(selected) < min(k, n):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return [docs[i] for i in selected]
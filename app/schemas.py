@@ -11,4 +11,12 @@ class PDFUpload(BaseModel):
 
 class QuestionRequest(BaseModel):
     question: str
-    chat_id: str
\ No newline at end of file
+    chat_id: str
+    # an LLM backend from app.llm_backends; the deployment's LLM_BACKEND if not given
+    backend: Optional[str] = None
+
+
+class IndexStorageRequest(BaseModel):
+    mode: str
+    # sq8/pq: keep float32 vectors for exact re-ranking; None keeps the chat's setting
+    exact_rerank: Optional[bool] = None
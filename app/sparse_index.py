@@ -0,0 +1,181 @@
+import os
+import re
+import math
+
+import numpy as np
+
+# BM25 keyword index of a chat snapshot, next to the chunk store:
+#   bm25.terms.txt          vocabulary, sorted, one term per line
+#   bm25.term_offsets.npy   int64 start of every term's postings (terms + 1 entries)
+#   bm25.postings.npy       int32 FAISS positions, grouped by term
+#   bm25.tf.npy             uint16 term frequency of every posting
+#   bm25.doc_lengths.npy    int32 token count of every chunk
+# The arrays are memory-mapped; a query reads only the postings of its terms.
+TERMS_FILE = "bm25.terms.txt"
+TERM_OFFSETS_FILE = "bm25.term_offsets.npy"
+POSTINGS_FILE = "bm25.postings.npy"
+TF_FILE = "bm25.tf.npy"
+DOC_LENGTHS_FILE = "bm25.doc_lengths.npy"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+# words joined by . - / stay one token as well ("4.2.1", "ab-1234", "en/iso"),
+# so clause numbers and product codes match exactly
+_TOKEN = re.compile(r"\w+(?:[.\-/]\w+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his how i if in into is it its "
+    "of on or our she so than that the their them then there these they this to was we were "
+    "what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[.\-/]", token) if part and part not in _STOPWORDS)
+    return tokens
+
+
+def _count_terms(texts, first_position):
+    """(terms, positions, tfs, lengths) of texts, one entry per distinct term of each text"""
+    terms, positions, tfs, lengths = [], [], [], []
+    for offset, text in enumerate(texts):
+        counts = {}
+        tokens = tokenize(text)
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        lengths.append(len(tokens))
+        for token, count in counts.items():
+            terms.append(token)
+            positions.append(first_position + offset)
+            tfs.append(min(count, 65535))
+    return terms, positions, tfs, lengths
+
+
+class SparseIndex:
+    """Memory-mapped BM25 postings of a saved snapshot (see the file layout above)"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._offsets = np.load(os.path.join(folder, TERM_OFFSETS_FILE), mmap_mode="r")
+        self._postings = np.load(os.path.join(folder, POSTINGS_FILE), mmap_mode="r")
+        self._tf = np.load(os.path.join(folder, TF_FILE), mmap_mode="r")
+        self._lengths = np.load(os.path.join(folder, DOC_LENGTHS_FILE), mmap_mode="r")
+        self.count = len(self._lengths)
+        self.avg_length = float(self._lengths.mean()) if self.count else 0.0
+        self._vocabulary = None
+
+    @staticmethod
+    def exists(folder):
+        return os.path.exists(os.path.join(folder, DOC_LENGTHS_FILE))
+
+    @property
+    def vocabulary(self):
+        # read on first query, so opening a snapshot stays a handful of mmaps
+        if self._vocabulary is None:
+            with open(os.path.join(self.folder, TERMS_FILE), encoding="utf-8") as f:
+                terms = f.read().split("\n")
+            self._vocabulary = {term: i for i, term in enumerate(terms) if term}
+        return self._vocabulary
+
+    def terms(self):
+        vocabulary = self.vocabulary
+        ordered = [None] * len(vocabulary)
+        for term, i in vocabulary.items():
+            ordered[i] = term
+        return ordered
+
+    def search(self, query, k):
+        """Top k (position, BM25 score) pairs for query, best first"""
+        if not self.count:
+            return []
+        positions, scores = [], []
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self._offsets[term_id]), int(self._offsets[term_id + 1])
+            docs = np.asarray(self._postings[start:end])
+            tf = np.asarray(self._tf[start:end], dtype=np.float32)
+            idf = math.log(1 + (self.count - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * np.asarray(self._lengths[docs]) / self.avg_length)
+            positions.append(docs)
+            scores.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+        if not positions:
+            return []
+
+        unique, inverse = np.unique(np.concatenate(positions), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        top = np.argsort(-totals, kind="stable")[:k]
+        return [(int(unique[i]), float(totals[i])) for i in top]
+
+    @staticmethod
+    def write(folder, texts, base=None):
+        """Write the index of texts (in FAISS position order) into folder.
+
+        With base (the SparseIndex of the previous snapshot), texts are only
+        the chunks added after its base.count positions, and the old postings
+        are merged in without tokenizing those chunks again.
+        """
+        first = base.count if base is not None else 0
+        new_terms, positions, tfs, lengths = _count_terms(texts, first)
+
+        old_terms = base.terms() if base is not None else []
+        vocabulary = sorted(set(old_terms).union(new_terms))
+        term_ids = {term: i for i, term in enumerate(vocabulary)}
+
+        ids = np.fromiter((term_ids[t] for t in new_terms), dtype=np.int64, count=len(new_terms))
+        positions = np.asarray(positions, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.uint16)
+        doc_lengths = np.asarray(lengths, dtype=np.int32)
+        if base is not None:
+            remap = np.fromiter((term_ids[t] for t in old_terms), dtype=np.int64, count=len(old_terms))
+            old_ids = np.repeat(remap, np.diff(np.asarray(base._offsets)))
+            ids = np.concatenate([old_ids, ids])
+            positions = np.concatenate([np.asarray(base._postings), positions])
+            tfs = np.concatenate([np.asarray(base._tf), tfs])
+            doc_lengths = np.concatenate([np.asarray(base._lengths), doc_lengths])
+
+        order = np.lexsort((positions, ids))
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ids, minlength=len(vocabulary)), out=offsets[1:])
+
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, TERMS_FILE), "w", encoding="utf-8") as f:
+            f.write("\n".join(vocabulary))
+        np.save(os.path.join(folder, TERM_OFFSETS_FILE), offsets)
+        np.save(os.path.join(folder, POSTINGS_FILE), positions[order].astype(np.int32))
+        np.save(os.path.join(folder, TF_FILE), tfs[order].astype(np.uint16))
+        np.save(os.path.join(folder, DOC_LENGTHS_FILE), doc_lengths)
+
+
+def keyword_search(vectorstore, query, k):
+    """Chunks of the chat best matching query's words; [] for snapshots without a keyword index"""
+    sparse = getattr(vectorstore, "sparse_index", None)
+    if sparse is None:
+        return []
+    docs = []
+    for position, _ in sparse.search(query, k):
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+        if not isinstance(doc, str):
+            docs.append(doc)
+    return docs
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked lists of documents: each one scores sum(1 / (k + rank)) over the lists it is in"""
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
@@ -0,0 +1,125 @@
+"""Per-request auth overhead: Supabase Auth round trip vs local JWT verification.
+
+Usage:
+    python -m benchmarks.bench_auth [--requests 300] [--latency-ms 0]
+
+A small fake Supabase Auth server runs on localhost and answers
+/auth/v1/user (what get_current_user used to call on every request) and
+/auth/v1/.well-known/jwks.json. --latency-ms adds a delay to every
+response to mimic the real network distance to Supabase.
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec
+from supabase import create_client
+
+from app.jwt_verifier import TokenVerifier, JWKSCache
+
+SECRET = "bench-secret-" + "x" * 32
+EC_KEY = ec.generate_private_key(ec.SECP256R1())
+KID = "bench-key"
+
+
+def make_token(alg="HS256", ttl=3600):
+    claims = {
+        "sub": str(uuid.uuid4()),
+        "email": "bench@example.com",
+        "aud": "authenticated",
+        "role": "authenticated",
+        "exp": int(time.time()) + ttl
+    }
+    if alg == "HS256":
+        return jwt.encode(claims, SECRET, algorithm="HS256")
+    return jwt.encode(claims, EC_KEY, algorithm="ES256", headers={"kid": KID})
+
+
+def serve(latency):
+    jwk = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(EC_KEY.public_key()))
+    jwks = {"keys": [dict(jwk, kid=KID, alg="ES256", use="sig")]}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path.startswith("/auth/v1/.well-known/jwks.json"):
+                body = jwks
+            elif self.path.startswith("/auth/v1/user"):
+                token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+                claims = jwt.decode(token, SECRET, algorithms=["HS256"], audience="authenticated")
+                body = {
+                    "id": claims["sub"],
+                    "aud": "authenticated",
+                    "role": "authenticated",
+                    "email": claims["email"],
+                    "app_metadata": {},
+                    "user_metadata": {},
+                    "created_at": "2024-01-01T00:00:00Z"
+                }
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, url = serve(args.latency_ms / 1000)
+    n = args.requests
+
+    supabase = create_client(url, make_token())
+    token = make_token()
+    before = timed(lambda t: supabase.auth.get_user(t), [token] * n)
+
+    hs = TokenVerifier(secret=SECRET)
+    hs_cold = timed(hs.verify, [make_token() for _ in range(n)])
+    hs_warm = timed(hs.verify, [token] * n)
+
+    es = TokenVerifier(jwks=JWKSCache(f"{url}/auth/v1/.well-known/jwks.json", 600, 30))
+    es.verify(make_token("ES256"))  # first call fetches JWKS
+    es_cold = timed(es.verify, [make_token("ES256") for _ in range(n)])
+    es_token = make_token("ES256")
+    es_warm = timed(es.verify, [es_token] * n)
+
+    server.shutdown()
+
+    print(f"{n} requests, added network latency {args.latency_ms:.0f} ms")
+    print(f"{'supabase auth.get_user (before)':>36}: {before:8.3f} ms per request")
+    print(f"{'HS256 local, new token':>36}: {hs_cold:8.3f} ms per request")
+    print(f"{'HS256 local, cached token':>36}: {hs_warm:8.3f} ms per request")
+    print(f"{'ES256 via JWKS, new token':>36}: {es_cold:8.3f} ms per request")
+    print(f"{'ES256 via JWKS, cached token':>36}: {es_warm:8.3f} ms per request")
+    print(f"JWKS fetches: {es.stats()['jwks_refreshes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Open time and per-query read time of the pickled docstore vs the chunk store.
+
+Usage:
+    python -m benchmarks.bench_chunk_store [--sizes 10000 50000 200000] [--k 15]
+
+Each snapshot gets n synthetic chunks of about 1 KB with source/page
+metadata, saved once as index.pkl (what FAISS.save_local writes) and once
+as a chunk store. "open" is what load_faiss_index pays before the first
+search; "fetch" is reading the k chunks of one answer. Run it after
+dropping the page cache to see cold numbers.
+"""
+import os
+import time
+import pickle
+import argparse
+import tempfile
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+from app.chunk_store import ChunkStore
+
+
+def make_documents(n, seed=42):
+    rng = np.random.default_rng(seed)
+    words = [f"word{i}" for i in range(5000)]
+    return [
+        Document(
+            page_content=" ".join(words[j] for j in rng.integers(0, len(words), 120)),
+            metadata={"source": f"file_{i // 400}.pdf", "page": (i // 4) % 100 + 1}
+        )
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 200000])
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'chunks':>8} {'format':<12} {'disk MB':>8} {'open ms':>9} {'fetch ms':>9}")
+    for n in args.sizes:
+        docs = make_documents(n)
+        positions = np.random.default_rng(7).integers(0, n, (args.queries, args.k))
+
+        with tempfile.TemporaryDirectory() as folder:
+            ids = {i: str(i) for i in range(n)}
+            pkl = os.path.join(folder, "index.pkl")
+            with open(pkl, "wb") as f:
+                pickle.dump((InMemoryDocstore(dict(zip(ids.values(), docs))), ids), f)
+            ChunkStore.write(folder, docs)
+
+            start = time.perf_counter()
+            with open(pkl, "rb") as f:
+                docstore, mapping = pickle.load(f)
+            open_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            for row in positions:
+                [docstore.search(mapping[int(i)]) for i in row]
+            fetch_ms = (time.perf_counter() - start) / len(positions) * 1000
+            print(f"{n:>8} {'pickle':<12} {os.path.getsize(pkl) / 1e6:>8.1f} {open_ms:>9.2f} {fetch_ms:>9.3f}")
+
+            start = time.perf_counter()
+            store = ChunkStore(folder)
+            open_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            for row in positions:
+                [store.search(store.ids[int(i)]) for i in row]
+            fetch_ms = (time.perf_counter() - start) / len(positions) * 1000
+            disk = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder) if name.startswith("chunks."))
+            print(f"{n:>8} {'chunk store':<12} {disk / 1e6:>8.1f} {open_ms:>9.2f} {fetch_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Check clean_pdf_text against the original eleven-pass cleaner and time both.
+
+Usage:
+    python -m benchmarks.bench_clean_pdf_text [--fuzz 200000] [--pages 400]
+
+The golden corpus is the hand-picked CASES below, plus generated policy-style
+pages and random strings built from the characters the patterns care about.
+The script exits with status 1 on the first output that differs.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+
+from app.pdf_reader import clean_pdf_text
+
+
+def legacy_clean_pdf_text(text: str):
+    text = re.sub(r'(\d+)\.\s*\n\s*([A-Za-z])', r'\1. \2', text)
+    text = re.sub(r'\n\s*:\s*', ': ', text)
+    text = re.sub(r'([A-Za-z])\n([a-z])', r'\1 \2', text)
+    text = re.sub(r'\n([A-Z][a-zA-Z ]+)\n', r' \1 ', text)
+    text = re.sub(r'([a-z])\n([a-zA-Z])', r'\1 \2', text)
+    text = re.sub(r'(?<!\n)\n(?!\n)(?!\d+\.)', ' ', text)
+    text = re.sub(r'\s(\d+\.\s)', r'\n\1', text)
+    text = re.sub(r'\n+', '\n', text)
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r'^(\d+)\.\s*\n\s*([A-Z][A-Za-z ]+)', r'\1. \2', text, flags=re.MULTILINE)
+    text = re.sub(r'(?<!\n)\n(?!\n)', ' ', text)
+    return text.strip()
+
+
+CASES = [
+    "",
+    "   \n\t \n",
+    "1.\nIntroduction\nThis policy applies to all staff.",
+    "Name\n: John\nAge :\n 32",
+    "Leave Policy\nemployees get\nTwenty days\n\n2. Sick leave\n3.\n Casual leave",
+    "a 1. 2. x",
+    "Total\t\tamount\n\n\n12.\nA",
+    "TERMS AND CONDITIONS\n\nSection One\n\n1. scope\n2. definitions",
+    "line one\r\nline two\xa0\n4. item",
+    "x\n\nTitle\nlower case follows",
+    "5.\n\n6.\nAbc",
+    "• bullet one\n• bullet two",
+]
+
+WORDS = (
+    "the employee shall be entitled to annual leave of twenty days per calendar year "
+    "subject to approval by the reporting manager and in accordance with company policy "
+    "benefits include medical insurance travel allowance and performance bonus payable"
+).split()
+
+FUZZ_ALPHABET = ["a", "b", "Z", "Q", "x", "1", "2", "3", ".", ".", ":", " ", " ", " ",
+                 "\t", "\n", "\n", "\n", "\xa0", "\r", "-"]
+
+
+def make_page(rng, lines=45):
+    out = []
+    for _ in range(lines):
+        r = rng.random()
+        if r < 0.08:
+            out.append(rng.choice(["Leave Policy", "Section Benefits", "Annual Review", "TERMS AND CONDITIONS"]))
+        elif r < 0.2:
+            out.append(f"{rng.randint(1, 12)}. " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))))
+        elif r < 0.23:
+            out.append(f"{rng.randint(1, 12)}.")
+        elif r < 0.26:
+            out.append(": " + " ".join(rng.choice(WORDS) for _ in range(5)))
+        elif r < 0.3:
+            out.append("")
+        else:
+            line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 14)))
+            out.append(line + rng.choice(["", ".", ",", " ", "\t"]))
+    return "\n".join(out)
+
+
+def check(text):
+    expected = legacy_clean_pdf_text(text)
+    actual = clean_pdf_text(text)
+    if expected != actual:
+        print("❌ Output differs for input:", repr(text))
+        print("   legacy:", repr(expected))
+        print("   new:   ", repr(actual))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fuzz", type=int, default=200000)
+    parser.add_argument("--pages", type=int, default=400)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    pages = [make_page(rng) for _ in range(args.pages)]
+
+    for text in CASES + pages:
+        check(text)
+    for _ in range(args.fuzz):
+        check("".join(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(0, 24))))
+    print(f"✅ Identical output on {len(CASES)} cases, {len(pages)} pages and {args.fuzz} fuzz strings")
+
+    mb = sum(len(p) for p in pages) / (1024 * 1024)
+    for name, fn in (("legacy", legacy_clean_pdf_text), ("current", clean_pdf_text)):
+        best = None
+        for _ in range(5):
+            start = time.perf_counter()
+            for page in pages:
+                fn(page)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:>8}: {best / mb * 1000:.1f} ms per MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Compare the old O(n^2) is_duplicate loop with NearDuplicateIndex.
+
+Usage:
+    python -m benchmarks.bench_dedup [--sizes 1000 10000 50000] [--legacy-max 1000]
+                                     [--recall-sources 2000]
+
+The legacy loop is quadratic, so sizes above --legacy-max are extrapolated
+from the largest measured run instead of being executed.
+
+The recall table replaces 10-40% of the words of --recall-sources chunks.
+Among the edited copies that is_duplicate() calls a duplicate of their
+source, it shows how many the index also rejects.
+
+The seed table is what an upload pays before deduplicating: loading the
+chunks already in the chat by hashing each one (add) or from the
+signatures saved with the snapshot (seed).
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from app.dedup import is_duplicate, NearDuplicateIndex
+
+WORDS = (
+    "policy employee leave salary benefit clause section insurance payment "
+    "contract notice period termination holiday travel expense approval "
+    "manager department report annual review claim medical form request "
+    "document version effective date company guideline security access"
+).split()
+
+
+def make_chunks(n, dup_ratio=0.15, seed=42):
+    rng = random.Random(seed)
+    vocab = WORDS + [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 10)))
+        for _ in range(3000)
+    ]
+    chunks = []
+    for _ in range(n):
+        if chunks and rng.random() < dup_ratio:
+            base = list(rng.choice(chunks))
+            for _ in range(rng.randint(1, 8)):
+                pos = rng.randrange(len(base))
+                base[pos] = rng.choice("abcdefghijklmnopqrstuvwxyz ")
+            chunks.append("".join(base))
+        else:
+            words = [rng.choice(vocab) for _ in range(rng.randint(60, 120))]
+            chunks.append(f"{rng.randint(1, 40)}. " + " ".join(words))
+    return chunks
+
+
+def edit_words(text, fraction, rng, vocab):
+    words = text.split()
+    for i in rng.sample(range(len(words)), int(len(words) * fraction)):
+        words[i] = rng.choice(vocab)
+    return " ".join(words)
+
+
+def word_edit_recall(n, fractions=(0.1, 0.2, 0.3, 0.4), seed=7):
+    rng = random.Random(seed)
+    sources = make_chunks(n, dup_ratio=0)
+    vocab = sorted({word for text in sources for word in text.split()})
+    index = NearDuplicateIndex()
+    for text in sources:
+        index.add(text)
+
+    print(f"{'words edited':>12} {'legacy dups':>12} {'found':>7} {'recall':>8}")
+    for fraction in fractions:
+        edited = [edit_words(text, fraction, rng, vocab) for text in sources]
+        pairs = [copy for copy, text in zip(edited, sources) if is_duplicate(copy, text)]
+        found = sum(index.is_duplicate(copy) for copy in pairs)
+        recall = found / len(pairs) if pairs else 1.0
+        print(f"{fraction:>11.0%} {len(pairs):>12} {found:>7} {recall:>8.3f}")
+
+
+def seed_times(sizes):
+    print(f"{'chunks':>8} {'add s':>8} {'seed s':>8}")
+    for n in sizes:
+        chunks = make_chunks(n)
+        start = time.perf_counter()
+        hashed = NearDuplicateIndex()
+        for text in chunks:
+            hashed.add(text)
+        add_time = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as folder:
+            hashed.save(folder)
+            start = time.perf_counter()
+            seeded = NearDuplicateIndex()
+            seeded.seed(chunks, seeded.load_signatures(folder))
+            seed_time = time.perf_counter() - start
+        print(f"{n:>8} {add_time:>8.2f} {seed_time:>8.2f}")
+
+
+def legacy_dedup(chunks):
+    kept = []
+    for text in chunks:
+        if not any(is_duplicate(text, seen) for seen in kept):
+            kept.append(text)
+    return kept
+
+
+def minhash_dedup(chunks):
+    index = NearDuplicateIndex()
+    return [text for text in chunks if index.add_if_new(text)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--legacy-max", type=int, default=1000)
+    parser.add_argument("--recall-sources", type=int, default=2000)
+    args = parser.parse_args()
+
+    word_edit_recall(args.recall_sources)
+    print()
+    seed_times(args.sizes)
+    print()
+
+    legacy_point = None
+    print(f"{'chunks':>8} {'legacy s':>12} {'minhash s':>10} {'speedup':>9} {'kept legacy':>12} {'kept minhash':>13} {'agreement':>10}")
+
+    for n in args.sizes:
+        chunks = make_chunks(n)
+
+        start = time.perf_counter()
+        new_kept = minhash_dedup(chunks)
+        new_time = time.perf_counter() - start
+
+        if n <= args.legacy_max:
+            start = time.perf_counter()
+            old_kept = legacy_dedup(chunks)
+            old_time = time.perf_counter() - start
+            legacy_point = (n, old_time)
+
+            old_set, new_set = set(old_kept), set(new_kept)
+            agreement = len(old_set & new_set) / max(len(old_set | new_set), 1)
+            print(f"{n:>8} {old_time:>12.2f} {new_time:>10.2f} {old_time / new_time:>8.1f}x "
+                  f"{len(old_kept):>12} {len(new_kept):>13} {agreement:>10.4f}")
+        else:
+            if legacy_point:
+                base_n, base_time = legacy_point
+                estimate = base_time * (n / base_n) ** 2
+                legacy_text = f"~{estimate:.0f} (est)"
+                speedup = f"{estimate / new_time:>8.0f}x"
+            else:
+                legacy_text, speedup = "skipped", "       -"
+            print(f"{n:>8} {legacy_text:>12} {new_time:>10.2f} {speedup} {'-':>12} {len(new_kept):>13} {'-':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Recall and query latency of flat vs HNSW vs IVF FAISS indexes.
+
+Usage:
+    python -m benchmarks.bench_faiss_index [--sizes 5000 20000 50000] [--queries 200] [--k 15]
+
+The corpus is synthetic: normalized 384-d vectors drawn around a few
+hundred topic centres (like chunks of related PDFs), and queries are noisy
+copies of corpus vectors. Recall@k is measured against the flat index,
+queries run one at a time like /ask does. HNSW is built with
+FAISS_HNSW_M and FAISS_HNSW_EF_CONSTRUCTION from app.config, IVF with the
+nlist build_index in app.faiss_db uses (4 * sqrt(n)). Pick FAISS_PROMOTED_INDEX and
+the search parameter (efSearch / nprobe) from the rows here.
+"""
+import argparse
+import math
+import time
+
+import faiss
+import numpy as np
+
+from app.config import FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION
+
+DIM = 384
+
+
+def make_corpus(n, topics=300, seed=42):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, DIM)).astype(np.float32)
+    vectors = centres[rng.integers(0, topics, n)] + 0.6 * rng.standard_normal((n, DIM)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def make_queries(corpus, count, seed=7):
+    rng = np.random.default_rng(seed)
+    queries = corpus[rng.integers(0, len(corpus), count)] + 0.3 * rng.standard_normal((count, DIM)).astype(np.float32)
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def search_each(index, queries, k):
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    start = time.perf_counter()
+    for i, q in enumerate(queries):
+        _, ids[i] = index.search(q.reshape(1, -1), k)
+    return ids, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def recall(found, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (the app searches from request threads)")
+    args = parser.parse_args()
+    faiss.omp_set_num_threads(args.threads)
+
+    print(f"{'vectors':>8} {'index':<22} {'build s':>8} {'ms/query':>9} {'recall@' + str(args.k):>10} {'speedup':>8}")
+    for n in args.sizes:
+        corpus = make_corpus(n)
+        queries = make_queries(corpus, args.queries)
+
+        start = time.perf_counter()
+        flat = faiss.IndexFlatL2(DIM)
+        flat.add(corpus)
+        flat_build = time.perf_counter() - start
+        truth, flat_ms = search_each(flat, queries, args.k)
+        print(f"{n:>8} {'flat':<22} {flat_build:>8.2f} {flat_ms:>9.3f} {1.0:>10.4f} {1.0:>7.1f}x")
+
+        start = time.perf_counter()
+        hnsw = faiss.IndexHNSWFlat(DIM, FAISS_HNSW_M)
+        hnsw.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+        hnsw.add(corpus)
+        hnsw_build = time.perf_counter() - start
+        for ef in (32, 64, 128, 256):
+            hnsw.hnsw.efSearch = ef
+            found, ms = search_each(hnsw, queries, args.k)
+            print(f"{n:>8} {f'hnsw M={FAISS_HNSW_M} ef={ef}':<22} {hnsw_build:>8.2f} {ms:>9.3f} "
+                  f"{recall(found, truth):>10.4f} {flat_ms / ms:>7.1f}x")
+
+        nlist = int(4 * math.sqrt(n))  # as in app.faiss_db.build_index
+        start = time.perf_counter()
+        ivf = faiss.IndexIVFFlat(faiss.IndexFlatL2(DIM), DIM, nlist)
+        ivf.train(corpus)
+        ivf.add(corpus)
+        ivf_build = time.perf_counter() - start
+        for nprobe in (4, 16, 64):
+            ivf.nprobe = nprobe
+            found, ms = search_each(ivf, queries, args.k)
+            print(f"{n:>8} {f'ivf nlist={nlist} np={nprobe}':<22} {ivf_build:>8.2f} {ms:>9.3f} "
+                  f"{recall(found, truth):>10.4f} {flat_ms / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Memory per chat and recall of float32 vs SQ8 vs PQ chat indexes.
+
+Usage:
+    python -m benchmarks.bench_index_storage [--sizes 5000 20000 50000] [--queries 200] [--k 15]
+
+Uses the synthetic corpus of bench_faiss_index. For every storage mode it
+prints the bytes the index keeps in RAM, the bytes a saved snapshot takes
+on disk (index.faiss with its codes + vectors.npy, without the docstore)
+and the time to load it, recall@k against
+exact search with and without exact re-ranking (FAISS_RERANK_FACTOR * k
+candidates for SQ8, FAISS_PQ_RERANK_FACTOR * k for PQ), and the time per
+reranked query.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from app.config import FAISS_PQ_M, FAISS_RERANK_FACTOR, FAISS_PQ_RERANK_FACTOR
+from app.quantized_store import build_quantizer, rerank, EXACT_VECTORS_FILE
+from benchmarks.bench_faiss_index import make_corpus, make_queries, recall
+
+
+def save_and_load(index, vectors):
+    """Disk bytes of a snapshot as QuantizedFAISS.write_vectors saves it, and ms to load it again"""
+    with tempfile.TemporaryDirectory() as folder:
+        faiss.write_index(index, os.path.join(folder, "index.faiss"))
+        np.save(os.path.join(folder, EXACT_VECTORS_FILE), vectors)
+        size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+        start = time.perf_counter()
+        faiss.read_index(os.path.join(folder, "index.faiss"))
+        np.load(os.path.join(folder, EXACT_VECTORS_FILE), mmap_mode="r")
+        return size, (time.perf_counter() - start) * 1000
+
+
+def run(index, queries, k, exact=None, factor=1):
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    fetch = k * factor
+    start = time.perf_counter()
+    for i, q in enumerate(queries):
+        _, found = index.search(q.reshape(1, -1), fetch)
+        if exact is not None:
+            found = rerank(exact, found[0][found[0] >= 0], q, k)[0].reshape(1, -1)
+        ids[i] = found[0][:k]
+    return ids, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=15)
+    args = parser.parse_args()
+    faiss.omp_set_num_threads(1)
+
+    print(f"{'vectors':>8} {'mode':<8} {'RAM MB':>8} {'disk MB':>8} {'load ms':>8} {'recall':>8} {'reranked':>9} {'ms/query':>9}")
+    for n in args.sizes:
+        corpus = make_corpus(n)
+        queries = make_queries(corpus, args.queries)
+
+        flat = faiss.IndexFlatL2(corpus.shape[1])
+        flat.add(corpus)
+        truth, flat_ms = run(flat, queries, args.k)
+        flat_bytes = n * flat.sa_code_size()
+        with tempfile.TemporaryDirectory() as folder:
+            faiss.write_index(flat, os.path.join(folder, "index.faiss"))
+            flat_disk = os.path.getsize(os.path.join(folder, "index.faiss"))
+            start = time.perf_counter()
+            faiss.read_index(os.path.join(folder, "index.faiss"))
+            flat_load = (time.perf_counter() - start) * 1000
+        print(f"{n:>8} {'float32':<8} {flat_bytes / 1e6:>8.2f} {flat_disk / 1e6:>8.2f} {flat_load:>8.1f} "
+              f"{1.0:>8.4f} {'-':>9} {flat_ms:>9.3f}")
+
+        with tempfile.TemporaryDirectory() as folder:
+            np.save(os.path.join(folder, EXACT_VECTORS_FILE), corpus)
+            exact = np.load(os.path.join(folder, EXACT_VECTORS_FILE), mmap_mode="r")
+
+            for mode in ("sq8", "pq"):
+                index = build_quantizer(corpus, mode, FAISS_PQ_M)
+                kind = "pq" if hasattr(index, "pq") else "sq8"
+                if kind != mode:
+                    continue
+                ram = n * index.sa_code_size() + (index.pq.M * index.pq.ksub * index.pq.dsub * 4 if kind == "pq" else 0)
+                plain, _ = run(index, queries, args.k)
+                factor = FAISS_PQ_RERANK_FACTOR if kind == "pq" else FAISS_RERANK_FACTOR
+                reranked, ms = run(index, queries, args.k, exact, factor)
+                disk, load_ms = save_and_load(index, corpus)
+                print(f"{n:>8} {mode:<8} {ram / 1e6:>8.2f} {disk / 1e6:>8.2f} {load_ms:>8.1f} "
+                      f"{recall(plain, truth):>8.4f} {recall(reranked, truth):>9.4f} {ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Answer latency of each configured LLM backend (app/llm_backends.py).
+
+Usage:
+    python -m benchmarks.bench_llm_backends [--backends groq,local,llamacpp] [--questions 10]
+                                            [--context-tokens 1500]
+    python -m benchmarks.bench_llm_backends --fake [--latency 0.3] [--local-latency 2.0]
+
+Sends --questions distinct questions one after another, each with the real
+system prompt and about --context-tokens of PDF-like context, streamed as
+/ask/stream does. The first call is reported on its own ("cold"): for the
+local backends it includes evaluating the system prompt, which later calls
+take from the prefix cache. For the rest: p50/p95 time to first token and
+to the whole answer, and output tokens per second. For the HTTP backends
+the prompt tokens the server reported as cached are shown too.
+
+--fake runs groq and local against two fake_groq servers (different
+latencies) instead of the configured endpoints, to check the harness
+without a network or a model.
+"""
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+from app.prompt import SYSTEM_PROMPT, question_template
+from app.context_packer import token_counter
+from app.llm_backends import llm_backends
+from app.llm_gateway import LLMGateway
+
+CONTEXT_PARAGRAPH = (
+    "Section 4.2 Annual leave. Full-time employees are entitled to 20 working days of paid "
+    "annual leave per calendar year, accrued monthly. Unused leave of up to 5 days may be "
+    "carried over to the first quarter of the following year with the manager's approval. "
+)
+
+
+def build_messages(i, context_tokens):
+    repeats = max(1, context_tokens // token_counter.count(CONTEXT_PARAGRAPH))
+    context = CONTEXT_PARAGRAPH * repeats
+    question = f"Question {i}: how many days of annual leave can be carried over, and until when?"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": question_template.format(chat_history="", context=context, question=question)}
+    ]
+
+
+async def measure(backend, messages):
+    start = time.perf_counter()
+    first = None
+    parts = []
+    async for token in backend.stream(messages):
+        if first is None:
+            first = time.perf_counter() - start
+        parts.append(token)
+    total = time.perf_counter() - start
+    answer = "".join(parts)
+    generating = total - (first or 0)
+    tokens = token_counter.count(answer)
+    return first or total, total, tokens / generating if generating > 0 else 0.0
+
+
+async def bench(name, backend, args):
+    before = backend.stats()
+    samples = []
+    for i in range(args.questions):
+        samples.append(await measure(backend, build_messages(i, args.context_tokens)))
+    after = backend.stats()
+
+    cold, warm = samples[0], samples[1:] or samples
+    ttft = [s[0] * 1000 for s in warm]
+    total = [s[1] * 1000 for s in warm]
+    rate = [s[2] for s in warm]
+    cached = ""
+    if "prompt_tokens" in after:
+        prompt = after["prompt_tokens"] - before["prompt_tokens"]
+        hits = after["cached_prompt_tokens"] - before["cached_prompt_tokens"]
+        cached = f"{hits}/{prompt}" if prompt else "-"
+    print(f"{name:<10} {cold[0] * 1000:>10.0f} {cold[1] * 1000:>10.0f} "
+          f"{np.percentile(ttft, 50):>9.0f} {np.percentile(ttft, 95):>9.0f} "
+          f"{np.percentile(total, 50):>9.0f} {np.percentile(total, 95):>9.0f} "
+          f"{np.median(rate):>7.1f} {cached:>14}")
+
+
+async def main_async(args):
+    servers = []
+    if args.fake:
+        from benchmarks.bench_llm_gateway import start_server
+
+        backends = {}
+        for name, latency in (("groq", args.latency), ("local", args.local_latency)):
+            server, url = start_server(latency=latency, rpm=10000, tpm=10000000)
+            servers.append(server)
+            backends[name] = LLMGateway(f"{url}/openai/v1", "test-key", name)
+    else:
+        names = args.backends.split(",") if args.backends else list(llm_backends)
+        unknown = [name for name in names if name not in llm_backends]
+        if unknown:
+            raise SystemExit(f"Not configured: {', '.join(unknown)} (available: {', '.join(llm_backends)})")
+        backends = {name: llm_backends[name] for name in names}
+
+    print(f"{args.questions} questions, ~{args.context_tokens} context tokens, "
+          f"system prompt {token_counter.count(SYSTEM_PROMPT)} tokens")
+    print(f"{'backend':<10} {'cold ttft':>10} {'cold total':>10} {'ttft p50':>9} {'ttft p95':>9} "
+          f"{'total p50':>9} {'total p95':>9} {'tok/s':>7} {'cached prompt':>14}")
+    try:
+        for name, backend in backends.items():
+            await bench(name, backend, args)
+    finally:
+        for backend in backends.values():
+            await backend.aclose()
+        for server in servers:
+            server.should_exit = True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="")
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--context-tokens", type=int, default=1500)
+    parser.add_argument("--fake", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--local-latency", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""LLM gateway behaviour against the fake Groq server (benchmarks/fake_groq.py).
+
+Usage:
+    python -m benchmarks.bench_llm_gateway [--burst 50] [--concurrency 8] [--latency 0.3]
+
+Starts the fake server on a free local port and runs:
+  same question      a burst of identical prompts -> one upstream call (single-flight)
+  same question sse  the same, streamed; every caller gets the whole answer
+  distinct           distinct prompts, at most --concurrency upstream at once
+  rate limited       more requests than the fake's per-window budget: the
+                     gateway waits on the headers instead of collecting 429s
+  flaky upstream     30% of calls fail with 503 and are retried
+For each: wall time, upstream calls, 429s the server sent, peak concurrent
+upstream requests and failed callers.
+"""
+import time
+import socket
+import asyncio
+import argparse
+import threading
+
+import httpx
+import uvicorn
+
+from app.llm_gateway import LLMGateway
+from benchmarks.fake_groq import create_app
+
+
+def start_server(**kwargs):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_app(**kwargs), host="127.0.0.1", port=port, log_level="error"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def run(name, server_kwargs, gateway_kwargs, prompts, stream=False):
+    server, url = start_server(**server_kwargs)
+    gateway = LLMGateway(f"{url}/openai/v1", "test-key", "openai/gpt-oss-120b", **gateway_kwargs)
+
+    async def ask(prompt):
+        messages = [{"role": "user", "content": prompt}]
+        if stream:
+            return "".join([part async for part in gateway.stream(messages)])
+        return await gateway.complete(messages)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(ask(p) for p in prompts), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    await gateway.aclose()
+
+    seen = httpx.get(f"{url}/stats").json()
+    server.should_exit = True
+    failed = sum(isinstance(r, Exception) for r in results)
+    answers = {r for r in results if isinstance(r, str)}
+    print(f"{name:<18} {len(prompts):>6} {elapsed:>8.2f} {gateway.upstream_calls:>9} {seen['rate_limited']:>5} "
+          f"{seen['peak_concurrent']:>5} {gateway.coalesced:>9} {gateway.retries:>7} {failed:>6} {len(answers):>7}")
+
+
+async def main_async(args):
+    print(f"{'scenario':<18} {'calls':>6} {'wall s':>8} {'upstream':>9} {'429s':>5} {'peak':>5} "
+          f"{'coalesced':>9} {'retries':>7} {'failed':>6} {'answers':>7}")
+    fast = {"latency": args.latency, "rpm": 10000, "tpm": 10_000_000}
+    gateway = {"max_concurrency": args.concurrency, "retry_base_delay": 0.05}
+    same = ["What is the leave policy?"] * args.burst
+    distinct = [f"Question number {i}?" for i in range(args.burst)]
+
+    await run("same question", fast, gateway, same)
+    await run("same question sse", fast, gateway, same, stream=True)
+    await run("distinct", fast, gateway, distinct)
+    await run("rate limited", {"latency": 0.05, "rpm": 10, "tpm": 10_000_000, "window": 2.0},
+              {**gateway, "max_wait": 10}, distinct[:30])
+    await run("flaky upstream", {**fast, "fail_rate": 0.3}, {**gateway, "max_retries": 6}, distinct)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
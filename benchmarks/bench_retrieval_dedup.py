@@ -0,0 +1,122 @@
+"""Retrieval-time dedup: the old SequenceMatcher loop vs app.retrieval.
+
+Usage:
+    python -m benchmarks.bench_retrieval_dedup [--candidates 15 30 60 120] [--repeat 200]
+
+Candidates are synthetic ~700-character chunks: about a quarter are
+shifted copies of another candidate (the same text re-chunked, cosine
+~0.999), a quarter are related but distinct chunks (cosine 0.85-0.95 to
+another candidate, like another clause on the same topic) and the rest are
+unrelated. "old" is the is_similar() loop that retrieve_for_question ran
+on the first 200 characters; "numpy" is drop_near_duplicates on the
+candidate vectors plus mmr_select of TOP_K. Only copies should be dropped:
+"copies" and "related" show how many of each the two methods dropped.
+Reading the vectors back from a flat index is timed separately.
+"""
+import time
+import random
+import argparse
+from difflib import SequenceMatcher
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import TOP_K, RETRIEVAL_DUPLICATE_THRESHOLD, MMR_LAMBDA
+from app.retrieval import drop_near_duplicates, mmr_select
+
+DIM = 384
+
+
+def old_dedup(docs):
+    def is_similar(text1, text2, threshold=0.7):
+        if len(text1) < 50 or len(text2) < 50:
+            return text1 == text2
+        return SequenceMatcher(None, text1[:200], text2[:200]).ratio() > threshold
+
+    unique_docs = []
+    for doc in docs:
+        current_text = doc.page_content[:200]
+        if not any(is_similar(current_text, existing.page_content[:200]) for existing in unique_docs):
+            unique_docs.append(doc)
+    return unique_docs
+
+
+def make_candidates(n, seed=42):
+    rng = random.Random(seed)
+    nrng = np.random.default_rng(seed)
+    words = ["".join(rng.choice("abcdefghijklmnop") for _ in range(rng.randint(3, 9))) for _ in range(3000)]
+    texts, vectors, kinds = [], [], []
+    for i in range(n):
+        roll = rng.random()
+        if i and roll < 0.25:
+            source = rng.randrange(len(texts))
+            cut = rng.randint(5, 30)
+            texts.append(texts[source][cut:] + " " + " ".join(rng.choice(words) for _ in range(4)))
+            vector = vectors[source] + 0.002 * nrng.standard_normal(DIM).astype(np.float32)
+            kinds.append("copy")
+        elif i and roll < 0.5:
+            source = vectors[rng.randrange(len(vectors))]
+            cosine = rng.uniform(0.85, 0.95)
+            noise = nrng.standard_normal(DIM).astype(np.float32)
+            noise -= (noise @ source) * source
+            noise /= np.linalg.norm(noise)
+            texts.append(" ".join(rng.choice(words) for _ in range(110)))
+            vector = cosine * source + np.sqrt(1 - cosine ** 2) * noise
+            kinds.append("related")
+        else:
+            texts.append(" ".join(rng.choice(words) for _ in range(110)))
+            vector = nrng.standard_normal(DIM).astype(np.float32)
+            kinds.append("unique")
+        vectors.append(vector / np.linalg.norm(vector))
+    vectors = np.vstack(vectors).astype(np.float32)
+    return [Document(page_content=t, metadata={"kind": k}) for t, k in zip(texts, kinds)], vectors
+
+
+def dropped(docs, kept, kind):
+    kept = {id(doc) for doc in kept}
+    return sum(doc.metadata["kind"] == kind and id(doc) not in kept for doc in docs)
+
+
+def per_call_ms(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, nargs="+", default=[15, 30, 60, 120])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"threshold {RETRIEVAL_DUPLICATE_THRESHOLD}; copies/related: dropped of total")
+    print(f"{'candidates':>10} {'old ms':>9} {'kept':>5} {'copies':>7} {'related':>8} "
+          f"{'numpy ms':>9} {'kept':>5} {'copies':>7} {'related':>8} {'+vectors ms':>12} {'speedup':>8}")
+    for n in args.candidates:
+        docs, vectors = make_candidates(n)
+        flat = faiss.IndexFlatL2(DIM)
+        flat.add(vectors)
+
+        old_ms, old_kept = per_call_ms(lambda: old_dedup(docs), args.repeat)
+        new_ms, (new_kept, _) = per_call_ms(
+            lambda: (lambda kept: (kept, mmr_select(kept[0], kept[1], TOP_K, MMR_LAMBDA)))(
+                drop_near_duplicates(docs, vectors, RETRIEVAL_DUPLICATE_THRESHOLD)
+            ),
+            args.repeat
+        )
+        read_ms, _ = per_call_ms(lambda: np.vstack([flat.reconstruct(i) for i in range(n)]), args.repeat)
+        total = new_ms + read_ms
+        copies = sum(doc.metadata["kind"] == "copy" for doc in docs)
+        related = sum(doc.metadata["kind"] == "related" for doc in docs)
+        columns = []
+        for kept in (old_kept, new_kept[0]):
+            columns.append(f"{len(kept):>5} {dropped(docs, kept, 'copy'):>3}/{copies:<3} "
+                           f"{dropped(docs, kept, 'related'):>4}/{related:<3}")
+        print(f"{n:>10} {old_ms:>9.3f} {columns[0]} {new_ms:>9.3f} {columns[1]} "
+              f"{total:>12.3f} {old_ms / total:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
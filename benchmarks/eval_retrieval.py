@@ -0,0 +1,117 @@
+"""Offline retrieval quality and per-stage latency for one chat's index.
+
+Usage:
+    python -m benchmarks.eval_retrieval --user USER_ID --chat CHAT_ID --questions eval.jsonl
+                                        [--k 5] [--reranker cross-encoder/ms-marco-MiniLM-L-6-v2]
+                                        [--budget-ms 300] [--dedup-thresholds 0.9 0.95 0.98]
+
+eval.jsonl has one question per line:
+    {"question": "How many days of annual leave?", "expected": ["20 days"]}
+A chunk counts as relevant when it contains one of the "expected" strings
+(case-insensitive). For dense only, dense + keyword (RRF) and, with a
+reranker, dense + keyword + rerank it prints hit@k and MRR@k; then the
+p50/p95 latency of every stage. Each question is run twice, so the second
+pass shows the reranker's score cache. With --dedup-thresholds it also
+scores dense + keyword after drop_near_duplicates at each threshold, with
+the average number of candidates left: a threshold that lowers hit@k
+drops chunks that were not just copies.
+"""
+import json
+import time
+import argparse
+
+import numpy as np
+
+from app.config import TOP_K, SIMILARITY_THRESHOLD, RERANKER_MODEL, RERANK_BATCH_SIZE, RETRIEVAL_DUPLICATE_THRESHOLD
+from app.faiss_db import load_faiss_index
+from app.embeddings import embeddings_model
+from app.sparse_index import keyword_search, reciprocal_rank_fusion
+from app.reranker import CrossEncoderReranker
+from app.retrieval import candidate_vectors, drop_near_duplicates
+
+
+def first_relevant(docs, expected, k):
+    for rank, doc in enumerate(docs[:k], start=1):
+        text = doc.page_content.lower()
+        if any(e.lower() in text for e in expected):
+            return rank
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--chat", required=True)
+    parser.add_argument("--questions", required=True)
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--reranker", default=RERANKER_MODEL)
+    parser.add_argument("--budget-ms", type=int, default=300)
+    parser.add_argument("--dedup-thresholds", type=float, nargs="*", default=[])
+    args = parser.parse_args()
+
+    with open(args.questions, encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    index = load_faiss_index(args.user, args.chat, use_cache=False)
+    if index is None:
+        raise SystemExit(f"No index for user {args.user} chat {args.chat}")
+    reranker = CrossEncoderReranker(args.reranker, RERANK_BATCH_SIZE, args.budget_ms) if args.reranker else None
+
+    timings = {}
+    ranks = {"dense": [], "dense+keyword": [], "dense+keyword+rerank": []}
+    for threshold in args.dedup_thresholds:
+        ranks[f"dedup@{threshold}"] = []
+    dedup_kept = {threshold: [] for threshold in args.dedup_thresholds}
+
+    def timed(stage, fn, *fn_args, **fn_kwargs):
+        start = time.perf_counter()
+        result = fn(*fn_args, **fn_kwargs)
+        timings.setdefault(stage, []).append((time.perf_counter() - start) * 1000)
+        return result
+
+    for repeat in range(2):
+        for case in cases:
+            question, expected = case["question"], case["expected"]
+            vector = timed("embed", embeddings_model.embed_query, question)
+            results = timed("dense", index.similarity_search_with_score_by_vector, vector, k=TOP_K * 3)
+            dense = [doc for doc, score in results if score <= SIMILARITY_THRESHOLD * 1.5]
+            if len(dense) < 3:
+                dense = [doc for doc, score in results[:TOP_K]]
+            keyword = timed("keyword", keyword_search, index, question, TOP_K * 3)
+            fused = timed("fuse", reciprocal_rank_fusion, [dense, keyword]) if keyword else dense
+            vectors = timed("vectors", candidate_vectors, index, fused)
+            if not repeat:
+                for threshold in args.dedup_thresholds:
+                    kept, _ = drop_near_duplicates(fused, vectors, threshold)
+                    ranks[f"dedup@{threshold}"].append(first_relevant(kept, expected, args.k))
+                    dedup_kept[threshold].append(len(kept) / max(len(fused), 1))
+            fused, _ = timed("dedup", drop_near_duplicates, fused, vectors, RETRIEVAL_DUPLICATE_THRESHOLD)
+
+            stage_rerank = "rerank (cached)" if repeat else "rerank"
+            reranked = timed(stage_rerank, reranker.rerank, question, fused) if reranker else None
+            if repeat:
+                continue
+            ranks["dense"].append(first_relevant(dense, expected, args.k))
+            ranks["dense+keyword"].append(first_relevant(fused, expected, args.k))
+            if reranked is not None:
+                ranks["dense+keyword+rerank"].append(first_relevant(reranked, expected, args.k))
+
+    print(f"{len(cases)} questions, k={args.k}")
+    print(f"{'pipeline':<24} {'hit@k':>7} {'MRR@k':>7}")
+    for name, found in ranks.items():
+        if found:
+            hit = sum(r is not None for r in found) / len(found)
+            mrr = sum(1 / r for r in found if r) / len(found)
+            print(f"{name:<24} {hit:>7.3f} {mrr:>7.3f}")
+    for threshold, shares in dedup_kept.items():
+        print(f"dedup@{threshold} keeps {np.mean(shares):.1%} of the fused candidates on average")
+
+    print(f"\n{'stage':<18} {'p50 ms':>8} {'p95 ms':>8}")
+    for stage, values in timings.items():
+        print(f"{stage:<18} {np.percentile(values, 50):>8.2f} {np.percentile(values, 95):>8.2f}")
+    if reranker:
+        print("\nreranker:", reranker.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""A local stand-in for Groq's OpenAI-compatible chat completions API.
+
+Usage:
+    python -m benchmarks.fake_groq [--port 8090] [--latency 0.5] [--rpm 30] [--tpm 6000]
+                                   [--fail-rate 0.0]
+    GROQ_BASE_URL=http://127.0.0.1:8090/openai/v1 uvicorn main:app
+
+POST /openai/v1/chat/completions answers (streamed or not) after --latency
+seconds, with Groq's x-ratelimit-* headers for a per-minute request and
+token budget. Over budget it returns 429 with retry-after and Groq's
+"Please try again in ..." message; --fail-rate makes that share of calls
+fail with 503. The token budget counts prompt and completion tokens, as
+Groq's does. Responses carry usage, with a system prompt seen before
+counted as cached_tokens like a provider's prefix cache. GET /stats shows
+what the server saw, including the peak number of concurrent requests
+and streams the client closed before the end (cancelled).
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_app(latency=0.5, rpm=30, tpm=6000, fail_rate=0.0, window=60.0,
+               answer="Employees get **20 days** of annual leave."):
+    """rpm/tpm are per window seconds (a minute, like Groq; shorter for benchmarks)"""
+    app = FastAPI()
+    state = {"started": time.monotonic(), "requests": 0, "tokens": 0}
+    stats = {"calls": 0, "ok": 0, "rate_limited": 0, "failed": 0, "cancelled": 0, "concurrent": 0, "peak_concurrent": 0}
+    cached_prefixes = set()
+
+    def refresh(now):
+        if now - state["started"] >= window:
+            state.update(started=now, requests=0, tokens=0)
+
+    def limit_headers(now):
+        reset = window - (now - state["started"])
+        return {
+            "x-ratelimit-limit-requests": str(rpm),
+            "x-ratelimit-remaining-requests": str(max(rpm - state["requests"], 0)),
+            "x-ratelimit-reset-requests": f"{reset:.2f}s",
+            "x-ratelimit-limit-tokens": str(tpm),
+            "x-ratelimit-remaining-tokens": str(max(tpm - state["tokens"], 0)),
+            "x-ratelimit-reset-tokens": f"{reset:.2f}s"
+        }
+
+    def usage(messages, cost):
+        system = messages[0].get("content", "") if messages and messages[0].get("role") == "system" else ""
+        cached = len(system) // 4 if system in cached_prefixes else 0
+        if system:
+            cached_prefixes.add(system)
+        return {
+            "prompt_tokens": cost,
+            "completion_tokens": len(answer) // 4 + 1,
+            "total_tokens": cost + len(answer) // 4 + 1,
+            "prompt_tokens_details": {"cached_tokens": cached}
+        }
+
+    @app.get("/stats")
+    def get_stats():
+        return stats
+
+    @app.post("/openai/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        stats["calls"] += 1
+        now = time.monotonic()
+        refresh(now)
+        cost = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4 + 1
+        completion = len(answer) // 4 + 1
+
+        if state["requests"] + 1 > rpm or state["tokens"] + cost + completion > tpm:
+            stats["rate_limited"] += 1
+            wait = window - (now - state["started"])
+            minutes, seconds = divmod(wait, 60)
+            return JSONResponse(
+                {"error": {
+                    "message": f"Rate limit reached for model `{body.get('model')}`. "
+                               f"Please try again in {int(minutes)}m{seconds:.3f}s.",
+                    "type": "tokens", "code": "rate_limit_exceeded"
+                }},
+                status_code=429,
+                headers={**limit_headers(now), "retry-after": str(int(wait) + 1)}
+            )
+        if random.random() < fail_rate:
+            stats["failed"] += 1
+            return JSONResponse({"error": {"message": "Service Unavailable"}}, status_code=503)
+
+        state["requests"] += 1
+        state["tokens"] += cost + completion
+        headers = limit_headers(now)
+        used = usage(body.get("messages", []), cost)
+        stats["concurrent"] += 1
+        stats["peak_concurrent"] = max(stats["peak_concurrent"], stats["concurrent"])
+
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(latency)
+            finally:
+                stats["concurrent"] -= 1
+            stats["ok"] += 1
+            return JSONResponse({
+                "id": "fake", "object": "chat.completion", "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": used
+            }, headers=headers)
+
+        async def events():
+            finished = False
+            try:
+                words = answer.split(" ")
+                for i, word in enumerate(words):
+                    await asyncio.sleep(latency / len(words))
+                    delta = {"content": word + (" " if i < len(words) - 1 else "")}
+                    yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': delta}]})}\n\n"
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    yield f"data: {json.dumps({'choices': [], 'usage': used})}\n\n"
+                yield "data: [DONE]\n\n"
+                stats["ok"] += 1
+                finished = True
+            finally:
+                stats["concurrent"] -= 1
+                if not finished:
+                    stats["cancelled"] += 1
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--rpm", type=int, default=30)
+    parser.add_argument("--tpm", type=int, default=6000)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.rpm, args.tpm, args.fail_rate), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
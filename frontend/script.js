@@ -657,7 +657,7 @@ function startStatusCheck(chatId) {
                 chatWindow.appendChild(msgDiv);
                 chatWindow.scrollTo({ top: chatWindow.scrollHeight, behavior: "smooth" });
                 
-            } else if (status.status === "failed" && !readyShown) {
+            } else if ((status.status === "failed" || status.status === "cancelled") && !readyShown) {
                
                 clearInterval(statusCheckInterval);
                 statusCheckInterval = null;
@@ -709,7 +709,7 @@ async function askQuestion() {
             const res = await apiFetch(`${API_BASE}/processing-status/${currentChatId}`);
             const status = await res.json();
             
-            if (status.status === "processing") {
+            if (["queued", "loading", "embedding"].includes(status.status)) {
                 addChatMessage("bot", 
                     `⏳ **Please wait...**\n\n` +
                     `Your PDF is still being processed.\n` +
@@ -740,18 +740,40 @@ async function askQuestion() {
     btn.disabled = true;
 
     try {
-        const res = await apiFetch(`${API_BASE}/ask`, {
+        const res = await apiFetch(`${API_BASE}/ask/stream`, {
             method: "POST", headers: { "Content-Type": "application/json" },
             body: JSON.stringify({ question, chat_id: currentChatId })
         });
-        const data = await res.json();
-        removeTyping();
-        
-        let reply = data.answer ? data.answer.trim() : "No response received.";
+        if (!res.ok || !res.body) {
+            const data = await res.json().catch(() => ({}));
+            removeTyping();
+            addChatMessage("bot", data.detail || "No response received.");
+            return;
+        }
+
         const msgDiv = document.createElement("div");
         msgDiv.className = "message bot";
-        document.getElementById("chat-window").appendChild(msgDiv);
-        typeWriter(msgDiv, reply);
+        let started = false;
+
+        await readAnswerStream(res, (event, data) => {
+            if (!started) {
+                removeTyping();
+                document.getElementById("chat-window").appendChild(msgDiv);
+                started = true;
+            }
+            if (event === "delta") {
+                msgDiv.innerHTML += data.html;
+            } else if (event === "done") {
+                // the final answer has the sources and replaces what was streamed
+                msgDiv.innerHTML = data.answer ? data.answer.trim() : "No response received.";
+            }
+            msgDiv.scrollIntoView({ behavior: "smooth", block: "nearest" });
+        });
+
+        if (!started) {
+            removeTyping();
+            addChatMessage("bot", "No response received.");
+        }
         
         chatsCache = null;
         
@@ -761,6 +783,32 @@ async function askQuestion() {
     } finally { btn.disabled = false; }
 }
 
+async function readAnswerStream(res, onEvent) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = "message";
+            let data = "";
+            for (const line of raw.split("\n")) {
+                if (line.startsWith("event: ")) event = line.slice(7);
+                else if (line.startsWith("data: ")) data += line.slice(6);
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
 function addChatMessage(sender, text, skipTypewriter = false) {
     const chatWindow = document.getElementById("chat-window");
     const empty = document.querySelector(".empty-chat");
@@ -1,26 +1,34 @@
 import os
+import re
+import json
 import time
 import shutil
+import asyncio
 from fastapi import FastAPI, File, UploadFile, Depends, HTTPException
 from uuid import UUID
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-
-from app.schemas import AuthRequest, QuestionRequest
-from app.database import supabase_anon, get_supabase_user_client
+from fastapi.responses import FileResponse, StreamingResponse
+
+from app.schemas import AuthRequest, QuestionRequest, IndexStorageRequest
+from app.database import (
+    supabase_anon,
+    get_supabase_user_client,
+    get_async_user_client,
+    close_async_http,
+    message_journal
+)
+from app import crud_async
+from app.chat_memory import chat_memory
 from app.config import (
     UPLOAD_DIR, CHUNK_SIZE, CHUNK_OVERLAP, TOP_K,
-    MAX_FILE_SIZE_MB, MAX_CONTEXT_CHARS, SIMILARITY_THRESHOLD, FAISS_PATH
+    MAX_FILE_SIZE_MB, SIMILARITY_THRESHOLD, FAISS_PATH,
+    INGEST_WORKERS, RERANK_TOP_N, RETRIEVAL_DUPLICATE_THRESHOLD, MMR_LAMBDA,
+    CONTEXT_MIN_TOKENS, LLM_BACKEND
 )
-from fastapi import BackgroundTasks
-from app.auth import get_current_user
+from app.auth import get_current_user, require_metrics_token, token_verifier
 from app.crud import (
     insert_pdf,
     create_chat,
-    set_chat_title,
-    insert_message,
-    get_user_chats,
-    get_chat_messages,
     delete_user_chats
 )
 from app.pdf_reader import load_pdf
@@ -28,11 +36,26 @@ from app.text_splitter import split_text
 from app.faiss_db import (
     create_or_update_faiss,
     load_faiss_index,
-
+    delete_faiss_index,
+    load_index_manifest,
+    get_index_version,
+    set_index_storage,
+    index_rebuilder,
+    faiss_cache
 )
-from app.llm import get_llm_response, build_memory
-from app.formatter import format_text
+from app.embeddings import query_vectors
+from app.embedding_engine import embedding_engine
+from app.answer_cache import answer_cache
+from app.sparse_index import keyword_search, reciprocal_rank_fusion
+from app.reranker import reranker
+from app.retrieval import candidate_vectors, drop_near_duplicates, mmr_select
+from app.context_packer import context_token_budget, pack_context, token_counter
+from app.ingest_scheduler import IngestScheduler, IngestCancelled
+from app.llm import get_llm_response, stream_llm_response, build_memory
+from app.llm_backends import llm_backends, get_backend, close_backends
+from app.formatter import format_text, StreamingFormatter
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
 import threading
 
@@ -41,24 +64,29 @@ status_lock = threading.Lock()
 
 app = FastAPI(title="PDF Chatbot")
 
-def process_pdf_background(file_path, filename, user_id, access_token, chat_id):
+def process_pdf_batch(jobs):
+    """Index every queued PDF of one chat with a single FAISS write"""
+    user_id = jobs[0].user_id
+    chat_id = jobs[0].chat_id
+    access_token = jobs[-1].access_token
+    filenames = [job.filename for job in jobs]
     status_key = f"{user_id}:{chat_id}"
     try:
         with status_lock:
             processing_status[status_key] = {
                 "status": "loading",
                 "progress": 0,
-                "message": "Loading PDF...",
+                "message": "Loading PDF..." if len(jobs) == 1 else f"Loading {len(jobs)} PDFs...",
                 "start_time": datetime.now().isoformat(),
-                "filename": filename
+                "filename": ", ".join(filenames),
+                "files": filenames
             }
-        
-        print("📄 Processing PDF:", filename)
+
+        print("📄 Processing PDFs:", filenames)
         print("👤 User:", user_id)
         print("💬 Chat:", chat_id)
-        from app.pdf_reader import load_pdf
+        from app.pdf_reader import get_pdf_page_count, iter_pdf_pages
         from app.text_splitter import split_text
-        from app.config import CHUNK_SIZE, CHUNK_OVERLAP
         from app.faiss_db import create_or_update_faiss
         from app.database import get_supabase_user_client
         from app.crud import insert_pdf
@@ -66,60 +94,104 @@ def process_pdf_background(file_path, filename, user_id, access_token, chat_id):
 
 
         print("📖 Loading PDF...")
-        pages = load_pdf(file_path)
-        if not pages:
+        page_counts = {}
+        errors = []
+        for job in jobs:
+            try:
+                page_counts[job.id] = get_pdf_page_count(job.file_path)
+            except Exception as e:
+                print(f"❌ Skipping {job.filename}: {e}")
+                errors.append(f"{job.filename}: {e}")
+
+        if not page_counts:
+            raise ValueError("; ".join(errors))
+
+        total_pages = sum(page_counts.values())
+        with status_lock:
+            processing_status[status_key]["total_pages"] = total_pages
+            processing_status[status_key]["message"] = f"Processing {total_pages} pages..."
+
+        def iter_chunks():
+            # pages arrive from the extraction pool while later ones are still
+            # being parsed; their chunks go straight on to dedup and embedding
+            pages_done = 0
+            for job in jobs:
+                if job.id not in page_counts:
+                    continue
+                job_pages = page_counts[job.id]
+                chunk_size, chunk_overlap = get_chunk_settings(job_pages)
+                print(f"📊 Using chunk_size={chunk_size}, overlap={chunk_overlap} for {job_pages} pages of {job.filename}")
+
+                for page in iter_pdf_pages(job.file_path, job_pages):
+                    job.raise_if_cancelled()
+                    text = page.get("text", "").strip()
+                    page_number = page.get("page") or 0
+                    pages_done += 1
+                    if not text:
+                        print(f"⚠️ Page {page_number + 1} has no text, skipping")
+                        continue
+                    print(f"✂️ Splitting page {page_number+1}")
+                    page_chunks = split_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+                    for chunk in page_chunks:
+                        yield {
+                            "text": chunk,
+                            "metadata": {
+                                "source": job.filename,
+                                "page": page_number + 1
+                            }
+                        }
+                    print(f"   Created {len(page_chunks)} chunks from page {page_number + 1}")
+
+                    progress = int(pages_done / total_pages * 40)
+                    with status_lock:
+                        if status_key in processing_status:
+                            processing_status[status_key]["progress"] = progress
+                            processing_status[status_key]["message"] = f"Splitting pages... ({pages_done}/{total_pages})"
+
+            with status_lock:
+                if status_key in processing_status:
+                    processing_status[status_key]["status"] = "embedding"
+                    processing_status[status_key]["message"] = "Creating embeddings..."
+                    processing_status[status_key]["progress"] = 50
+
+        def on_embedding_progress(done, total):
+            with status_lock:
+                status = processing_status.get(status_key)
+                if not status or status.get("status") != "embedding":
+                    return
+                # the last chunks can still be submitted after the status flips
+                # to embedding, so total may grow: never move the bar backwards
+                progress = 50 + int(done / total * 40) if total else 50
+                status["progress"] = max(status.get("progress", 50), min(progress, 90))
+                status["message"] = f"Creating embeddings ({done}/{total} chunks)..."
+
+        def mark_cancelled():
             with status_lock:
                 processing_status[status_key] = {
-                    "status": "failed",
-                    "message": "No pages extracted",
-                    "error": "PDF has no readable text"
+                    "status": "cancelled",
+                    "message": "Processing cancelled",
+                    "error": "Processing was cancelled",
+                    "completed_time": datetime.now().isoformat()
                 }
-            print("No pages extracted")
-            return
+            print("🛑 Processing cancelled")
 
-        print(f"✅ Extracted {len(pages)} pages from PDF")
-        
-        total_pages = len(pages)
+        def check_cancelled():
+            for job in jobs:
+                job.raise_if_cancelled()
 
-        chunk_size, chunk_overlap = get_chunk_settings(total_pages)
-        print(f"📊 Using chunk_size={chunk_size}, overlap={chunk_overlap} for {total_pages} pages")
-        with status_lock:
-            processing_status[status_key]["total_pages"] = len(pages)
-            processing_status[status_key]["message"] = f"Processing {len(pages)} pages..."
-        
-        if pages and len(pages) > 0:
-            print(f"First page preview: {pages[0]['text'][:200]}...")
-
-        chunks_with_meta = []
-        total_pages = len(pages)
-
-        for page_idx, page in enumerate(pages):
-            text = page.get("text", "").strip()
-            page_number = page.get("page") or 0
-            if not text:
-                print(f"⚠️ Page {page_number + 1} has no text, skipping")
-                continue
-            print(f"✂️ Splitting page {page_number+1}")
-            page_chunks = split_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-
-            for i, chunk in enumerate(page_chunks):
-                chunks_with_meta.append({
-                    "text": chunk,
-                    "metadata": {
-                        "source": filename,
-                        "page": page_number + 1
-                    }
-                })
-            print(f"   Created {len(page_chunks)} chunks from page {page_number + 1}")
-            
-            
-            progress = int((page_idx + 1) / total_pages * 40)  
-            with status_lock:
-                if status_key in processing_status:
-                    processing_status[status_key]["progress"] = progress
-                    processing_status[status_key]["message"] = f"Splitting pages... ({page_idx + 1}/{total_pages})"
+        print("🧠 Creating embeddings & updating FAISS...")
+        try:
+            total_chunks = create_or_update_faiss(
+                iter_chunks(), user_id, chat_id,
+                progress_callback=on_embedding_progress,
+                check_cancelled=check_cancelled
+            )
+        except IngestCancelled:
+            mark_cancelled()
+            return
 
-        if not chunks_with_meta:
+        if not total_chunks:
             with status_lock:
                 processing_status[status_key] = {
                     "status": "failed",
@@ -129,22 +201,24 @@ def process_pdf_background(file_path, filename, user_id, access_token, chat_id):
             print("No chunks created")
             return
 
-        print(f"🧠 Total chunks: {len(chunks_with_meta)}")
-        
-        with status_lock:
-            processing_status[status_key]["status"] = "embedding"
-            processing_status[status_key]["message"] = f"Creating embeddings ({len(chunks_with_meta)} chunks)..."
-            processing_status[status_key]["progress"] = 50
-        
-        print("🧠 Creating embeddings & updating FAISS...")
-        create_or_update_faiss(chunks_with_meta, user_id, chat_id)
+        print(f"🧠 Total chunks: {total_chunks}")
 
         with status_lock:
             processing_status[status_key]["progress"] = 90
             processing_status[status_key]["message"] = "Saving to database..."
 
+        if any(job.cancelled for job in jobs):
+            mark_cancelled()
+            return
+
         supabase = get_supabase_user_client(access_token)
-        insert_pdf(supabase, user_id, filename, chat_id)
+        indexed = [job.filename for job in jobs if job.id in page_counts]
+        for filename in indexed:
+            insert_pdf(supabase, user_id, filename, chat_id)
+
+        if any(job.cancelled for job in jobs):
+            mark_cancelled()
+            return
 
         with status_lock:
             processing_status[status_key] = {
@@ -152,13 +226,16 @@ def process_pdf_background(file_path, filename, user_id, access_token, chat_id):
                 "progress": 100,
                 "message": "Ready to answer questions!",
                 "completed_time": datetime.now().isoformat(),
-                "filename": filename,
-                "chunks": len(chunks_with_meta),
-                "pages": len(pages)
+                "filename": ", ".join(indexed),
+                "files": indexed,
+                "chunks": total_chunks,
+                "pages": total_pages
             }
+            if errors:
+                processing_status[status_key]["skipped"] = errors
 
         print("✅ Indexing complete")
-        print(f"✅ PDF processed successfully: {filename}")
+        print(f"✅ PDFs processed successfully: {indexed}")
     except Exception as e:
         print("❌ PDF processing failed:", str(e))
         import traceback
@@ -169,6 +246,12 @@ def process_pdf_background(file_path, filename, user_id, access_token, chat_id):
                 "message": "Processing failed",
                 "error": str(e)
             }
+
+
+ingest_scheduler = IngestScheduler(
+    workers=INGEST_WORKERS,
+    handler=process_pdf_batch
+)
     
 MAX_RETRIES = 3   
 RETRY_DELAY = 2     
@@ -190,8 +273,6 @@ app.add_middleware(
 app.mount("/static", StaticFiles(directory="frontend"), name="static")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-CACHE = {}
-CACHE_LIMIT = 500
 
 
 @app.get("/")
@@ -235,7 +316,6 @@ def login(data: AuthRequest):
 
 @app.post("/upload-multiple")
 async def upload_multiple_pdfs(
-    background_tasks: BackgroundTasks,
     files: list[UploadFile] = File(...),
     chat_id: str = None,
     user=Depends(get_current_user)
@@ -270,6 +350,7 @@ async def upload_multiple_pdfs(
     
     uploaded_count = 0
     skipped_files = []  
+    queued_files = []
 
     for file in files:
         if file.content_type != "application/pdf":
@@ -302,25 +383,41 @@ async def upload_multiple_pdfs(
             os.remove(file_path)  # Skip ki file ko delete karo
             continue  # Skip this file
 
-        background_tasks.add_task(
-            process_pdf_background,
-                file_path,
-                file.filename,
-                user["id"],
-                user["access_token"],
-                final_chat_id
+        ingest_scheduler.submit(
+            user["id"],
+            final_chat_id,
+            file_path,
+            file.filename,
+            user["access_token"]
         )
+        queued_files.append(file.filename)
        
     if uploaded_count == 0:
         raise HTTPException(status_code=400, detail="No valid PDFs uploaded")
 
+    if queued_files:
+        status_key = f"{user['id']}:{final_chat_id}"
+        with status_lock:
+            current = processing_status.get(status_key)
+            # a batch already running for this chat keeps its status; the new
+            # files are picked up as the next batch
+            if not current or current.get("status") not in ("loading", "embedding"):
+                processing_status[status_key] = {
+                    "status": "queued",
+                    "progress": 0,
+                    "message": "Waiting for a free worker...",
+                    "start_time": datetime.now().isoformat(),
+                    "filename": ", ".join(queued_files),
+                    "files": queued_files
+                }
 
     return {
         "message": "Uploading started",
         "uploaded_files": uploaded_count - len(skipped_files),
         "skipped_files": skipped_files,  
         "chat_id": final_chat_id,
-        "status": "processing"
+        "status": "queued",
+        "queue_depth": ingest_scheduler.queue_depth()
     }
 
 @app.post("/chats")
@@ -339,16 +436,16 @@ def new_chat(user=Depends(get_current_user)):
     return chat
 
 @app.get("/chats")
-def list_chats(user=Depends(get_current_user)):
-    supabase = get_supabase_user_client(user["access_token"])
-    chats = get_user_chats(supabase)
+async def list_chats(user=Depends(get_current_user)):
+    db = get_async_user_client(user["access_token"])
+    chats = await crud_async.get_user_chats(db)
     chats.sort(key=lambda x: x.get('created_at', ''), reverse=True)
     return chats
 
 @app.get("/chats/{chat_id}")
-def open_chat(chat_id: str, user=Depends(get_current_user)):
-    supabase = get_supabase_user_client(user["access_token"])
-    return get_chat_messages(supabase, chat_id)
+async def open_chat(chat_id: str, user=Depends(get_current_user)):
+    db = get_async_user_client(user["access_token"])
+    return await crud_async.get_chat_messages(db, user["id"], chat_id)
 
 @app.get("/processing-status/{chat_id}")
 def get_processing_status(chat_id: str, user=Depends(get_current_user)):
@@ -357,18 +454,34 @@ def get_processing_status(chat_id: str, user=Depends(get_current_user)):
     
     with status_lock:
         if status_key in processing_status:
-            status = processing_status[status_key]
+            status = dict(processing_status[status_key])
             
-            if status.get("status") in ["completed", "failed"]:
+            if status.get("status") in ["completed", "failed", "cancelled"]:
                 try:
                     completed_time = datetime.fromisoformat(status.get("completed_time", "2000-01-01"))
                     if (datetime.now() - completed_time).seconds > 300:  
                         del processing_status[status_key]
                 except:
                     pass
-            
+
+            queued = ingest_scheduler.queued_files(user["id"], chat_id)
+            if queued and status.get("status") == "completed":
+                # more PDFs for this chat are waiting for the next batch
+                status["status"] = "queued"
+                status["message"] = f"{len(queued)} more PDF(s) waiting to be processed..."
+            status["queued_files"] = queued
+            status["queue_depth"] = ingest_scheduler.queue_depth()
             return status
 
+    manifest = load_index_manifest(user["id"], chat_id)
+    if manifest and manifest["sources"]:
+        return {
+            "status": "completed",
+            "message": "PDF already processed",
+            "files": list(manifest["sources"]),
+            "chunks": manifest["total_chunks"]
+        }
+
     supabase = get_supabase_user_client(user["access_token"])
     pdf_check = supabase.table("pdfs") \
         .select("filename") \
@@ -381,6 +494,28 @@ def get_processing_status(chat_id: str, user=Depends(get_current_user)):
     
     return {"status": "unknown", "message": "No PDF found"}
 
+@app.post("/processing-status/{chat_id}/cancel")
+def cancel_processing(chat_id: str, user=Depends(get_current_user)):
+    """Cancel queued and running PDF processing for a chat"""
+    cancelled = ingest_scheduler.cancel(user["id"], chat_id)
+    if not cancelled:
+        raise HTTPException(status_code=404, detail="No PDF processing to cancel")
+
+    status_key = f"{user['id']}:{chat_id}"
+    with status_lock:
+        if not ingest_scheduler.is_running(user["id"], chat_id):
+            processing_status[status_key] = {
+                "status": "cancelled",
+                "message": "Processing cancelled",
+                "error": "Processing was cancelled",
+                "completed_time": datetime.now().isoformat()
+            }
+
+    return {
+        "message": "Processing cancelled",
+        "cancelled_files": [job.filename for job in cancelled]
+    }
+
 def estimate_remaining_time(status):
     """Estimate remaining processing time"""
     if status.get("progress", 0) < 30:
@@ -398,6 +533,20 @@ def estimate_remaining_time(status):
 @app.get("/chats/{chat_id}/pdfs")
 def get_chat_pdfs(chat_id: str, user = Depends(get_current_user)):
     """Get all PDFs for a specific chat"""
+    manifest = load_index_manifest(user["id"], chat_id)
+    if manifest is not None:
+        return {"pdfs": [
+            {
+                "filename": filename,
+                "created_at": entry.get("indexed_at"),
+                "chunks": entry.get("chunks"),
+                "first_page": entry.get("first_page"),
+                "last_page": entry.get("last_page")
+            }
+            for filename, entry in manifest["sources"].items()
+        ]}
+
+    # indexes saved before manifests existed
     supabase = get_supabase_user_client(user["access_token"])
     
     pdfs = supabase.table("pdfs").select("filename, upload_date").eq("chat_id", chat_id).eq("user_id", user["id"]).execute()
@@ -410,12 +559,42 @@ def get_chat_pdfs(chat_id: str, user = Depends(get_current_user)):
         })
     
     return {"pdfs": result}
+
+@app.put("/chats/{chat_id}/index-storage")
+def update_index_storage(chat_id: str, req: IndexStorageRequest, user=Depends(get_current_user)):
+    """Keep a chat's vectors as float32 or compressed (sq8 / pq, with exact re-ranking).
+
+    Compression lowers the RAM a loaded chat takes. Its disk use only
+    drops with exact_rerank false: otherwise the float32 vectors stay on
+    disk for re-ranking. "storage" is the mode in use, which is sq8 for a
+    "pq" chat that is still too small for PQ; "requested_storage" is the
+    chat's setting.
+    """
+    try:
+        manifest = set_index_storage(user["id"], chat_id, req.mode, req.exact_rerank)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="This chat has no index yet")
+
+    return {
+        "chat_id": chat_id,
+        "storage": manifest.get("effective_storage"),
+        "requested_storage": manifest.get("storage"),
+        "exact_rerank": manifest.get("exact_rerank"),
+        "index_type": manifest.get("index_type"),
+        "total_chunks": manifest.get("total_chunks")
+    }
 ######
 
-@app.post("/ask")
-def ask_question(req: QuestionRequest, user=Depends(get_current_user)):
-    supabase = get_supabase_user_client(user["access_token"])
+async def prepare_question(req, user, db):
+    """Everything /ask does before calling the LLM.
 
+    Returns {"response": ...} when the question is answered without the LLM
+    (question history, missing index, nothing retrieved); otherwise the
+    memory, context, retrieved docs and cache key for the LLM call.
+    """
     print("===== ASK DEBUG =====")
     print("ASK USER ID:", user["id"])
     print("ASK CHAT ID:", req.chat_id)
@@ -426,13 +605,21 @@ def ask_question(req: QuestionRequest, user=Depends(get_current_user)):
     except:
         raise HTTPException(status_code=400, detail="Invalid chat_id")
 
-    import re
+    try:
+        backend = get_backend(req.backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # messages are journaled (and may be sent with the service key) before
+    # Supabase sees them, so check here that the chat is the user's
+    if not await crud_async.can_read_chat(db, user["id"], req.chat_id):
+        raise HTTPException(status_code=404, detail="Chat not found")
 
     history_pattern = r"what is my \d+(st|nd|rd|th) question"
 
     if re.search(history_pattern, req.question.lower()):
 
-        previous_messages = get_chat_messages(supabase, req.chat_id)
+        previous_messages = await crud_async.get_chat_messages(db, user["id"], req.chat_id)
 
         questions = [
             m["content"]
@@ -451,28 +638,32 @@ def ask_question(req: QuestionRequest, user=Depends(get_current_user)):
         except:
             answer = "Could not determine the question number."
 
-        insert_message(supabase, user["id"], req.chat_id, "assistant", answer)
+        await crud_async.insert_message(db, user["id"], req.chat_id, "assistant", answer)
 
-        return {
+        return {"response": {
             "answer": answer,
             "used_pdf_context": False,
             "chat_id": req.chat_id
-        }
-    insert_message(supabase, user["id"], req.chat_id, "user", req.question)
+        }}
+
+    # the question is recorded first, so the recent history ends with it;
+    # only the last CHAT_MEMORY_MESSAGES messages are read (and usually
+    # come from the in-process chat memory, not Supabase)
+    await crud_async.insert_message(db, user["id"], req.chat_id, "user", req.question)
+    previous_messages = await crud_async.get_recent_messages(db, user["id"], req.chat_id)
+
     follow_up_patterns = [
         "what about",
         "its",
         "their",
         "those",
         "these",
-    ]   
+    ]
 
     question_lower = req.question.lower()
 
     if any(p in question_lower for p in follow_up_patterns):
 
-        previous_messages = get_chat_messages(supabase, req.chat_id)
-
         last_user_questions = [
             m["content"]
             for m in previous_messages
@@ -483,7 +674,6 @@ def ask_question(req: QuestionRequest, user=Depends(get_current_user)):
 
         for q in reversed(last_user_questions):
             q_lower = q.lower()
-
             if not any(p in q_lower for p in follow_up_patterns):
                 base_question = q
                 break
@@ -492,10 +682,6 @@ def ask_question(req: QuestionRequest, user=Depends(get_current_user)):
             req.question = base_question + " " + req.question
             print("🔁 Rewritten Question:", req.question)
 
-    previous_messages = sorted(
-        get_chat_messages(supabase, req.chat_id),
-        key=lambda x: x.get("created_at")
-    )
     memory = build_memory()
     for msg in previous_messages:
         if msg.get("role") == "user":
@@ -504,61 +690,115 @@ def ask_question(req: QuestionRequest, user=Depends(get_current_user)):
         elif msg.get("role") == "assistant":
             memory.chat_memory.add_ai_message(msg.get("content", ""))
 
-    user_folder = os.path.join(FAISS_PATH, f"user_{user['id']}")
-
-    if os.path.exists(user_folder):
-        print("Available chat folders:", os.listdir(user_folder))
-    else:
-        print("User FAISS folder does not exist yet")
+    # the question is embedded once; the answer cache and every index
+    # search below use this vector
+    index_version = get_index_version(user["id"], req.chat_id)
+    question_vector = None
+    if index_version:
+        question_vector = await run_in_threadpool(query_vectors.embed, req.question)
+
+        # a question already answered (or paraphrased) against this version of
+        # the chat's index reuses that answer and its sources: no search, no LLM
+        cached = answer_cache.lookup(
+            user["id"], req.chat_id, index_version, req.question, question_vector, req.backend or LLM_BACKEND
+        )
+        if cached:
+            return {
+                "memory": memory,
+                "context": "",
+                "filtered_docs": cached["filtered_docs"],
+                "best_docs": cached["best_docs"],
+                "cached_answer": cached["answer"]
+            }
 
-    faiss_index = load_faiss_index(user["id"], req.chat_id)
+    # index loading, search and dedup are CPU work; keep them off the event loop
+    retrieved = await run_in_threadpool(
+        retrieve_for_question, req, user, question_vector, memory.chat_memory.messages[-memory.k * 2:], backend
+    )
 
-    if not faiss_index:
+    if retrieved is None:
+        answer = None
         status_key = f"{user['id']}:{req.chat_id}"
         with status_lock:
             if status_key in processing_status:
                 status = processing_status[status_key]
-                if status["status"] == "processing":
+                if status["status"] in ("queued", "loading", "embedding"):
                     answer = f"""⏳ **Your PDF is being processed...**
 
-{status.get('message', 'Processing')}  
+{status.get('message', 'Processing')}
 📊 **Progress:** {status.get('progress', 0)}% complete
 
 Estimated time remaining: {estimate_remaining_time(status)}
 
 _You'll be notified when ready. Please wait..._"""
-                    
-                    insert_message(supabase, user["id"], req.chat_id, "assistant", answer)
-                    return {"answer": answer, "used_pdf_context": False}
-                
+
                 elif status["status"] == "failed":
                     answer = f"""❌ **PDF processing failed**
 
 {status.get('error', 'Unknown error')}
 
 Please try uploading again."""
-                    insert_message(supabase, user["id"], req.chat_id, "assistant", answer)
-                    return {"answer": answer, "used_pdf_context": False}
-        pdf_check = supabase.table("pdfs") \
-            .select("filename, created_at") \
-            .eq("user_id", user["id"]) \
-            .eq("chat_id", req.chat_id) \
-            .execute()
-        
-        if pdf_check.data and len(pdf_check.data) > 0:
-            answer = """⏳ **Your PDF was uploaded but is still being processed...**
+
+        if answer is None:
+            pdf_check = await crud_async.get_chat_pdfs(db, user["id"], req.chat_id, "filename, created_at")
+
+            if pdf_check:
+                answer = """⏳ **Your PDF was uploaded but is still being processed...**
 
 This may take 15-30 seconds for large documents.
 Please wait a moment and try again."""
-        else:
-            answer = "No PDF found for this chat. Please upload a PDF first"
-        
-        insert_message(supabase, user["id"], req.chat_id, "assistant", answer)
-        return {"answer": answer, "used_pdf_context": False}
+            else:
+                answer = "No PDF found for this chat. Please upload a PDF first"
+
+        await crud_async.insert_message(db, user["id"], req.chat_id, "assistant", answer)
+        return {"response": {"answer": answer, "used_pdf_context": False}}
+
+    if len(retrieved["filtered_docs"]) == 0:
+        answer = "Sorry, the requested information is not available in the provided PDF."
+        await crud_async.insert_message(
+            db,
+            user["id"],
+            req.chat_id,
+            "assistant",
+            answer
+        )
 
-    results = faiss_index.similarity_search_with_score(
-        req.question,
-        k=TOP_K * 3,  
+        return {"response": {
+            "answer": answer,
+            "used_pdf_context": False,
+            "chat_id": req.chat_id
+        }}
+
+    return {
+        "memory": memory,
+        "context": retrieved["context"],
+        "filtered_docs": retrieved["filtered_docs"],
+        "best_docs": retrieved["best_docs"],
+        "cached_answer": None,
+        "index_version": index_version,
+        "question_vector": question_vector
+    }
+
+def retrieve_for_question(req, user, question_vector=None, history=(), backend=None):
+    """Search the chat's index and build the LLM context; None if there is no index"""
+    user_folder = os.path.join(FAISS_PATH, f"user_{user['id']}")
+
+    if os.path.exists(user_folder):
+        print("Available chat folders:", os.listdir(user_folder))
+    else:
+        print("User FAISS folder does not exist yet")
+
+    faiss_index = load_faiss_index(user["id"], req.chat_id)
+
+    if not faiss_index:
+        return None
+
+    if question_vector is None:
+        question_vector = query_vectors.embed(req.question)
+
+    results = faiss_index.similarity_search_with_score_by_vector(
+        question_vector,
+        k=TOP_K * 3,
     )
     filtered_docs = []
     for doc, score in results:
@@ -569,31 +809,17 @@ Please wait a moment and try again."""
         print("⚠️ Taking top results regardless of score")
         filtered_docs = [doc for doc, score in results[:TOP_K]]
 
-    from difflib import SequenceMatcher
-
-    def is_similar(text1, text2, threshold=0.7):
-        """Check if two texts are similar (not just exact match)"""
-        if len(text1) < 50 or len(text2) < 50:
-            return text1 == text2
-    
-        similarity = SequenceMatcher(None, text1[:200], text2[:200]).ratio()
-        return similarity > threshold
-
-    unique_docs = []
-    for doc in filtered_docs:
-        is_duplicate = False
-        current_text = doc.page_content[:200] 
-    
-        for existing in unique_docs:
-            existing_text = existing.page_content[:200]
-            if is_similar(current_text, existing_text, threshold=0.7):
-                is_duplicate = True
-                break
-    
-        if not is_duplicate:
-            unique_docs.append(doc)
+    # exact terms (clause numbers, product codes) the embedding may miss
+    keyword_docs = keyword_search(faiss_index, req.question, k=TOP_K * 3)
+    if keyword_docs:
+        filtered_docs = reciprocal_rank_fusion([filtered_docs, keyword_docs])
+        print(f"🔀 Fused dense results with {len(keyword_docs)} keyword matches")
 
-    filtered_docs = unique_docs
+    filtered_docs, _ = drop_near_duplicates(
+        filtered_docs,
+        candidate_vectors(faiss_index, filtered_docs),
+        RETRIEVAL_DUPLICATE_THRESHOLD
+    )
     print(f"📊 Similarity deduplication: {len(filtered_docs)} unique chunks")
 
     print(f"📚 Retrieved {len(filtered_docs)} unique chunks")
@@ -604,236 +830,247 @@ Please wait a moment and try again."""
     MIN_RELEVANT_CHUNKS = 1
 
     if len(filtered_docs) == 0:
-        answer = "Sorry, the requested information is not available in the provided PDF."
-        insert_message(
-            supabase, 
-            user["id"], 
-            req.chat_id, 
-            "assistant", 
-            answer
-        )
+        return {"filtered_docs": [], "best_docs": [], "context": ""}
 
-        return {
-            "answer": answer,
-            "used_pdf_context": False,
-            "chat_id": req.chat_id
-        }
 
+    best_count = TOP_K
+    if reranker.enabled:
+        filtered_docs = reranker.rerank(req.question, filtered_docs)
+        best_count = RERANK_TOP_N
+    best_docs = mmr_select(filtered_docs, candidate_vectors(faiss_index, filtered_docs), best_count, MMR_LAMBDA)
 
-    best_docs = filtered_docs[:TOP_K]
-    if hasattr(results[0], 'score'):
-        best_docs = [doc for doc, score in sorted(results, key=lambda x: x[1])[:TOP_K]]
-    context_parts = []
-    for doc in best_docs:
-        if len(doc.page_content.strip()) > 40:
-            context_parts.append(doc.page_content.strip())
-
-    context_text = "\n\n".join(context_parts)
-    if len(context_text) < 500 and len(filtered_docs) > TOP_K:
+    # a local model's window is much smaller than Groq's
+    backend = backend or get_backend()
+    budget = context_token_budget(req.question, history, backend.context_window, backend.max_tokens)
+    best_docs, context_text, context_tokens = pack_context(best_docs, budget)
+    if context_tokens < CONTEXT_MIN_TOKENS and len(filtered_docs) > len(best_docs):
         print("⚠️ Context too short, getting more chunks...")
-        best_docs = filtered_docs[:TOP_K + 2]  # 2 extra chunks
-        context_parts = []
-        for doc in best_docs:
-            if len(doc.page_content.strip()) > 40:
-                context_parts.append(doc.page_content.strip())
-        context_text = "\n\n".join(context_parts)
-
-    import re
-    context_text = re.sub(r'\s+', ' ', context_text)
-    context_text = context_text[:MAX_CONTEXT_CHARS]
+        extra = [doc for doc in filtered_docs if doc not in best_docs][:2]
+        best_docs, context_text, context_tokens = pack_context(best_docs + extra, budget)
 
-    if len(context_text) < 200:
+    if context_tokens < CONTEXT_MIN_TOKENS // 2:
         print("⚠️ Very little context found, expanding search...")
-        more_results = faiss_index.similarity_search_with_score(
-            req.question,
-            k=TOP_K * 5, 
+        more_results = faiss_index.similarity_search_with_score_by_vector(
+            question_vector,
+            k=TOP_K * 5,
+        )
+        extra = [doc for doc, score in more_results if doc not in best_docs]
+        best_docs, context_text, context_tokens = pack_context(
+            best_docs + extra,
+            min(budget, max(context_tokens, CONTEXT_MIN_TOKENS * 2))
         )
-        for doc, score in more_results:
-            if len(context_text) < 1000 and doc.page_content not in context_text:
-                context_text += "\n\n" + doc.page_content.strip()
 
+    print(f"📦 Packed {len(best_docs)} chunks, {context_tokens}/{budget} context tokens")
     print("---- Context sent to LLM ----")
     print(context_text[:500])
 
-    cache_key = f"{user['id']}:{req.chat_id}:{req.question.strip().lower()}"
-
-    if cache_key in CACHE:
-        answer = CACHE[cache_key]
-
-    else:
-        try:
-            answer_raw = get_llm_response(
-                question=req.question,
-                context=context_text,
-                memory=memory
-            )
+    return {
+        "filtered_docs": filtered_docs,
+        "best_docs": best_docs,
+        "context": context_text
+    }
 
-            answer = format_text(answer_raw)
 
-            CACHE[cache_key] = answer
+def llm_error_answer(e):
+    """User-facing message for a failed LLM call"""
+    print("LLM ERROR:", e)
+    error_str = str(e).lower()
 
-            if len(CACHE) > CACHE_LIMIT:
-                CACHE.pop(next(iter(CACHE)))
 
-        except Exception as e:
-            print("LLM ERROR:", e)
-            error_str = str(e).lower()
-            
+    if "rate limit" in error_str or "429" in error_str or "rate_limit_exceeded" in error_str:
 
-            if "rate limit" in error_str or "429" in error_str or "rate_limit_exceeded" in error_str:
-               
-                import re
-                wait_time = re.search(r"in (\d+)m(\d+\.?\d*)s", str(e))
-                if wait_time:
-                    minutes = wait_time.group(1)
-                    seconds = wait_time.group(2)
-                    answer = f"⏳ **Rate limit reached.** Please try again in **{minutes} minutes {seconds} seconds**."
-                else:
-                    answer = "⏳ **Rate limit reached.** Please wait a few minutes and try again."
-            
-    
-            else:
-                answer = "⚠️ **Service temporarily unavailable.** Please try again in a few moments."
+        import re
+        wait_time = re.search(r"in (\d+)m(\d+\.?\d*)s", str(e))
+        if wait_time:
+            minutes = wait_time.group(1)
+            seconds = wait_time.group(2)
+            return f"⏳ **Rate limit reached.** Please try again in **{minutes} minutes {seconds} seconds**."
+        return "⏳ **Rate limit reached.** Please wait a few minutes and try again."
 
-    insert_message(supabase, user["id"], req.chat_id, "assistant", answer)
+    return "⚠️ **Service temporarily unavailable.** Please try again in a few moments."
 
-    chats = get_user_chats(supabase)
+async def save_answer(db, user, req, answer):
+    _, chats = await asyncio.gather(
+        crud_async.insert_message(db, user["id"], req.chat_id, "assistant", answer),
+        crud_async.get_user_chats(db)
+    )
     chat = next((c for c in chats if c["id"] == req.chat_id), None)
 
     if chat and not chat.get("title"):
-        set_chat_title(supabase, req.chat_id, req.question[:40])
-
-    
-    used_pdf = bool(filtered_docs)
-
-    import re
-
-    is_history = "[HISTORY_ANSWER]" in answer
-    answer_clean = re.sub(r"\[.*?\]", "", answer).strip()
-    answer_clean = format_text(answer_clean)
+        await crud_async.set_chat_title(db, req.chat_id, req.question[:40])
+
+def remember_answer(user, req, prepared, answer):
+    # answers from the conversation history don't depend on the index, and
+    # would be replayed for later questions about the history
+    if "[HISTORY_ANSWER]" in answer:
+        return
+    if prepared["index_version"] and prepared["question_vector"] is not None:
+        answer_cache.store(
+            user["id"],
+            req.chat_id,
+            prepared["index_version"],
+            req.question,
+            prepared["question_vector"],
+            answer,
+            prepared["filtered_docs"],
+            prepared["best_docs"],
+            req.backend or LLM_BACKEND
+        )
 
+def fix_numbering_generic(answer_text):
+    """
+    Fix numbering in ANY answer without hardcoding topics
+    """
     import re
+    lines = answer_text.split('\n')
+    fixed_lines = []
+
+    i = 0
+    while i < len(lines):
+        line = lines[i].rstrip()
+
+        number_match = re.match(r'^(\d+)\.\s+(.*)', line)
+
+        if number_match:
+            current_num = int(number_match.group(1))
+            content = number_match.group(2)
+
+            fixed_lines.append(line)
+
+            next_num = None
+            next_num_line = None
+            j = i + 1
+            while j < len(lines):
+                next_match = re.match(r'^(\d+)\.\s+', lines[j])
+                if next_match:
+                    next_num = int(next_match.group(1))
+                    next_num_line = j
+                    break
+                j += 1
+
+            if next_num and next_num > current_num + 1:
+
+                for missing in range(current_num + 1, next_num):
+                    found_unumbered = False
+                    for k in range(i + 1, next_num_line):
+                        if lines[k].strip() and not re.match(r'^\d+\.', lines[k]):
+                            unnumbered_content = lines[k].strip()
+                            fixed_lines.append(f"{missing}. {unnumbered_content}")
+                            found_unumbered = True
+                            lines[k] = ""
+                            break
+
+                    if not found_unumbered:
+                        fixed_lines.append(f"{missing}. **Item {missing}**")
+
+                i = next_num_line
+                continue
 
-    def fix_numbering_generic(answer_text):
-        """
-        Fix numbering in ANY answer without hardcoding topics
-        """
-        lines = answer_text.split('\n')
-        fixed_lines = []
-    
-        i = 0
-        while i < len(lines):
-            line = lines[i].rstrip()
-        
-            number_match = re.match(r'^(\d+)\.\s+(.*)', line)
-        
-            if number_match:
-                current_num = int(number_match.group(1))
-                content = number_match.group(2)
-            
-                fixed_lines.append(line)
-            
-                next_num = None
-                next_num_line = None
-                j = i + 1
-                while j < len(lines):
-                    next_match = re.match(r'^(\d+)\.\s+', lines[j])
-                    if next_match:
-                        next_num = int(next_match.group(1))
-                        next_num_line = j
-                        break
-                    j += 1
-            
-                if next_num and next_num > current_num + 1:
-                
-                    for missing in range(current_num + 1, next_num):
-                        found_unumbered = False
-                        for k in range(i + 1, next_num_line):
-                            if lines[k].strip() and not re.match(r'^\d+\.', lines[k]):
-                                unnumbered_content = lines[k].strip()
-                                fixed_lines.append(f"{missing}. {unnumbered_content}")
-                                found_unumbered = True
-                                lines[k] = ""  
-                                break
-                    
-                        if not found_unumbered:
-                            fixed_lines.append(f"{missing}. **Item {missing}**")
-                
-                    i = next_num_line
-                    continue
-            
-            elif line.strip() and not re.match(r'^\d+\.', line):
-                last_number = None
-                for l in reversed(fixed_lines):
-                    last_match = re.match(r'^(\d+)\.', l)
-                    if last_match:
-                        last_number = int(last_match.group(1))
-                        break
-            
-                if last_number:
-                    next_expected = last_number + 1
-                    fixed_lines.append(f"{next_expected}. {line}")
-                else:
-                    fixed_lines.append(line)
+        elif line.strip() and not re.match(r'^\d+\.', line):
+            last_number = None
+            for l in reversed(fixed_lines):
+                last_match = re.match(r'^(\d+)\.', l)
+                if last_match:
+                    last_number = int(last_match.group(1))
+                    break
+
+            if last_number:
+                next_expected = last_number + 1
+                fixed_lines.append(f"{next_expected}. {line}")
             else:
-                if line.strip():
-                    fixed_lines.append(line)
-        
-            i += 1
-    
-        result_lines = [l for l in fixed_lines if l.strip()]
-        return '\n'.join(result_lines)
+                fixed_lines.append(line)
+        else:
+            if line.strip():
+                fixed_lines.append(line)
 
-    answer_clean = fix_numbering_generic(answer_clean)
+        i += 1
+
+    result_lines = [l for l in fixed_lines if l.strip()]
+    return '\n'.join(result_lines)
 
-    is_sorry = (
+def is_sorry_answer(answer_clean):
+    return (
         "not available in the provided pdf" in answer_clean.lower()
         or "not available in the provided context" in answer_clean.lower()
         or "i'm sorry" in answer_clean.lower()
-        or "sorry" in answer_clean.lower()  
+        or "sorry" in answer_clean.lower()
     )
 
+def build_sources_display(best_docs):
+    pdf_names = {
+        doc.metadata.get("source", "Unknown")
+        for doc in best_docs
+    }
+
+    source_texts = []
+
+    for pdf in sorted(pdf_names):
+        pdf_pages = sorted({
+            str(doc.metadata.get("page", "?"))
+            for doc in best_docs
+            if doc.metadata.get("source") == pdf
+        })
+        if len(pdf_pages) > 6:
+            pdf_pages = pdf_pages[:6] + ["..."]
+
+        source_texts.append(f"{pdf} — Pages {', '.join(pdf_pages)}")
+
+    if len(source_texts) > 4:
+        source_texts = source_texts[:4] + ["...and more PDFs"]
+
+    return "Sources:<br>" + "<br>".join(source_texts)
+
+def finish_answer(answer, filtered_docs, best_docs):
+    """Final answer text and whether it used the PDF, given the LLM answer"""
+    is_history = "[HISTORY_ANSWER]" in answer
+
+    answer_clean = re.sub(r"\[.*?\]", "", answer).strip()
+    answer_clean = format_text(answer_clean)
+    answer_clean = fix_numbering_generic(answer_clean)
+
     if is_history:
-        answer_final = answer
-        used_pdf = False
+        return answer, False
 
-    elif is_sorry:
-        answer_final = "Sorry, the requested information is not available in the provided PDF."
-        used_pdf = False
+    if is_sorry_answer(answer_clean):
+        return "Sorry, the requested information is not available in the provided PDF.", False
 
-    else:
-        if filtered_docs:
+    if filtered_docs:
+        return f"{answer_clean}<br><br>{build_sources_display(best_docs)}", True
 
-            pdf_names = {
-                doc.metadata.get("source", "Unknown")
-                for doc in best_docs
-            }
+    return answer_clean, False
 
-            source_texts = []
+@app.post("/ask")
+async def ask_question(req: QuestionRequest, user=Depends(get_current_user)):
+    db = get_async_user_client(user["access_token"])
 
-            for pdf in sorted(pdf_names):
-                pdf_pages = sorted({
-                    str(doc.metadata.get("page", "?"))
-                    for doc in best_docs
-                    if doc.metadata.get("source") == pdf
-                })
-                if len(pdf_pages) > 6:
-                    pdf_pages = pdf_pages[:6] + ["..."]  
+    prepared = await prepare_question(req, user, db)
+    if "response" in prepared:
+        return prepared["response"]
 
-                source_texts.append(f"{pdf} — Pages {', '.join(pdf_pages)}")
+    filtered_docs = prepared["filtered_docs"]
+    best_docs = prepared["best_docs"]
 
-            if len(source_texts) > 4:
-                source_texts = source_texts[:4] + ["...and more PDFs"]
-    
-            sources_display = "Sources:<br>" + "<br>".join(source_texts)
+    if prepared["cached_answer"] is not None:
+        answer = prepared["cached_answer"]
 
-            answer_final = f"{answer_clean}<br><br>{sources_display}"
-            used_pdf = True
+    else:
+        try:
+            answer_raw = await get_llm_response(
+                question=req.question,
+                context=prepared["context"],
+                memory=prepared["memory"],
+                backend=req.backend
+            )
 
-        else:
-            answer_final = answer_clean
-            used_pdf = False
+            answer = format_text(answer_raw)
+            remember_answer(user, req, prepared, answer)
+
+        except Exception as e:
+            answer = llm_error_answer(e)
+
+    await save_answer(db, user, req, answer)
 
+    answer_final, used_pdf = finish_answer(answer, filtered_docs, best_docs)
 
     return {
         "answer": answer_final,
@@ -841,6 +1078,80 @@ Please wait a moment and try again."""
         "chat_id": req.chat_id
     }
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_question_stream(req: QuestionRequest, user=Depends(get_current_user)):
+    """Same answer as /ask, sent as Server-Sent Events while the LLM generates it.
+
+    Events: "delta" with {"html"} for every finished answer line, then
+    "done" with the final answer (sources included), used_pdf_context and
+    chat_id. The client should replace the streamed text with the final answer.
+    """
+    db = get_async_user_client(user["access_token"])
+
+    prepared = await prepare_question(req, user, db)
+
+    async def events():
+        if "response" in prepared:
+            response = dict(prepared["response"])
+            response.setdefault("chat_id", req.chat_id)
+            yield sse_event("delta", {"html": response["answer"]})
+            yield sse_event("done", response)
+            return
+
+        filtered_docs = prepared["filtered_docs"]
+        best_docs = prepared["best_docs"]
+
+        if prepared["cached_answer"] is not None:
+            answer = prepared["cached_answer"]
+            yield sse_event("delta", {"html": re.sub(r"\[.*?\]", "", answer).strip()})
+
+        else:
+            formatter = StreamingFormatter()
+            try:
+                async for token in stream_llm_response(
+                    question=req.question,
+                    context=prepared["context"],
+                    memory=prepared["memory"],
+                    backend=req.backend
+                ):
+                    html = formatter.feed(token)
+                    if html:
+                        yield sse_event("delta", {"html": html})
+
+                html = formatter.finish()
+                if html:
+                    yield sse_event("delta", {"html": html})
+
+                # same text /ask would have produced and cached
+                marker = "[HISTORY_ANSWER] " if formatter.saw_history else ""
+                answer = format_text(marker + formatter.html)
+                remember_answer(user, req, prepared, answer)
+
+            except Exception as e:
+                answer = llm_error_answer(e)
+                yield sse_event("delta", {"html": answer})
+
+        try:
+            await save_answer(db, user, req, answer)
+        except Exception as e:
+            print(f"❌ Could not save streamed answer: {e}")
+
+        answer_final, used_pdf = finish_answer(answer, filtered_docs, best_docs)
+        yield sse_event("done", {
+            "answer": answer_final,
+            "used_pdf_context": used_pdf,
+            "chat_id": req.chat_id
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.delete("/chats/{chat_id}")
 def delete_single_chat(chat_id: str, user=Depends(get_current_user)):
     """
@@ -853,10 +1164,13 @@ def delete_single_chat(chat_id: str, user=Depends(get_current_user)):
         
         if not result.data:
             raise HTTPException(status_code=404, detail="Chat not found")
+
+        ingest_scheduler.cancel(user["id"], chat_id)
+        message_journal.discard(user["id"], chat_id)
+        chat_memory.drop(user["id"], chat_id)
+        answer_cache.drop(user["id"], chat_id)
         
-        faiss_chat_path = os.path.join(FAISS_PATH, f"user_{user['id']}", chat_id)
-        if os.path.exists(faiss_chat_path):
-            shutil.rmtree(faiss_chat_path)
+        if delete_faiss_index(user["id"], chat_id):
             print(f"✅ Deleted FAISS index for chat {chat_id}")
         
         supabase.table("messages").delete().eq("chat_id", chat_id).execute()
@@ -874,10 +1188,13 @@ def delete_chat_history(user=Depends(get_current_user)):
     supabase = get_supabase_user_client(user["access_token"])
     
     chats = supabase.table("chats").select("id").eq("user_id", user["id"]).execute()
+
+    ingest_scheduler.cancel(user["id"])
+    message_journal.discard(user["id"])
+    chat_memory.drop(user["id"])
+    answer_cache.drop(user["id"])
     
-    user_faiss_path = os.path.join(FAISS_PATH, f"user_{user['id']}")
-    if os.path.exists(user_faiss_path):
-        shutil.rmtree(user_faiss_path)
+    if delete_faiss_index(user["id"]):
         print(f"✅ Deleted all FAISS indexes for user {user['id']}")
     
     supabase.table("messages").delete().eq("user_id", user["id"]).execute()
@@ -888,6 +1205,40 @@ def delete_chat_history(user=Depends(get_current_user)):
     
     return {"message": "All chats deleted"}
 
+@app.on_event("startup")
+def start_message_journal():
+    # sends whatever a previous run left in the journal
+    message_journal.start()
+
+@app.on_event("startup")
+def load_tokenizer():
+    # a missing tokenizer is reported at boot, not on the first question
+    token_counter.exact
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await close_async_http()
+    await close_backends()
+    await run_in_threadpool(message_journal.close)
+
 @app.get("/health")
 def health():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+def metrics():
+    return {
+        "faiss_cache": faiss_cache.stats(),
+        "index_rebuilder": index_rebuilder.stats(),
+        "embedding_engine": embedding_engine.stats(),
+        "embedding_cache": embedding_engine.cache.stats() if embedding_engine.cache else None,
+        "query_vectors": query_vectors.stats(),
+        "ingest_scheduler": ingest_scheduler.stats(),
+        "auth": token_verifier.stats(),
+        "message_journal": message_journal.stats(),
+        "chat_memory": chat_memory.stats(),
+        "answer_cache": answer_cache.stats(),
+        "reranker": reranker.stats(),
+        "tokenizer": token_counter.stats(),
+        "llm_backends": {name: backend.stats() for name, backend in llm_backends.items()}
+    }
\ No newline at end of file